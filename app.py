@@ -4,47 +4,63 @@ Aplicación Flask para Gestión de Backups MySQL/MongoDB
 Interfaz web para restauración de backups
 """
 
+import base64
+import hashlib
+import json
 import os
-import subprocess
 import re
-import shutil
-from datetime import datetime, timedelta
-from flask import Flask, render_template, request, jsonify, flash, redirect, url_for
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from fnmatch import fnmatch
+from flask import Flask, Response, g, render_template, request, jsonify, flash, redirect, url_for
 from flask_bootstrap import Bootstrap
 from pathlib import Path
 
+from config import (
+    CATALOG_PATH, CATALOG_SETTLE_SECONDS, DEDUP_STORE_DIR, DIR_DESTINO, DIR_DESTINO_INC, EXCLUDE_DB,
+    MYSQL_HOST, MYSQL_META_TTL, MYSQL_PASS, MYSQL_POOL_SIZE, MYSQL_USER, env, mysql_client_env
+)
+from backup_integrity import read_sidecar, restore_refusal, sidecar_path, verification_status
+from binlog_applier import apply_parallel, describe_parallel, describe_partition, partition_transactions, scan_transactions
+from binlog_reader import (
+    BinlogChainError, BinlogFormatError, BinlogIndex, format_timestamp, is_compressed_binlog,
+    iter_binlog_stream, iter_extracted_events, parse_datetime, plan_database_extract, plan_replay,
+    plan_window_extract, read_dump_coordinates
+)
+from dedup_store import DedupStore, DedupStoreError, read_manifest as read_dedup_manifest, restore_backup
+from chunked_backup import ChunkedBackupError, is_chunked_backup, load_chunked, read_manifest
+from catalog import (
+    BackupCatalog, SORT_COLUMNS, SOURCE_BINLOG, SOURCE_HISTORICAL, SOURCE_INCREMENTAL, SOURCE_MONGO
+)
+from fast_load import RESTORE_FAST_LOAD, fast_load_stream
+from jobs import JobError, JobManager
+from metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE, collect as collect_metrics, record_request, render as render_metrics,
+    run_command
+)
+from mongo_manifest import archive_index_path, backup_summary as mongo_backup_summary, is_archive_backup
+from mysql_meta import ServerMetadata
+from pitr_planner import base_candidate, describe_candidate, plan_restore
+from restore_pipeline import RestoreError, describe_throughput, feed_process, pipe_processes, restore_file
+from retention import (
+    RetentionError, ThrottledRemover, build_policy, describe_removal, plan_age, plan_retention, summarize_plan
+)
+from table_index import (
+    TableIndexError, index_path as table_index_path, index_tables, read_index as read_table_index,
+    select_sections, table_chunks
+)
+
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-change-in-production'
 bootstrap = Bootstrap(app)
 
-# Cargar configuración desde .env
-def load_env():
-    env_path = Path(__file__).parent / '.env'
-    env_vars = {}
-    if env_path.exists():
-        with open(env_path, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#') and '=' in line:
-                    key, value = line.split('=', 1)
-                    # Remover comillas si existen
-                    value = value.strip('"\'')
-                    env_vars[key] = value
-    return env_vars
-
-env = load_env()
-
 # Configuración de directorios
-DIR_DESTINO = env.get('DIR_DESTINO', '/mnt/backup/mysql')
-DIR_DESTINO_INC = env.get('DIR_DESTINO_INC', '/mnt/backup/mysql/incremental')
 BINLOG_BACKUP_DIR = env.get('BINLOG_BACKUP_DIR', '').strip()
 HORA_INICIO = env.get('HORA_INICIO', '00:00:00').strip()
 BINLOG_FILE_PATTERNS = ('mysql-bin.*', 'mariadb-bin.*', 'binlog.*')
-EXCLUDE_DB = {
-    db.strip().lower()
-    for db in env.get('EXCLUDE_DB', 'information_schema|performance_schema|mysql|sys').split('|')
-    if db.strip()
-}
 
 # Configuración MongoDB
 MONGO_HOST = env.get('HOST', '127.0.0.1').strip()
@@ -54,6 +70,106 @@ MONGO_PASS = env.get('CONTRASENA', '').strip()
 MONGO_AUTH_DB = env.get('AUTH_DB', 'admin').strip()
 MONGO_BACKUP_DEST = env.get('DESTINO', '/mnt/backup/mongo').strip()
 MONGO_SYSTEM_DATABASES = {'admin', 'config', 'local'}
+# Restauración parcial MongoDB: bases restauradas a la vez y paralelismo de
+# cada mongorestore (0 = según la cantidad de núcleos)
+MONGO_RESTORE_CONCURRENCY = int(env.get('MONGO_RESTORE_CONCURRENCY', '0'))
+MONGO_PARALLEL_COLLECTIONS = int(env.get('MONGO_PARALLEL_COLLECTIONS', '0'))
+MONGO_INSERTION_WORKERS = int(env.get('MONGO_INSERTION_WORKERS', '0'))
+MONGO_RESTORED_DOCS_RE = re.compile(r'(\d+) document\(s\) restored successfully')
+
+HISTORICAL_NAME_RE = re.compile(r'(.+)-back_(\d{4}-\d{2}-\d{2}_\d{2}-\d{2})\.(sql(?:\.gz|\.zst)?)$')
+HISTORICAL_CHUNKED_RE = re.compile(r'(.+)-back_(\d{4}-\d{2}-\d{2}_\d{2}-\d{2})\.chunked$')
+HISTORICAL_DEDUP_RE = re.compile(r'(.+)-back_(\d{4}-\d{2}-\d{2}_\d{2}-\d{2})\.dedup$')
+INCREMENTAL_NAME_RE = re.compile(r'(.+)-back\.sql$')
+
+# Trabajos en segundo plano (restauraciones)
+JOB_WORKERS = int(env.get('JOB_WORKERS', '2'))
+JOB_MAX_PER_HOST = int(env.get('JOB_MAX_PER_HOST', '1'))
+JOB_LOCK_DIR = env.get('JOB_LOCK_DIR', '').strip() or str(Path(tempfile.gettempdir()) / 'mysql_backup_jobs')
+# Hilos para descomprimir en paralelo dumps escritos en bloques (0 = núcleos disponibles)
+RESTORE_DECOMPRESS_THREADS = int(env.get('RESTORE_DECOMPRESS_THREADS', '0')) or os.cpu_count() or 1
+# Clientes mysql en paralelo al cargar backups en formato chunked
+RESTORE_LOAD_THREADS = int(env.get('RESTORE_LOAD_THREADS', '4'))
+# Conexiones para aplicar binlogs PITR en paralelo por tablas (1 = mysqlbinlog | mysql serial)
+PITR_APPLY_WORKERS = int(env.get('PITR_APPLY_WORKERS', '1'))
+# Filas por página de /api/backups (y de /historical) y máximo que se puede pedir
+BACKUPS_PAGE_SIZE = int(env.get('BACKUPS_PAGE_SIZE', '50'))
+BACKUPS_PAGE_MAX = 500
+
+_catalog = None
+_job_manager = None
+_binlog_index = None
+_binlog_indexer = None
+_binlog_indexing = set()
+_binlog_indexing_lock = threading.Lock()
+
+server_meta = ServerMetadata(
+    MYSQL_HOST, MYSQL_USER, MYSQL_PASS, ttl=MYSQL_META_TTL, pool_size=MYSQL_POOL_SIZE
+)
+
+
+def get_catalog():
+    """Instancia perezosa del catálogo (una por proceso/worker)."""
+    global _catalog
+    if _catalog is None:
+        _catalog = BackupCatalog(CATALOG_PATH, settle_seconds=CATALOG_SETTLE_SECONDS)
+    return _catalog
+
+
+def get_dedup_store():
+    """Almacén de chunks de los backups .dedup."""
+    return DedupStore(DEDUP_STORE_DIR)
+
+
+def get_binlog_index():
+    """Índice timestamp -> posición de los binlogs (en el mismo SQLite del catálogo)."""
+    global _binlog_index
+    if _binlog_index is None:
+        _binlog_index = BinlogIndex(CATALOG_PATH)
+    return _binlog_index
+
+
+def schedule_binlog_index(path):
+    """Indexa un binlog en segundo plano (de a uno por worker); las páginas no esperan el escaneo."""
+    global _binlog_indexer
+    path = str(path)
+    with _binlog_indexing_lock:
+        if path in _binlog_indexing:
+            return
+        _binlog_indexing.add(path)
+        if _binlog_indexer is None:
+            _binlog_indexer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='binlog-index')
+
+    def run():
+        try:
+            get_binlog_index().summary(path)
+        finally:
+            with _binlog_indexing_lock:
+                _binlog_indexing.discard(path)
+
+    _binlog_indexer.submit(run)
+
+
+def get_job_manager():
+    """Cola de trabajos compartida (estado en SQLite, junto al catálogo)."""
+    global _job_manager
+    if _job_manager is None:
+        _job_manager = JobManager(CATALOG_PATH, JOB_LOCK_DIR,
+                                  max_per_host=JOB_MAX_PER_HOST, max_workers=JOB_WORKERS)
+    return _job_manager
+
+
+def mysql_client_cmd():
+    """Cliente mysql con credenciales de .env (la contraseña va por MYSQL_PWD)."""
+    return ['mysql', f'-u{MYSQL_USER}', f'-h{MYSQL_HOST}']
+
+
+def mysql_job_host():
+    return f'mysql:{MYSQL_HOST}'
+
+
+def mongo_job_host():
+    return f'mongo:{MONGO_HOST}:{MONGO_PORT}'
 
 
 def get_excluded_databases():
@@ -85,22 +201,23 @@ def get_hora_inicio_time():
 # Obtener datadir de MySQL
 def get_mysql_datadir():
     try:
-        result = subprocess.run(
-            ['mysql', f'-u{env["MYSQL_USER"]}', f'-p{env["MYSQL_PASS"]}', 
-             f'-h{env["MYSQL_HOST"]}', '-N', '-e', "SHOW VARIABLES LIKE 'datadir';"],
-            capture_output=True, text=True
-        )
-        if result.returncode == 0:
-            lines = result.stdout.strip().split('\t')
-            if len(lines) >= 2:
-                return lines[1].rstrip('/')
-        else:
-            print(f"Error mysql datadir: {result.stderr.strip()}")
+        return server_meta.datadir()
     except Exception as e:
         print(f"Error obteniendo datadir: {e}")
     return None
 
 
+def get_mysql_binlog_dir():
+    """Directorio real de binlogs (log_bin_basename), con fallback a datadir."""
+    try:
+        basename = server_meta.log_bin_basename()
+        if basename:
+            return str(Path(basename).parent)
+    except Exception as e:
+        print(f"Error obteniendo log_bin_basename: {e}")
+    return get_mysql_datadir()
+
+
 def get_binlog_source_type(source_dir):
     """Etiqueta del origen de binlogs según la lógica activa."""
     if not source_dir:
@@ -108,25 +225,37 @@ def get_binlog_source_type(source_dir):
     return 'BINLOG_BACKUP_DIR' if BINLOG_BACKUP_DIR else 'datadir MySQL'
 
 
-def list_binlog_files(binlog_dir):
-    """Lista binlogs soportando distintos prefijos (MySQL/MariaDB)."""
-    if not binlog_dir or not binlog_dir.exists() or not binlog_dir.is_dir():
+def is_binlog_name(name):
+    return not name.endswith('.index') and any(fnmatch(name, p) for p in BINLOG_FILE_PATTERNS)
+
+
+def parse_binlog_entry(path, stat):
+    if not path.is_file() or not is_binlog_name(path.name):
+        return None
+    return {'kind': 'binlog'}
+
+
+def list_binlog_entries(binlog_dir):
+    """Binlogs del catálogo (ordenados por nombre) soportando prefijos MySQL/MariaDB."""
+    if not binlog_dir or not binlog_dir.is_dir():
         return []
 
-    files_by_name = {}
-    for pattern in BINLOG_FILE_PATTERNS:
-        for file in binlog_dir.glob(pattern):
-            if file.is_file() and not file.name.endswith('.index'):
-                files_by_name[file.name] = file
+    catalog = get_catalog()
+    catalog.refresh(SOURCE_BINLOG, binlog_dir, parse_binlog_entry, volatile=True)
+    return catalog.entries(SOURCE_BINLOG, binlog_dir)
 
-    return [files_by_name[name] for name in sorted(files_by_name)]
+
+def list_binlog_files(binlog_dir):
+    """Lista binlogs soportando distintos prefijos (MySQL/MariaDB)."""
+    return [Path(entry['path']) for entry in list_binlog_entries(binlog_dir)]
 
 
 def get_binlog_source_dir():
     """Resuelve el directorio de binlogs a utilizar en la app.
 
     1) Si BINLOG_BACKUP_DIR está definido/no vacío, usarlo
-    2) Si no está definido, fallback a datadir real de MySQL
+    2) Si no está definido, fallback al directorio de binlogs del servidor
+       (log_bin_basename o datadir, consultados vía caché de metadatos)
     """
     if BINLOG_BACKUP_DIR:
         backup_dir = Path(BINLOG_BACKUP_DIR)
@@ -134,7 +263,7 @@ def get_binlog_source_dir():
             return backup_dir
         return None
 
-    mysql_datadir = get_mysql_datadir()
+    mysql_datadir = get_mysql_binlog_dir()
     if mysql_datadir:
         datadir = Path(mysql_datadir)
         if datadir.exists() and datadir.is_dir() and list_binlog_files(datadir):
@@ -145,89 +274,141 @@ def get_binlog_source_dir():
 # Obtener lista de bases de datos
 def get_databases():
     try:
-        result = subprocess.run(
-            ['mysql', f'-u{env["MYSQL_USER"]}', f'-p{env["MYSQL_PASS"]}', 
-             f'-h{env["MYSQL_HOST"]}', '-N', '-e', 'SHOW DATABASES;'],
-            capture_output=True, text=True
-        )
-        if result.returncode == 0:
-            databases = result.stdout.strip().split('\n')
-            return [db for db in databases if db and not is_excluded_database(db)]
+        databases = server_meta.databases()
+        return [db for db in databases if db and not is_excluded_database(db)]
     except Exception as e:
         print(f"Error obteniendo bases de datos: {e}")
     return []
 
-# Obtener backups históricos
-def get_historical_backups():
-    backups = []
-    backup_dir = Path(DIR_DESTINO)
-    if backup_dir.exists():
-        for file in sorted(backup_dir.glob('*-back_*.sql.gz'), reverse=True):
-            # Extraer nombre de base y fecha
-            match = re.match(r'(.+)-back_(\d{4}-\d{2}-\d{2}_\d{2}-\d{2})\.sql\.gz', file.name)
-            if match:
-                db_name = match.group(1)
-                if is_excluded_database(db_name):
-                    continue
-                date_str = match.group(2)
-                try:
-                    date_obj = datetime.strptime(date_str, '%Y-%m-%d_%H-%M')
-                    size = file.stat().st_size
-                    size_mb = size / (1024 * 1024)
-                    backups.append({
-                        'filename': file.name,
-                        'db_name': db_name,
-                        'date': date_obj,
-                        'date_str': date_obj.strftime('%d/%m/%Y %H:%M'),
-                        'size': f"{size_mb:.2f} MB",
-                        'path': str(file)
-                    })
-                except ValueError:
-                    continue
-    return backups
-
-
-def get_directory_size_bytes(directory):
-    """Calcula el tamaño total de un directorio de forma recursiva."""
-    total = 0
-    for path in directory.rglob('*'):
-        if path.is_file():
-            try:
-                total += path.stat().st_size
-            except OSError:
-                continue
-    return total
-
-
-def get_mongo_backups():
-    """Obtiene backups históricos de MongoDB (mongodump --out backup_YYYY-MM-DD_HH-MM)."""
-    backups = []
-    backup_dir = Path(MONGO_BACKUP_DEST)
-    if not backup_dir.exists() or not backup_dir.is_dir():
-        return backups
-
-    for folder in sorted(backup_dir.glob('backup_*'), reverse=True):
-        if not folder.is_dir():
-            continue
+def integrity_extra(path, stat):
+    """Estado de verificación (<backup>.meta.json) y si tiene índice de tablas, sin leer el backup."""
+    status, meta = verification_status(path, stat)
+    extra = {'verified': status, 'table_index': table_index_path(path).exists()}
+    if meta is not None:
+        extra.update(sha256=meta.get('sha256'), bytes_raw=meta.get('bytes_raw', 0))
+    return extra
+
+
+def parse_historical_entry(path, stat):
+    """Extrae base y fecha de <db>-back_<fecha>.sql[.gz|.zst] (o .chunked/, .dedup) para el catálogo."""
+    match = HISTORICAL_NAME_RE.match(path.name)
+    record = {'kind': match.group(3), 'extra': integrity_extra(path, stat)} if match else {}
+    if not match and HISTORICAL_DEDUP_RE.match(path.name):
+        match = HISTORICAL_DEDUP_RE.match(path.name)
+        try:
+            manifest = read_dedup_manifest(path)
+        except DedupStoreError as e:
+            print(f"Error leyendo manifiesto {path.name}: {e}")
+            return None
+        # Tamaño = lo que este backup agregó al almacén; el dump completo va en extra
+        record = {
+            'kind': 'dedup',
+            'size': manifest.get('bytes_new', 0),
+            'extra': {'bytes_raw': manifest.get('bytes_raw', 0), 'chunks': len(manifest['chunks']),
+                      'new_chunks': manifest.get('new_chunks', 0)},
+        }
+    elif not match:
+        match = HISTORICAL_CHUNKED_RE.match(path.name)
+        if not match or not is_chunked_backup(path):
+            return None
+        manifest = read_manifest(path)
+        record = {
+            'kind': 'chunked',
+            'size': manifest.get('bytes_written', 0),
+            'extra': {'tables': len({item['table'] for item in manifest['data']}),
+                      'chunks': len(manifest['data'])},
+        }
+    try:
+        date_obj = datetime.strptime(match.group(2), '%Y-%m-%d_%H-%M')
+    except ValueError:
+        return None
+    return {**record, 'db_name': match.group(1), 'timestamp': date_obj.timestamp()}
+
+
+def historical_row(entry):
+    """Fila de un backup histórico MySQL para las plantillas y /api/backups."""
+    date_obj = datetime.fromtimestamp(entry['timestamp'])
+    size_mb = entry['size'] / (1024 * 1024)
+    return {
+        'filename': entry['name'],
+        'db_name': entry['db_name'],
+        'date': date_obj,
+        'date_str': date_obj.strftime('%d/%m/%Y %H:%M'),
+        'size': f"{size_mb:.2f} MB",
+        'path': entry['path'],
+        'format': entry['kind'],
+        'tables': entry['extra'].get('tables'),
+        'raw_size': f"{entry['extra'].get('bytes_raw', 0) / (1024 * 1024):.2f} MB",
+        'verified': entry['extra'].get('verified'),
+        'table_index': entry['extra'].get('table_index', False)
+    }
 
-        stat = folder.stat()
-        modified_dt = datetime.fromtimestamp(stat.st_mtime)
-        dbs = sorted([
-            p.name for p in folder.iterdir()
-            if p.is_dir() and p.name not in MONGO_SYSTEM_DATABASES
-        ])
-        size_mb = get_directory_size_bytes(folder) / (1024 * 1024)
-
-        backups.append({
-            'name': folder.name,
-            'path': str(folder),
-            'modified': modified_dt.strftime('%d/%m/%Y %H:%M'),
-            'size': f"{size_mb:.2f} MB",
-            'databases': dbs,
-            'db_count': len(dbs)
-        })
 
-    return backups
+# Obtener backups históricos
+def get_historical_backups(limit=None):
+    """Backups históricos del más nuevo al más viejo (limit: solo los primeros, resuelto en SQLite)."""
+    catalog = get_catalog()
+    catalog.refresh(SOURCE_HISTORICAL, DIR_DESTINO, parse_historical_entry)
+    if limit is not None:
+        entries, _ = catalog.page(SOURCE_HISTORICAL, DIR_DESTINO, limit=limit, exclude_db=EXCLUDED_DATABASES)
+        return [historical_row(entry) for entry in entries]
+    return [
+        historical_row(entry) for entry in catalog.entries(SOURCE_HISTORICAL, DIR_DESTINO, descending=True)
+        if not is_excluded_database(entry['db_name'])
+    ]
+
+
+def parse_mongo_entry(path, stat):
+    """Tamaño y bases de un backup_* (carpeta o .archive.gz) para el catálogo (desde su manifiesto)."""
+    if not path.name.startswith('backup_'):
+        return None
+    if is_archive_backup(path):
+        if not path.is_file():
+            return None
+        kind = 'mongo_archive'
+    elif path.is_dir():
+        kind = 'mongodump'
+    else:
+        return None
+    try:
+        summary = mongo_backup_summary(path)
+    except (OSError, ValueError, EOFError) as e:
+        print(f'No se pudo leer el backup MongoDB {path.name}: {e}')
+        return None
+    return {
+        'kind': kind,
+        'size': summary['size'],
+        'extra': {
+            'databases': [db for db in sorted(summary['databases']) if db not in MONGO_SYSTEM_DATABASES],
+            'raw_size': summary.get('raw_size'),
+        }
+    }
+
+
+def mongo_row(entry):
+    """Fila de un backup MongoDB para las plantillas y /api/backups."""
+    dbs = entry['extra'].get('databases', [])
+    size_mb = entry['size'] / (1024 * 1024)
+    return {
+        'name': entry['name'],
+        'path': entry['path'],
+        'modified': datetime.fromtimestamp(entry['mtime']).strftime('%d/%m/%Y %H:%M'),
+        'size': f"{size_mb:.2f} MB",
+        'databases': dbs,
+        'db_count': len(dbs),
+        'format': 'archive' if entry['kind'] == 'mongo_archive' else 'dir'
+    }
+
+
+def get_mongo_backups(limit=None):
+    """Obtiene backups históricos de MongoDB (carpetas backup_YYYY-MM-DD_HH-MM o backup_*.archive.gz)."""
+    catalog = get_catalog()
+    catalog.refresh(SOURCE_MONGO, MONGO_BACKUP_DEST, parse_mongo_entry)
+    if limit is not None:
+        entries, _ = catalog.page(SOURCE_MONGO, MONGO_BACKUP_DEST, limit=limit, sort='name')
+    else:
+        entries = catalog.entries(SOURCE_MONGO, MONGO_BACKUP_DEST, descending=True)
+    return [mongo_row(entry) for entry in entries]
 
 
 def build_mongorestore_base_cmd():
@@ -242,86 +423,162 @@ def build_mongorestore_base_cmd():
     return cmd
 
 
-def cleanup_mysql_historical_backups(days):
-    """Elimina backups .sql.gz de MySQL más antiguos que N días."""
-    deleted = []
-    backup_dir = Path(DIR_DESTINO)
-    if not backup_dir.exists() or not backup_dir.is_dir():
-        return deleted
+def mongo_restore_tuning(db_count, concurrency=None, parallel_collections=None, insertion_workers=None):
+    """Paralelismo de una restauración parcial; lo no indicado se reparte entre los núcleos."""
+    cpus = os.cpu_count() or 1
+    concurrency = max(1, min(concurrency or MONGO_RESTORE_CONCURRENCY or min(4, cpus), db_count))
+    parallel_collections = max(1, parallel_collections or MONGO_PARALLEL_COLLECTIONS
+                               or min(4, cpus // concurrency))
+    insertion_workers = max(1, insertion_workers or MONGO_INSERTION_WORKERS
+                            or cpus // (concurrency * parallel_collections))
+    return {
+        'concurrency': concurrency,
+        'parallel_collections': parallel_collections,
+        'insertion_workers': insertion_workers,
+    }
+
+
+# Backups históricos sujetos a retención: origen del catálogo, directorio, parser y etiqueta
+RETENTION_TARGETS = {
+    'mysql_historical': (SOURCE_HISTORICAL, DIR_DESTINO, parse_historical_entry, 'MySQL'),
+    'mongo_historical': (SOURCE_MONGO, MONGO_BACKUP_DEST, parse_mongo_entry, 'MongoDB'),
+}
 
-    cutoff = datetime.now() - timedelta(days=days)
-    for file in backup_dir.glob('*-back_*.sql.gz'):
-        if not file.is_file():
-            continue
 
-        file_modified = datetime.fromtimestamp(file.stat().st_mtime)
-        if file_modified < cutoff:
-            file.unlink(missing_ok=True)
-            deleted.append(file.name)
+def retention_entries(backup_type):
+    """Entradas del catálogo (refrescado) de los backups históricos de ese tipo."""
+    source, directory, parse_entry, _ = RETENTION_TARGETS[backup_type]
+    catalog = get_catalog()
+    catalog.refresh(source, directory, parse_entry)
+    return catalog.entries(source, directory)
+
+
+def retention_job_host(backup_type):
+    """Un borrado a la vez por directorio de backups (independiente de las restauraciones)."""
+    return f'retention:{RETENTION_TARGETS[backup_type][1]}'
+
+
+def backup_companions(item):
+    """Archivos que acompañan a un backup y se borran con él."""
+    if item['kind'] == 'mongo_archive':
+        return [archive_index_path(item['path'])]
+    if item['kind'] in ('chunked', 'mongodump'):
+        return []
+    return [sidecar_path(item['path']), table_index_path(item['path'])]
+
+
+def collect_dedup_garbage():
+    """Libera los chunks del almacén dedup que quedaron sin referencias."""
+    try:
+        freed = get_dedup_store().collect_garbage([DIR_DESTINO])
+    except (OSError, DedupStoreError) as e:
+        print(f"Error liberando chunks del almacén dedup: {e}")
+    else:
+        if freed is None:
+            print("Almacén dedup en uso por un backup: los chunks se liberan en la próxima limpieza")
+        else:
+            print(f"Almacén dedup: {freed[0]} chunks liberados ({freed[1] / (1024 * 1024):.1f} MB)")
+
+
+def run_retention(job, backup_type, select, description):
+    """Borra en segundo plano lo que el plan no conserva, en tandas reguladas.
+
+    select(entries) arma el plan (GFS o por antigüedad) al empezar el trabajo,
+    sobre el catálogo de ese momento. Cada backup se quita del catálogo apenas
+    se borra, así un corte a mitad del trabajo no deja entradas fantasma.
+    """
+    source, directory, _, label = RETENTION_TARGETS[backup_type]
+    catalog = get_catalog()
+    doomed = [item for item in select(retention_entries(backup_type)) if not item['keep']]
+    job.set_phase(f'Borrando {len(doomed)} backups {label} ({description})',
+                  total_bytes=sum(item['size'] for item in doomed) or None)
 
-    return deleted
+    # Avance explícito: bytes de los backups ya borrados y del que se está borrando
+    progress = {'done': 0, 'item_start': 0, 'item_size': 0}
 
+    def on_batch(remover):
+        current = min(remover.bytes - progress['item_start'], progress['item_size'])
+        job.update(bytes_read=progress['done'] + current)
 
-def cleanup_mongo_historical_backups(days):
-    """Elimina carpetas backup_* de MongoDB más antiguas que N días."""
+    remover = ThrottledRemover(on_batch=on_batch)
+    started = time.time()
     deleted = []
-    backup_dir = Path(MONGO_BACKUP_DEST)
-    if not backup_dir.exists() or not backup_dir.is_dir():
-        return deleted
+    for item in doomed:
+        progress.update(item_start=remover.bytes, item_size=item['size'])
+        for path in [item['path'], *backup_companions(item)]:
+            remover.remove(path)
+        catalog.remove(source, directory, [item['name']])
+        deleted.append(item['name'])
+        progress.update(done=progress['done'] + item['size'], item_start=remover.bytes, item_size=0)
+        job.update(bytes_read=progress['done'])
+
+    if any(name.endswith('.dedup') for name in deleted):
+        job.set_phase('Liberando chunks del almacén dedup')
+        collect_dedup_garbage()
+    summary = describe_removal(remover, time.time() - started)
+    print(f"Retención {label} ({description}): {len(deleted)} backups borrados, {summary}")
+    return {
+        'message': f'Se eliminaron {len(deleted)} backups históricos {label} ({description}): {summary}',
+        'details': deleted,
+    }
+
+
+def describe_policy(policy):
+    return f"{policy['daily']} diarios, {policy['weekly']} semanales, {policy['monthly']} mensuales"
+
+
+def parse_incremental_entry(path, stat):
+    match = INCREMENTAL_NAME_RE.match(path.name)
+    if not match:
+        return None
+    return {'db_name': match.group(1), 'kind': 'sql', 'extra': integrity_extra(path, stat)}
 
-    cutoff = datetime.now() - timedelta(days=days)
-    for folder in backup_dir.glob('backup_*'):
-        if not folder.is_dir():
-            continue
 
-        folder_modified = datetime.fromtimestamp(folder.stat().st_mtime)
-        if folder_modified < cutoff:
-            shutil.rmtree(folder)
-            deleted.append(folder.name)
+def incremental_row(entry):
+    """Fila de un backup incremental (base para PITR) para las plantillas y /api/backups."""
+    size_mb = entry['size'] / (1024 * 1024)
+    return {
+        'filename': entry['name'],
+        'db_name': entry['db_name'],
+        'path': entry['path'],
+        'size': f"{size_mb:.2f} MB",
+        'modified': datetime.fromtimestamp(entry['mtime']).strftime('%d/%m/%Y %H:%M'),
+        'verified': entry['extra'].get('verified')
+    }
 
-    return deleted
 
 # Obtener backups incrementales
 def get_incremental_backups():
-    backups = []
-    backup_dir = Path(DIR_DESTINO_INC)
-    if backup_dir.exists():
-        for file in backup_dir.glob('*-back.sql'):
-            match = re.match(r'(.+)-back\.sql', file.name)
-            if match:
-                db_name = match.group(1)
-                if is_excluded_database(db_name):
-                    continue
-                stat = file.stat()
-                size_mb = stat.st_size / (1024 * 1024)
-                backups.append({
-                    'filename': file.name,
-                    'db_name': db_name,
-                    'path': str(file),
-                    'size': f"{size_mb:.2f} MB",
-                    'modified': datetime.fromtimestamp(stat.st_mtime).strftime('%d/%m/%Y %H:%M')
-                })
-    return backups
+    catalog = get_catalog()
+    # Los .sql se reescriben en el lugar cada día: origen volátil
+    catalog.refresh(SOURCE_INCREMENTAL, DIR_DESTINO_INC, parse_incremental_entry, volatile=True)
+    return [
+        incremental_row(entry) for entry in catalog.entries(SOURCE_INCREMENTAL, DIR_DESTINO_INC)
+        if not is_excluded_database(entry['db_name'])
+    ]
 
 # Obtener binlogs
 def get_binlogs():
     binlogs = []
     binlog_dir = get_binlog_source_dir()
     if binlog_dir:
-        for file in list_binlog_files(binlog_dir):
-            stat = file.stat()
-            size_mb = stat.st_size / (1024 * 1024)
+        for entry in list_binlog_entries(binlog_dir):
+            size_mb = entry['size'] / (1024 * 1024)
             binlogs.append({
-                'filename': file.name,
-                'path': str(file),
+                'filename': entry['name'],
+                'path': entry['path'],
                 'size': f"{size_mb:.2f} MB",
-                'modified': datetime.fromtimestamp(stat.st_mtime).strftime('%d/%m/%Y %H:%M')
+                'modified': datetime.fromtimestamp(entry['mtime']).strftime('%d/%m/%Y %H:%M')
             })
     return binlogs
 
 
 def get_pitr_binlogs_today():
-    """Binlogs visibles en PITR: solo hoy desde HORA_INICIO."""
+    """Binlogs visibles en PITR: solo hoy desde HORA_INICIO.
+
+    Primer/último evento y transacciones salen del índice ya guardado; un
+    binlog todavía sin indexar se muestra con "-" hasta que termine su escaneo.
+    """
     source_dir = get_binlog_source_dir()
     if not source_dir:
         return []
@@ -330,21 +587,28 @@ def get_pitr_binlogs_today():
     hora_inicio = get_hora_inicio_time()
     binlogs = []
 
-    for file in list_binlog_files(source_dir):
-        stat = file.stat()
-        modified_dt = datetime.fromtimestamp(stat.st_mtime)
+    for entry in list_binlog_entries(source_dir):
+        modified_dt = datetime.fromtimestamp(entry['mtime'])
 
         if modified_dt.date() != today:
             continue
         if modified_dt.time() < hora_inicio:
             continue
 
-        size_mb = stat.st_size / (1024 * 1024)
+        size_mb = entry['size'] / (1024 * 1024)
+        # Sin escanear durante el request: lo no indexado (o que creció) se indexa en segundo plano
+        summary, current = get_binlog_index().cached_summary(entry['path'])
+        if not current:
+            schedule_binlog_index(entry['path'])
+        summary = summary or {}
         binlogs.append({
-            'filename': file.name,
-            'path': str(file),
+            'filename': entry['name'],
+            'path': entry['path'],
             'size': f"{size_mb:.2f} MB",
-            'modified': modified_dt.strftime('%d/%m/%Y %H:%M')
+            'modified': modified_dt.strftime('%d/%m/%Y %H:%M'),
+            'first_event': format_timestamp(summary.get('first_ts')),
+            'last_event': format_timestamp(summary.get('last_ts')),
+            'transactions': summary.get('transactions')
         })
 
     return binlogs
@@ -352,26 +616,499 @@ def get_pitr_binlogs_today():
 # Obtener formato de binlog
 def get_binlog_format():
     try:
-        result = subprocess.run(
-            ['mysql', f'-u{env["MYSQL_USER"]}', f'-p{env["MYSQL_PASS"]}', 
-             f'-h{env["MYSQL_HOST"]}', '-N', '-e', "SELECT @@binlog_format;"],
-            capture_output=True, text=True
-        )
-        if result.returncode == 0:
-            return result.stdout.strip()
-        print(f"Error mysql binlog_format: {result.stderr.strip()}")
-    except:
-        pass
+        return server_meta.binlog_format()
+    except Exception as e:
+        print(f"Error mysql binlog_format: {e}")
     return "UNKNOWN"
 
+def restore_full_backup(job, backup_path, error_prefix='Error durante la restauración', fast_load=False):
+    """Restaura un backup completo (.sql[.gz|.zst], directorio .chunked o manifiesto .dedup); devuelve el resumen.
+
+    Con fast_load el dump se envía dentro del perfil de carga rápida
+    (fast_load.py); los .chunked ya cargan con esos ajustes de sesión. Un dump
+    que su .meta.json marca como incompleto o con otro tamaño no se restaura.
+    """
+    wrap = fast_load_stream if fast_load else None
+    profile = ', perfil de carga rápida' if fast_load else ''
+    if backup_path.name.endswith('.dedup'):
+        try:
+            manifest = read_dedup_manifest(backup_path)
+            job.set_phase('Restaurando backup deduplicado', total_bytes=manifest['bytes_raw'])
+            stats = restore_backup(get_dedup_store(), backup_path, mysql_client_cmd(), job=job,
+                                   env=mysql_client_env(), threads=RESTORE_DECOMPRESS_THREADS, wrap=wrap)
+        except (RestoreError, DedupStoreError) as e:
+            raise JobError(f'{error_prefix}: {e}')
+        return describe_throughput(stats) + profile
+
+    if backup_path.is_dir():
+        try:
+            stats = load_chunked(backup_path, mysql_client_cmd(), env=mysql_client_env(),
+                                 job=job, threads=RESTORE_LOAD_THREADS)
+        except (RestoreError, ChunkedBackupError) as e:
+            raise JobError(f'{error_prefix}: {e}')
+        return f'{describe_throughput(stats)}, {RESTORE_LOAD_THREADS} cargas en paralelo'
+
+    refusal = restore_refusal(backup_path)
+    if refusal:
+        raise JobError(f'{error_prefix}: {refusal}')
+    job.set_phase('Restaurando backup completo', total_bytes=backup_path.stat().st_size)
+    try:
+        stats = restore_file(backup_path, mysql_client_cmd(), job=job, env=mysql_client_env(),
+                             threads=RESTORE_DECOMPRESS_THREADS, wrap=wrap)
+    except RestoreError as e:
+        raise JobError(f'{error_prefix}: {e}')
+    return describe_throughput(stats) + profile
+
+
+def run_historical_restore(job, backup_path, fast_load=False):
+    """Trabajo: restaura un backup histórico .sql[.gz|.zst] (directorio .chunked o manifiesto .dedup) sobre MySQL."""
+    summary = restore_full_backup(job, backup_path, fast_load=fast_load)
+    return {'message': f'Restauración completada con éxito ({summary})'}
+
+
+def run_table_restore(job, backup_path, tables, target_db=None, fast_load=False):
+    """Trabajo: restaura algunas tablas de un backup con índice de tablas (<backup>.tables.json).
+
+    Solo se leen y descomprimen la cabecera del dump y las secciones de esas
+    tablas; el resto de la base destino no se toca.
+    """
+    refusal = restore_refusal(backup_path)
+    if refusal:
+        raise JobError(f'Error durante la restauración de tablas: {refusal}')
+    try:
+        index = read_table_index(backup_path)
+        sections = select_sections(index, tables)
+    except TableIndexError as e:
+        raise JobError(f'Error durante la restauración de tablas: {e}')
+    target_db = target_db or index.get('database')
+    job.set_phase(f'Restaurando {len(tables)} tabla(s) en {target_db}',
+                  total_bytes=sum(s['raw_end'] - s['raw_offset'] for s in sections))
+
+    def counted(chunks):
+        bytes_read = 0
+        for data in chunks:
+            bytes_read += len(data)
+            job.update(bytes_read=bytes_read)
+            yield data
+
+    chunks = counted(table_chunks(backup_path, index, tables, target_db))
+    if fast_load:
+        chunks = fast_load_stream(chunks)
+    try:
+        stats = feed_process(mysql_client_cmd(), chunks, job=job, env=mysql_client_env())
+    except (RestoreError, TableIndexError) as e:
+        raise JobError(f'Error durante la restauración de tablas: {e}')
+    compressed = sum(s['end'] - s['offset'] for s in sections)
+    return {'message': f'{len(tables)} tabla(s) restaurada(s) en {target_db} ({describe_throughput(stats)}, '
+                       f'{compressed / (1024 * 1024):.1f} MB leídos de '
+                       f'{backup_path.stat().st_size / (1024 * 1024):.1f} MB del backup'
+                       f'{", perfil de carga rápida" if fast_load else ""})'}
+
+
+def pitr_base_start(inc_backup):
+    """Inicio del replay para el backup base: (coordenadas o None, epoch, aviso o None).
+
+    Las coordenadas CHANGE MASTER del dump (--master-data=2) son exactas; el
+    epoch es la hora en que arrancó el volcado (started_at del .meta.json) o,
+    si no se registró, la fecha de modificación, que es el fin del volcado:
+    partir de ahí sin coordenadas perdería lo confirmado mientras corría.
+    """
+    try:
+        coordinates = read_dump_coordinates(inc_backup)
+    except (OSError, ValueError, EOFError) as e:
+        print(f'No se pudieron leer las coordenadas de {inc_backup.name}: {e}')
+        coordinates = None
+    started_at = (read_sidecar(inc_backup) or {}).get('started_at')
+    start_time = started_at if started_at is not None else inc_backup.stat().st_mtime
+    if coordinates:
+        return coordinates, start_time, None
+    if started_at is not None:
+        return None, start_time, (f'aviso: {inc_backup.name} no registra coordenadas de binlog; '
+                                  f'se aplican los binlogs desde el inicio del volcado')
+    return None, start_time, (f'aviso: {inc_backup.name} no registra coordenadas de binlog ni hora de '
+                              f'inicio; se aplican los binlogs desde el fin del volcado y pueden faltar '
+                              f'transacciones confirmadas mientras corría')
+
+
+def plan_pitr_binlogs(binlog_paths, coordinates, start_time, stop_time):
+    """Binlogs y posiciones a aplicar según el índice; None si no se pudo leer algún binlog.
+
+    El inicio (coordenadas o, si faltan, start_time) sale de pitr_base_start.
+    """
+    try:
+        return plan_replay(
+            get_binlog_index(), binlog_paths,
+            start_coordinates=coordinates,
+            start_time=start_time,
+            stop_time=parse_datetime(stop_time) if stop_time else None
+        )
+    except (OSError, BinlogFormatError) as e:
+        print(f"Índice de binlogs no disponible, se filtra por fecha en mysqlbinlog: {e}")
+        return None
+
+
+def plan_pitr_extract(plan, db_name):
+    """Rangos de bytes de db_name según el mapa por base; None si no se pudo leer."""
+    try:
+        return plan_database_extract(get_binlog_index(), plan, db_name)
+    except (OSError, BinlogFormatError) as e:
+        print(f"Mapa por base no disponible, se aplican los binlogs completos: {e}")
+        return None
+
+
+def plan_pitr_window(plan):
+    """Ventanas completas del plan para binlogs comprimidos; None si no se pudo leer."""
+    try:
+        return plan_window_extract(get_binlog_index(), plan)
+    except (OSError, BinlogFormatError) as e:
+        print(f"Índice de binlogs comprimidos no disponible: {e}")
+        return None
+
+
+def get_pitr_base_candidates(db_name):
+    """Backups completos de db_name que pueden ser base de PITR: históricos e incremental."""
+    catalog = get_catalog()
+    catalog.refresh(SOURCE_HISTORICAL, DIR_DESTINO, parse_historical_entry)
+    candidates = []
+    for entry in catalog.entries(SOURCE_HISTORICAL, DIR_DESTINO):
+        if entry['db_name'] != db_name:
+            continue
+        raw_bytes = entry['extra'].get('bytes_raw')
+        if raw_bytes is None:
+            # Tamaño sin comprimir registrado por backup_runner.py, si lo hay
+            run = catalog.last_run(entry['path'])
+            raw_bytes = run['bytes_raw'] if run and run['bytes_raw'] else None
+        load_threads = RESTORE_LOAD_THREADS if entry['kind'] == 'chunked' else 1
+        candidates.append(base_candidate(entry['path'], entry['kind'], entry['mtime'], entry['size'],
+                                         raw_bytes, load_threads))
+    inc_backup = Path(DIR_DESTINO_INC) / f'{db_name}-back.sql'
+    if inc_backup.exists():
+        stat = inc_backup.stat()
+        candidates.append(base_candidate(inc_backup, 'sql', stat.st_mtime, stat.st_size))
+    return candidates
+
+
+def plan_pitr_restore(db_name, stop_time, extract_only=True):
+    """Cadena backup + binlogs de menor costo hasta stop_time: (elegido o None, evaluados)."""
+    binlog_dir = get_binlog_source_dir()
+    binlogs = list_binlog_files(binlog_dir) if binlog_dir else []
+    return plan_restore(
+        get_binlog_index(), get_pitr_base_candidates(db_name), binlogs, db_name,
+        target_ts=parse_datetime(stop_time) if stop_time else None,
+        extract_only=extract_only, store=get_dedup_store()
+    )
+
+
+def run_pitr_restore(job, db_name, inc_backup, binlog_paths, stop_time, extract_only=True, plan=None,
+                     apply_workers=1, fast_load=False):
+    """Trabajo: restaura un backup base (por defecto el de DIR_DESTINO_INC) y aplica binlogs.
+
+    plan (de plan_pitr_restore) evita volver a ubicar las posiciones.
+
+    Con extract_only se envían a mysqlbinlog solo los rangos de bytes que
+    tocan db_name (mapa TABLE_MAP/QUERY del índice de binlogs). Los binlogs
+    archivados comprimidos (.gz/.zst) siempre van por stdin, descomprimidos
+    en streaming. Con apply_workers > 1 las transacciones se reparten por
+    tablas entre varias conexiones (binlog_applier). fast_load aplica el perfil
+    de carga rápida al backup base (los binlogs se aplican sin cambios).
+    """
+    extract = None
+    windowed = False
+    backup_time = warning = None
+    if binlog_paths and plan is None:
+        # El plan automático ya parte de las coordenadas de binlog del backup elegido
+        coordinates, start_time, warning = pitr_base_start(inc_backup)
+        backup_time = datetime.fromtimestamp(start_time).strftime('%Y-%m-%d %H:%M:%S')
+        job.set_phase('Ubicando posiciones en binlogs')
+        try:
+            plan = plan_pitr_binlogs(binlog_paths, coordinates, start_time, stop_time)
+        except BinlogChainError as e:
+            # Antes de tocar la base: con un hueco se perderían transacciones sin aviso
+            raise JobError(f'Los binlogs elegidos no alcanzan para el PITR: {e}')
+    # En paralelo cada conexión recibe su propio binlog sintético (ya filtrado por base)
+    parallel = apply_workers > 1 and plan is not None and bool(plan['files'])
+    if not parallel and plan is not None and plan['files'] and extract_only:
+        extract = plan_pitr_extract(plan, db_name)
+    if (extract is None and not parallel and plan is not None
+            and any(is_compressed_binlog(p) for p in plan['files'])):
+        # mysqlbinlog no abre .gz/.zst: las posiciones se aplican al armar el flujo
+        extract = plan_pitr_window(plan)
+        windowed = extract is not None
+
+    # Paso 1: Restaurar backup completo
+    summary = [f'backup base {inc_backup.name}: '
+               f'{restore_full_backup(job, inc_backup, "Error restaurando backup completo", fast_load)}']
+
+    # Paso 2: Avisar si los binlogs no parten de coordenadas del dump
+    if warning:
+        print(warning)
+        summary.append(warning)
+
+    # Paso 3: Aplicar binlogs si se especificaron
+    binlog_cmd = binlog_input = None
+    if parallel:
+        summary.append(apply_pitr_parallel(job, db_name, plan, apply_workers))
+    elif extract is not None and extract['bytes']:
+        # Binlog sintético por stdin; las posiciones ya se aplicaron al extraer
+        binlog_cmd = ['mysqlbinlog', '--no-defaults', f'--database={db_name}', '-']
+        binlog_input = iter_extracted_events(extract)
+        if windowed:
+            summary.append(f'{extract["bytes"] / (1024 * 1024):.1f} MB de binlogs comprimidos '
+                           f'descomprimidos en streaming')
+        else:
+            summary.append(f'extraídos {extract["bytes"] / (1024 * 1024):.1f} MB de '
+                           f'{extract["source_bytes"] / (1024 * 1024):.1f} MB de binlogs con eventos de {db_name}')
+    elif extract is not None:
+        summary.append(f'binlogs: sin eventos de {db_name} entre el backup y el punto de corte')
+    elif plan is not None and plan['files']:
+        # Posiciones exactas de inicio/fin de transacción: mysqlbinlog no decodifica
+        # eventos anteriores al inicio y los binlogs fuera de rango no se leen
+        binlog_cmd = ['mysqlbinlog', '--no-defaults', f'--database={db_name}']
+        if plan['start_position']:
+            binlog_cmd.append(f'--start-position={plan["start_position"]}')
+        if plan['stop_position']:
+            binlog_cmd.append(f'--stop-position={plan["stop_position"]}')
+        binlog_cmd.extend(str(path) for path in plan['files'])
+        if plan['skipped']:
+            summary.append(f'{len(plan["skipped"])} binlogs omitidos por estar fuera de rango')
+    elif plan is not None:
+        summary.append(f'binlogs: ninguno con eventos entre el backup y el punto de corte '
+                       f'({len(plan["skipped"])} omitidos)')
+    elif binlog_paths:
+        binlog_cmd = ['mysqlbinlog', '--no-defaults', f'--database={db_name}', f'--start-datetime={backup_time}']
+        if stop_time:
+            binlog_cmd.append(f'--stop-datetime={stop_time}')
+        if any(is_compressed_binlog(path) for path in binlog_paths):
+            binlog_cmd.append('-')
+            binlog_input = iter_binlog_stream(binlog_paths)
+        else:
+            binlog_cmd.extend(str(path) for path in binlog_paths)
+
+    if binlog_cmd:
+        job.set_phase('Aplicando binlogs')
+        try:
+            stats = pipe_processes(binlog_cmd, mysql_client_cmd(), job=job, env=mysql_client_env(),
+                                   producer_input=binlog_input)
+        except RestoreError as e:
+            raise JobError(f'Error aplicando binlogs: {e}')
+        summary.append(f'binlogs: {describe_throughput(stats)}')
+
+    return {'message': f'Restauración PITR completada con éxito ({"; ".join(summary)})'}
+
+
+def apply_pitr_parallel(job, db_name, plan, workers):
+    """Aplica las transacciones del plan que tocan db_name repartidas por tablas; devuelve el resumen."""
+    job.set_phase('Agrupando transacciones de binlogs por tabla')
+    try:
+        links = server_meta.foreign_key_links(db_name)
+    except Exception as e:
+        # Sin claves foráneas conocidas las tablas relacionadas podrían aplicarse
+        # fuera de orden: se aplica en serie
+        print(f'No se pudieron leer las claves foráneas de {db_name}: {e}')
+        workers, links = 1, ()
+    try:
+        phases = partition_transactions(scan_transactions(plan, db_name), workers, db_name, links)
+    except (OSError, BinlogFormatError) as e:
+        raise JobError(f'Error leyendo binlogs: {e}')
+    partition = describe_partition(phases)
+    if not phases:
+        return f'binlogs: sin eventos de {db_name} entre el backup y el punto de corte'
+
+    job.set_phase(f'Aplicando binlogs en paralelo ({partition["max_streams"]} conexiones)',
+                  total_bytes=partition['bytes'])
+    try:
+        stats = apply_parallel(phases, ['mysqlbinlog', '--no-defaults', f'--database={db_name}', '-'],
+                               mysql_client_cmd(), env=mysql_client_env(), job=job)
+    except RestoreError as e:
+        raise JobError(f'Error aplicando binlogs: {e}')
+    return (f'binlogs: {partition["transactions"]} transacciones en {partition["phases"]} fases '
+            f'({partition["parallel_phases"]} en paralelo, máximo teórico x{partition["speedup_bound"]:.1f}), '
+            f'{describe_parallel(stats)}')
+
+
+def mongorestore_archive_args(backup_path):
+    return ['--gzip', f'--archive={backup_path}']
+
+
+def run_mongo_full_restore(job, backup_path):
+    """Trabajo: mongorestore --drop de un backup completo."""
+    job.set_phase('Restaurando MongoDB completo')
+    if is_archive_backup(backup_path):
+        cmd = build_mongorestore_base_cmd() + ['--drop'] + mongorestore_archive_args(backup_path)
+    else:
+        cmd = build_mongorestore_base_cmd() + ['--drop', str(backup_path)]
+    result = run_command(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise JobError(f'Error restaurando MongoDB completo: {result.stderr}')
+    return {'message': f'Restauración MongoDB completa realizada desde {backup_path.name}'}
+
+
+def run_mongo_partial_restore(job, backup_path, selected_dbs, tuning):
+    """Trabajo: restaura las bases seleccionadas de un backup MongoDB, varias a la vez.
+
+    tuning (de mongo_restore_tuning) fija cuántas bases corren en paralelo y
+    --numParallelCollections/--numInsertionWorkersPerCollection de cada una.
+    """
+    if is_archive_backup(backup_path):
+        return run_mongo_archive_partial_restore(job, backup_path, selected_dbs, tuning)
+
+    lock = threading.Lock()
+    finished = []
+
+    def restore_database(db_name):
+        db_backup_path = backup_path / db_name
+        if not db_backup_path.exists() or not db_backup_path.is_dir():
+            return db_name, None, f'No existe dump para la base {db_name}'
+
+        cmd = build_mongorestore_base_cmd() + [
+            '--drop', '--db', db_name,
+            f'--numParallelCollections={tuning["parallel_collections"]}',
+            f'--numInsertionWorkersPerCollection={tuning["insertion_workers"]}',
+            str(db_backup_path)
+        ]
+        started = time.monotonic()
+        result = run_command(cmd, capture_output=True, text=True)
+        seconds = time.monotonic() - started
+        with lock:
+            finished.append(db_name)
+            job.set_phase(f'Restaurando bases ({len(finished)}/{len(selected_dbs)}, '
+                          f'{tuning["concurrency"]} en paralelo)')
+        if result.returncode != 0:
+            return db_name, None, f'{db_name}: {result.stderr.strip()}'
+        # mongorestore informa el total de documentos al final de su salida
+        documents = MONGO_RESTORED_DOCS_RE.findall(result.stderr)
+        return db_name, {'seconds': seconds, 'documents': int(documents[-1]) if documents else None}, None
+
+    job.set_phase(f'Restaurando bases (0/{len(selected_dbs)}, {tuning["concurrency"]} en paralelo)')
+    with ThreadPoolExecutor(max_workers=tuning['concurrency'], thread_name_prefix='mongorestore') as pool:
+        results = list(pool.map(restore_database, selected_dbs))
+
+    restore_errors = [error for _, _, error in results if error]
+    restored = []
+    for db_name, stats, _ in results:
+        if stats is None:
+            continue
+        if stats['documents'] is not None:
+            rate = stats['documents'] / max(stats['seconds'], 0.001)
+            restored.append(f'{db_name} ({stats["seconds"]:.1f} s, {stats["documents"]} docs, {rate:.0f} docs/s)')
+        else:
+            restored.append(f'{db_name} ({stats["seconds"]:.1f} s)')
+
+    if restore_errors:
+        raise JobError('Se restauraron parcialmente algunas bases', details=restore_errors + restored)
+
+    return {'message': f'Restauración parcial completada: {", ".join(restored)}'}
+
+def run_mongo_archive_partial_restore(job, backup_path, selected_dbs, tuning):
+    """Trabajo: restauración parcial de un backup --archive con un solo mongorestore --nsInclude.
+
+    El archivo se descomprime y se lee una única vez para todas las bases;
+    el paralelismo es el de colecciones e inserción de ese mongorestore.
+    """
+    summary = mongo_backup_summary(backup_path)
+    missing = [db for db in selected_dbs if db not in summary['databases']]
+    selected = [db for db in selected_dbs if db in summary['databases']]
+    if not selected:
+        raise JobError('Ninguna de las bases seleccionadas está en el backup',
+                       details=[f'No existe dump para la base {db}' for db in missing])
+
+    job.set_phase(f'Restaurando {len(selected)} base(s) desde {backup_path.name}')
+    cmd = build_mongorestore_base_cmd() + ['--drop'] + mongorestore_archive_args(backup_path) + [
+        f'--nsInclude={db}.*' for db in selected
+    ] + [
+        f'--numParallelCollections={tuning["parallel_collections"]}',
+        f'--numInsertionWorkersPerCollection={tuning["insertion_workers"]}',
+    ]
+    started = time.monotonic()
+    result = run_command(cmd, capture_output=True, text=True)
+    seconds = max(time.monotonic() - started, 0.001)
+    if result.returncode != 0:
+        raise JobError(f'Error restaurando {", ".join(selected)}: {result.stderr.strip()}')
+
+    documents = MONGO_RESTORED_DOCS_RE.findall(result.stderr)
+    total = int(documents[-1]) if documents else sum(summary['databases'][db]['documents'] for db in selected)
+    restored = [f'{db} ({summary["databases"][db]["documents"]} docs)' for db in selected]
+    message = (f'Restauración parcial completada: {", ".join(restored)} en {seconds:.1f} s, '
+               f'{total / seconds:.0f} docs/s')
+    if missing:
+        raise JobError('Se restauraron parcialmente algunas bases',
+                       details=[f'No existe dump para la base {db}' for db in missing] + [message])
+    return {'message': message}
+
 # Rutas de la aplicación
+@app.before_request
+def start_request_timer():
+    g.request_started = time.monotonic()
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Latencia y código de cada request, por ruta (la regla, no la URL con parámetros)."""
+    started = getattr(g, 'request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'sin_ruta'
+        record_request(route, request.method, response.status_code, time.monotonic() - started)
+    return response
+
+
+def catalog_gauges():
+    """Métricas calculadas del catálogo al responder /metrics (iguales en todos los workers)."""
+    catalog = get_catalog()
+    now = time.time()
+    latest_ts, latest_age, latest_size, entries = [], [], [], []
+    for source_key, (source, directory, parse_entry, volatile, _, exclude) in LISTING_SOURCES.items():
+        catalog.refresh(source, directory, parse_entry, volatile=volatile)
+        count, _ = catalog.summary(source, directory)
+        entries.append(({'source': source_key}, count))
+        for latest in catalog.latest_by_db(source, directory):
+            if exclude and is_excluded_database(latest['db_name']):
+                continue
+            labels = {'source': source_key, 'db': latest['db_name'] or ''}
+            latest_ts.append((labels, latest['timestamp']))
+            latest_age.append((labels, round(now - latest['timestamp'], 1)))
+            latest_size.append((labels, latest['size']))
+
+    run_seconds, run_bytes, run_rate, run_ok = [], [], [], []
+    for run in catalog.last_runs():
+        labels = {'kind': run['kind'], 'db': run['db_name']}
+        run_ok.append((labels, 1 if run['status'] == 'success' else 0))
+        if run['seconds']:
+            run_seconds.append((labels, round(run['seconds'], 3)))
+            run_rate.append((labels, round((run['bytes_raw'] or 0) / run['seconds'], 1)))
+        if run['bytes_written'] is not None:
+            run_bytes.append((labels, run['bytes_written']))
+
+    return [
+        ('catalog_entries', 'Backups registrados en el catálogo por origen', entries),
+        ('latest_backup_timestamp_seconds', 'Fecha del backup más nuevo de cada base', latest_ts),
+        ('latest_backup_age_seconds', 'Antigüedad del backup más nuevo de cada base', latest_age),
+        ('latest_backup_size_bytes', 'Tamaño del backup más nuevo de cada base', latest_size),
+        ('backup_run_success', 'Si la última corrida de backup_runner.py de cada base terminó bien', run_ok),
+        ('backup_run_seconds', 'Duración de la última corrida de backup de cada base', run_seconds),
+        ('backup_run_written_bytes', 'Bytes escritos por la última corrida de backup de cada base', run_bytes),
+        ('backup_run_throughput_bytes_per_second', 'Bytes sin comprimir por segundo de la última corrida',
+         run_rate),
+    ]
+
+
+@app.route('/metrics')
+def metrics():
+    """Métricas Prometheus: requests, comandos, catálogo y trabajos de todos los workers + estado de los backups."""
+    try:
+        gauges = catalog_gauges()
+    except Exception as e:
+        print(f"Error calculando métricas del catálogo: {e}")
+        gauges = []
+    return Response(render_metrics(collect_metrics(), gauges), content_type=METRICS_CONTENT_TYPE)
+
+
 @app.route('/')
 def index():
     """Página principal con dashboard"""
-    historical = get_historical_backups()[:10]  # Últimos 10
+    historical = get_historical_backups(limit=10)  # Últimos 10
     incremental = get_incremental_backups()
     binlogs = get_binlogs()[:10]  # Últimos 10
-    mongo_backups = get_mongo_backups()[:5]
+    mongo_backups = get_mongo_backups(limit=5)
     binlog_format = get_binlog_format()
     
     binlog_dir = get_binlog_source_dir()
@@ -389,8 +1126,9 @@ def index():
 @app.route('/historical')
 def historical():
     """Listado de backups históricos"""
-    backups = get_historical_backups()
-    return render_template('historical.html', backups=backups)
+    # Las filas se cargan por páginas desde /api/backups
+    return render_template('historical.html', fast_load=RESTORE_FAST_LOAD, page_size=BACKUPS_PAGE_SIZE,
+                           retention_policy=build_policy())
 
 @app.route('/pitr')
 def pitr():
@@ -408,6 +1146,8 @@ def pitr():
                          binlogs=binlogs,
                          binlog_format=binlog_format,
                          hora_inicio=HORA_INICIO,
+                         pitr_apply_workers=PITR_APPLY_WORKERS,
+                         fast_load=RESTORE_FAST_LOAD,
                          binlog_source_path=str(binlog_dir) if binlog_dir else None,
                          binlog_source_type=binlog_source_type)
 
@@ -416,7 +1156,8 @@ def pitr():
 def mongodb():
     """Página de restauración histórica MongoDB (total o parcial)."""
     backups = get_mongo_backups()
-    return render_template('mongodb.html', backups=backups, backups_dir=MONGO_BACKUP_DEST)
+    return render_template('mongodb.html', backups=backups, backups_dir=MONGO_BACKUP_DEST,
+                           retention_policy=build_policy())
 
 @app.route('/api/restore/historical', methods=['POST'])
 def api_restore_historical():
@@ -434,23 +1175,176 @@ def api_restore_historical():
     backup_path = Path(DIR_DESTINO) / backup_file
     if not backup_path.exists():
         return jsonify({'success': False, 'error': 'El archivo de backup no existe'}), 404
+    if backup_path.is_dir() and not is_chunked_backup(backup_path):
+        return jsonify({'success': False, 'error': 'El directorio no es un backup chunked completo'}), 400
+    fast_load = bool(data.get('fast_load', RESTORE_FAST_LOAD))
     
     try:
-        # Ejecutar restauración
-        cmd = f'gunzip -c "{backup_path}" | mysql -u{env["MYSQL_USER"]} -p{env["MYSQL_PASS"]} -h{env["MYSQL_HOST"]}'
-        result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-        
-        if result.returncode == 0:
-            return jsonify({'success': True, 'message': 'Restauración completada con éxito'})
-        else:
-            return jsonify({'success': False, 'error': f'Error durante la restauración: {result.stderr}'}), 500
+        job_id = get_job_manager().submit(
+            'restore_historical', mysql_job_host(),
+            lambda job: run_historical_restore(job, backup_path, fast_load),
+            description=f'Restauración histórica {backup_file}'
+        )
+        return jsonify({'success': True, 'job_id': job_id, 'message': 'Restauración encolada'}), 202
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/backup/tables')
+def api_backup_tables():
+    """Tablas de un backup histórico con índice de tablas (para restaurarlas por separado)."""
+    backup_file = request.args.get('backup_file', '')
+    if not backup_file or Path(backup_file).name != backup_file:
+        return jsonify({'success': False, 'error': 'Archivo de backup inválido'}), 400
+    backup_path = Path(DIR_DESTINO) / backup_file
+    if not backup_path.is_file():
+        return jsonify({'success': False, 'error': 'El archivo de backup no existe'}), 404
+    try:
+        index = read_table_index(backup_path)
+    except TableIndexError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, 'database': index.get('database'), 'tables': index_tables(index)})
+
+
+# Listados de /api/backups: origen del catálogo, directorio, parser, origen volátil, fila y bases excluidas
+LISTING_SOURCES = {
+    'historical': (SOURCE_HISTORICAL, DIR_DESTINO, parse_historical_entry, False, historical_row, True),
+    'incremental': (SOURCE_INCREMENTAL, DIR_DESTINO_INC, parse_incremental_entry, True, incremental_row, True),
+    'mongo': (SOURCE_MONGO, MONGO_BACKUP_DEST, parse_mongo_entry, False, mongo_row, False),
+}
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Clave (valor de orden, nombre) de un cursor de /api/backups; ValueError si no es válido."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f'cursor inválido: {e}')
+    if not isinstance(key, list) or len(key) != 2 or not isinstance(key[1], str):
+        raise ValueError('cursor inválido')
+    return key
+
+
+def parse_listing_date(value, end=False):
+    """Epoch de YYYY-MM-DD[THH:MM]; con end=True una fecha sola cubre el día completo."""
+    for fmt in ('%Y-%m-%dT%H:%M', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            moment = datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        if end and fmt == '%Y-%m-%d':
+            moment += timedelta(days=1)
+        return moment.timestamp()
+    raise ValueError(f'fecha inválida: {value} (usar YYYY-MM-DD o YYYY-MM-DDTHH:MM)')
+
+
+@app.route('/api/backups')
+def api_backups():
+    """Listado paginado de backups (historical, incremental o mongo) con filtros y GET condicional.
+
+    Parámetros: source, db (exacta), q (parte del nombre de la base), kind
+    (lista separada por comas), since/until, sort (date, name, size, db; con
+    '-' adelante, descendente), limit y cursor (next_cursor de la página anterior).
+    Responde 304 si el ETag (If-None-Match) o la fecha (If-Modified-Since) no cambiaron.
+    """
+    args = request.args
+    source_key = args.get('source', 'historical')
+    if source_key not in LISTING_SOURCES:
+        return jsonify({'success': False, 'error': 'Origen inválido (historical, incremental, mongo)'}), 400
+    source, directory, parse_entry, volatile, to_row, exclude = LISTING_SOURCES[source_key]
+
+    sort = args.get('sort', '-date')
+    descending = sort.startswith('-')
+    sort = sort.lstrip('-')
+    if sort not in SORT_COLUMNS:
+        return jsonify({'success': False, 'error': f'Orden inválido: {sort}'}), 400
+    try:
+        limit = min(max(int(args.get('limit', BACKUPS_PAGE_SIZE)), 1), BACKUPS_PAGE_MAX)
+        after = decode_cursor(args['cursor']) if args.get('cursor') else None
+        filters = {
+            'db_name': args.get('db', '').strip() or None,
+            'db_contains': args.get('q', '').strip() or None,
+            'kinds': [kind.strip() for kind in args.get('kind', '').split(',') if kind.strip()],
+            'since': parse_listing_date(args['since']) if args.get('since') else None,
+            'until': parse_listing_date(args['until'], end=True) if args.get('until') else None,
+            'exclude_db': EXCLUDED_DATABASES if exclude else (),
+        }
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    try:
+        catalog = get_catalog()
+        catalog.refresh(source, directory, parse_entry, volatile=volatile)
+        entries, next_key = catalog.page(source, directory, limit=limit, sort=sort, descending=descending,
+                                         after=after, **filters)
+        total, last_modified = catalog.summary(source, directory, **filters)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+    backups = []
+    for entry in entries:
+        row = to_row(entry)
+        row.pop('date', None)
+        row.update(timestamp=entry['timestamp'], mtime=entry['mtime'], bytes=entry['size'])
+        backups.append(row)
+    response = jsonify({
+        'success': True,
+        'source': source_key,
+        'total': total,
+        'backups': backups,
+        'next_cursor': encode_cursor(next_key) if next_key else None,
+    })
+    # El ETag sale del contenido: cambia con cualquier dato de la página (estado de verificación incluido)
+    response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+    if last_modified:
+        response.last_modified = datetime.fromtimestamp(int(last_modified), tz=timezone.utc)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@app.route('/api/restore/tables', methods=['POST'])
+def api_restore_tables():
+    """API para restaurar solo algunas tablas de un backup histórico"""
+    data = request.json
+    backup_file = data.get('backup_file') or ''
+    tables = data.get('tables') or []
+    target_db = (data.get('target_db') or '').strip() or None
+    confirm = data.get('confirm', '').upper()
+
+    if confirm != 'SI':
+        return jsonify({'success': False, 'error': 'Debe confirmar escribiendo "SI"'}), 400
+    if not backup_file or Path(backup_file).name != backup_file:
+        return jsonify({'success': False, 'error': 'No se especificó el archivo de backup'}), 400
+    if not isinstance(tables, list) or not tables or not all(isinstance(t, str) and t for t in tables):
+        return jsonify({'success': False, 'error': 'Debe indicar al menos una tabla'}), 400
+
+    backup_path = Path(DIR_DESTINO) / backup_file
+    if not backup_path.is_file():
+        return jsonify({'success': False, 'error': 'El archivo de backup no existe'}), 404
+    try:
+        select_sections(read_table_index(backup_path), tables)
+    except TableIndexError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    fast_load = bool(data.get('fast_load', RESTORE_FAST_LOAD))
+
+    try:
+        job_id = get_job_manager().submit(
+            'restore_tables', mysql_job_host(),
+            lambda job: run_table_restore(job, backup_path, tables, target_db, fast_load),
+            description=f'Restauración de {", ".join(tables)} desde {backup_file}'
+        )
+        return jsonify({'success': True, 'job_id': job_id, 'message': 'Restauración encolada'}), 202
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
 @app.route('/api/cleanup/backups', methods=['POST'])
 def api_cleanup_backups():
-    """API para limpieza de backups históricos por antigüedad."""
+    """API para limpieza de backups históricos por antigüedad (el borrado corre en segundo plano)."""
     data = request.json or {}
     backup_type = data.get('backup_type', '').strip().lower()
     confirm = data.get('confirm', '').upper()
@@ -467,25 +1361,81 @@ def api_cleanup_backups():
     if days not in (7, 15, 30):
         return jsonify({'success': False, 'error': 'Solo se permiten 7, 15 o 30 días'}), 400
 
+    if backup_type not in RETENTION_TARGETS:
+        return jsonify({'success': False, 'error': 'Tipo de backup inválido'}), 400
+
+    label = RETENTION_TARGETS[backup_type][3]
     try:
-        if backup_type == 'mysql_historical':
-            deleted = cleanup_mysql_historical_backups(days)
-            return jsonify({
-                'success': True,
-                'message': f'Se eliminaron {len(deleted)} backups históricos MySQL con más de {days} días',
-                'deleted': deleted
-            })
+        job_id = get_job_manager().submit(
+            'cleanup', retention_job_host(backup_type),
+            lambda job: run_retention(job, backup_type, lambda entries: plan_age(entries, days),
+                                      f'más de {days} días'),
+            description=f'Limpieza de backups históricos {label} con más de {days} días'
+        )
+        return jsonify({'success': True, 'job_id': job_id, 'message': 'Limpieza encolada'}), 202
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
 
-        if backup_type == 'mongo_historical':
-            deleted = cleanup_mongo_historical_backups(days)
-            return jsonify({
-                'success': True,
-                'message': f'Se eliminaron {len(deleted)} backups históricos MongoDB con más de {days} días',
-                'deleted': deleted
-            })
 
-        return jsonify({'success': False, 'error': 'Tipo de backup inválido'}), 400
+def retention_request(data):
+    """(backup_type, política) de un pedido de retención GFS; RetentionError si es inválido."""
+    backup_type = (data.get('backup_type') or '').strip().lower()
+    if backup_type not in RETENTION_TARGETS:
+        raise RetentionError('Tipo de backup inválido')
+    policy = build_policy(data.get('daily'), data.get('weekly'), data.get('monthly'))
+    return backup_type, policy
+
 
+@app.route('/api/retention/preview', methods=['POST'])
+def api_retention_preview():
+    """Vista previa (sin borrar) de una política GFS: qué se conserva, qué se borra y cuánto se libera."""
+    data = request.json or {}
+    try:
+        backup_type, policy = retention_request(data)
+    except RetentionError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    try:
+        plan = plan_retention(retention_entries(backup_type), policy)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    items = [{
+        'name': item['name'],
+        'group': item['group'],
+        'date': datetime.fromtimestamp(item['timestamp']).strftime('%d/%m/%Y %H:%M'),
+        'size': item['size'],
+        'keep': item['keep'],
+        'reasons': item['reasons'],
+    } for item in plan]
+    return jsonify({
+        'success': True,
+        'policy': policy,
+        'summary': summarize_plan(plan),
+        'keep': [item for item in items if item['keep']],
+        'delete': [item for item in items if not item['keep']],
+    })
+
+
+@app.route('/api/retention/apply', methods=['POST'])
+def api_retention_apply():
+    """API para aplicar una política GFS: el borrado corre como trabajo en segundo plano."""
+    data = request.json or {}
+    if data.get('confirm', '').upper() != 'SI':
+        return jsonify({'success': False, 'error': 'Debe confirmar escribiendo "SI"'}), 400
+    try:
+        backup_type, policy = retention_request(data)
+    except RetentionError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    label = RETENTION_TARGETS[backup_type][3]
+    try:
+        job_id = get_job_manager().submit(
+            'retention', retention_job_host(backup_type),
+            lambda job: run_retention(job, backup_type, lambda entries: plan_retention(entries, policy),
+                                      describe_policy(policy)),
+            description=f'Retención GFS {label}: {describe_policy(policy)}'
+        )
+        return jsonify({'success': True, 'job_id': job_id, 'message': 'Retención encolada'}), 202
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -509,55 +1459,38 @@ def api_restore_mongo():
         return jsonify({'success': False, 'error': 'Modo inválido. Use full o partial'}), 400
 
     backup_path = Path(MONGO_BACKUP_DEST) / backup_name
-    if not backup_path.exists() or not backup_path.is_dir():
+    if not (backup_path.is_file() if is_archive_backup(backup_path) else backup_path.is_dir()):
         return jsonify({'success': False, 'error': 'El backup seleccionado no existe'}), 404
 
-    try:
-        if mode == 'full':
-            cmd = build_mongorestore_base_cmd() + ['--drop', str(backup_path)]
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            if result.returncode != 0:
-                return jsonify({'success': False, 'error': f'Error restaurando MongoDB completo: {result.stderr}'}), 500
-
-            return jsonify({'success': True, 'message': f'Restauración MongoDB completa realizada desde {backup_name}'})
-
-        # mode == 'partial'
+    if mode == 'partial':
         if not isinstance(selected_dbs, list) or not selected_dbs:
             return jsonify({'success': False, 'error': 'Debe seleccionar al menos una base para restauración parcial'}), 400
 
-        restore_errors = []
-        restored = []
-        for db_name in selected_dbs:
-            if not db_name or db_name in MONGO_SYSTEM_DATABASES:
-                continue
-
-            db_backup_path = backup_path / db_name
-            if not db_backup_path.exists() or not db_backup_path.is_dir():
-                restore_errors.append(f'No existe dump para la base {db_name}')
-                continue
-
-            cmd = build_mongorestore_base_cmd() + ['--drop', '--db', db_name, str(db_backup_path)]
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            if result.returncode != 0:
-                restore_errors.append(f'{db_name}: {result.stderr.strip()}')
-            else:
-                restored.append(db_name)
-
-        if restore_errors:
-            return jsonify({
-                'success': False,
-                'error': 'Se restauraron parcialmente algunas bases',
-                'details': restore_errors,
-                'restored': restored
-            }), 500
-
-        if not restored:
+        selected_dbs = [db for db in selected_dbs if db and db not in MONGO_SYSTEM_DATABASES]
+        if not selected_dbs:
             return jsonify({
                 'success': False,
                 'error': 'No se restauró ninguna base válida. Revisa la selección.'
             }), 400
 
-        return jsonify({'success': True, 'message': f'Restauración parcial completada: {", ".join(restored)}'})
+        try:
+            tuning = mongo_restore_tuning(
+                len(selected_dbs),
+                *(int(data.get(key) or 0) for key in ('concurrency', 'parallel_collections', 'insertion_workers'))
+            )
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'Valores de paralelismo inválidos'}), 400
+
+    try:
+        if mode == 'full':
+            fn = lambda job: run_mongo_full_restore(job, backup_path)
+        else:
+            fn = lambda job: run_mongo_partial_restore(job, backup_path, selected_dbs, tuning)
+        job_id = get_job_manager().submit(
+            f'restore_mongo_{mode}', mongo_job_host(), fn,
+            description=f'Restauración MongoDB ({mode}) {backup_name}'
+        )
+        return jsonify({'success': True, 'job_id': job_id, 'message': 'Restauración encolada'}), 202
 
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -575,61 +1508,117 @@ def api_restore_pitr():
     if not db_name:
         return jsonify({'success': False, 'error': 'No se especificó la base de datos'}), 400
     
-    # Verificar backup incremental
-    inc_backup = Path(DIR_DESTINO_INC) / f'{db_name}-back.sql'
-    if not inc_backup.exists():
-        return jsonify({'success': False, 'error': f'No existe backup incremental para {db_name}'}), 404
-    
+    stop_time = data.get('stop_time')
+    if stop_time:
+        try:
+            parse_datetime(stop_time)
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Hora de corte inválida'}), 400
+    extract_only = bool(data.get('extract_only', True))
+    fast_load = bool(data.get('fast_load', RESTORE_FAST_LOAD))
     try:
-        # Paso 1: Restaurar backup completo
-        cmd1 = f'mysql -u{env["MYSQL_USER"]} -p{env["MYSQL_PASS"]} -h{env["MYSQL_HOST"]} < "{inc_backup}"'
-        result1 = subprocess.run(cmd1, shell=True, capture_output=True, text=True)
-        
-        if result1.returncode != 0:
-            return jsonify({'success': False, 'error': f'Error restaurando backup completo: {result1.stderr}'}), 500
-        
-        # Paso 2: Obtener tiempo del backup
-        backup_time = datetime.fromtimestamp(inc_backup.stat().st_mtime).strftime('%Y-%m-%d %H:%M:%S')
-        
-        # Paso 3: Aplicar binlogs si se especificaron
-        stop_time = data.get('stop_time')
-        binlog_files = data.get('binlogs', [])
-        
-        if binlog_files:
-            # Construir comando mysqlbinlog
-            binlog_cmd = f'mysqlbinlog --no-defaults --database="{db_name}" --start-datetime="{backup_time}"'
-            if stop_time:
-                binlog_cmd += f' --stop-datetime="{stop_time}"'
-            
-            binlog_dir = get_binlog_source_dir()
-            if not binlog_dir:
-                return jsonify({'success': False, 'error': 'No se encontró directorio de binlogs disponible'}), 500
-
-            for binlog in binlog_files:
-                binlog_path = binlog_dir / binlog
-                if binlog_path.exists():
-                    binlog_cmd += f' "{binlog_path}"'
-            
-            binlog_cmd += f' | mysql -u{env["MYSQL_USER"]} -p{env["MYSQL_PASS"]} -h{env["MYSQL_HOST"]}'
-            
-            result2 = subprocess.run(binlog_cmd, shell=True, capture_output=True, text=True)
-            
-            if result2.returncode != 0:
-                return jsonify({'success': False, 'error': f'Error aplicando binlogs: {result2.stderr}'}), 500
-        
-        return jsonify({'success': True, 'message': 'Restauración PITR completada con éxito'})
+        apply_workers = max(1, int(data.get('parallel_workers') or PITR_APPLY_WORKERS))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'Cantidad de conexiones inválida'}), 400
+
+    plan = None
+    if data.get('auto_plan'):
+        # Backup base y binlogs (de cualquier día) elegidos por costo estimado
+        try:
+            chosen, _ = plan_pitr_restore(db_name, stop_time, extract_only)
+        except (OSError, BinlogFormatError) as e:
+            return jsonify({'success': False, 'error': f'No se pudo planificar la restauración: {e}'}), 500
+        if chosen is None:
+            return jsonify({'success': False, 'error': f'Ningún backup de {db_name} llega a la hora pedida '
+                                                       f'con los binlogs archivados'}), 409
+        inc_backup, plan = chosen['path'], chosen['plan']
+        binlog_paths = plan['files']
+    else:
+        # Verificar backup incremental
+        inc_backup = Path(DIR_DESTINO_INC) / f'{db_name}-back.sql'
+        if not inc_backup.exists():
+            return jsonify({'success': False, 'error': f'No existe backup incremental para {db_name}'}), 404
+        binlog_paths = []
+
+    binlog_files = [] if plan is not None else data.get('binlogs', [])
+    if binlog_files:
+        binlog_dir = get_binlog_source_dir()
+        if not binlog_dir:
+            return jsonify({'success': False, 'error': 'No se encontró directorio de binlogs disponible'}), 500
+        binlog_paths = [binlog_dir / binlog for binlog in binlog_files if (binlog_dir / binlog).exists()]
+
+    try:
+        job_id = get_job_manager().submit(
+            'restore_pitr', mysql_job_host(),
+            lambda job: run_pitr_restore(job, db_name, inc_backup, binlog_paths, stop_time, extract_only, plan,
+                                         apply_workers, fast_load),
+            description=f'Restauración PITR {db_name}'
+        )
+        return jsonify({'success': True, 'job_id': job_id, 'message': 'Restauración PITR encolada'}), 202
     
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/pitr/plan', methods=['POST'])
+def api_pitr_plan():
+    """Simulación: backup base, binlogs y tiempo estimado que usaría la restauración PITR automática."""
+    data = request.json or {}
+    db_name = data.get('db_name')
+    if not db_name or is_excluded_database(db_name):
+        return jsonify({'success': False, 'error': 'No se especificó la base de datos'}), 400
+    stop_time = data.get('stop_time')
+    if stop_time:
+        try:
+            parse_datetime(stop_time)
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Hora de corte inválida'}), 400
+
+    try:
+        chosen, evaluated = plan_pitr_restore(db_name, stop_time, bool(data.get('extract_only', True)))
+    except (OSError, BinlogFormatError) as e:
+        return jsonify({'success': False, 'error': f'No se pudo planificar la restauración: {e}'}), 500
+    return jsonify({
+        'success': True,
+        'plan': describe_candidate(chosen) if chosen else None,
+        'candidates': [describe_candidate(candidate) for candidate in evaluated],
+    })
+
+
+@app.route('/api/jobs')
+def api_jobs():
+    """Últimos trabajos en segundo plano."""
+    return jsonify({'success': True, 'jobs': get_job_manager().recent()})
+
+
+@app.route('/api/jobs/<job_id>')
+def api_job_status(job_id):
+    """Estado de un trabajo (fase, bytes, throughput, ETA)."""
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Trabajo inexistente'}), 404
+    return jsonify({'success': True, 'job': job})
+
+
+@app.route('/api/jobs/<job_id>/events')
+def api_job_events(job_id):
+    """Stream Server-Sent-Events con el progreso de un trabajo."""
+    return Response(
+        get_job_manager().events(job_id),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 @app.route('/api/rotate-binlogs', methods=['POST'])
 def api_rotate_binlogs():
     """API para rotar binlogs manualmente"""
     try:
         cmd = f'mysqladmin -u{env["MYSQL_USER"]} -p{env["MYSQL_PASS"]} -h{env["MYSQL_HOST"]} flush-logs'
-        result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+        result = run_command(cmd, shell=True, capture_output=True, text=True)
         
         if result.returncode == 0:
+            # El binlog activo y el listado cambiaron: descartar metadatos cacheados
+            server_meta.invalidate()
             return jsonify({'success': True, 'message': 'Binlogs rotados exitosamente'})
         else:
             return jsonify({'success': False, 'error': result.stderr}), 500
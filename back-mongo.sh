@@ -15,10 +15,20 @@ fi
 
 # Generar nombre de carpeta con fecha y hora (Ej: 2023-10-27_15-30)
 FECHA=$(date +"$FECHA_FORMAT")
-RUTA_FINAL="${DESTINO}/backup_${FECHA}"
 
-# Crear el directorio si no existe
-mkdir -p "${RUTA_FINAL}"
+# MONGO_BACKUP_FORMAT="archive": un único backup_<fecha>.archive.gz (mongodump --archive --gzip)
+# en lugar del árbol de carpetas de --out
+if [ "${MONGO_BACKUP_FORMAT:-dir}" = "archive" ]; then
+    RUTA_FINAL="${DESTINO}/backup_${FECHA}.archive.gz"
+    # Se escribe con otro nombre y se renombra al terminar: la web nunca ve un archivo a medias
+    mkdir -p "${DESTINO}"
+    SALIDA=(--gzip --archive="${RUTA_FINAL}.tmp")
+else
+    RUTA_FINAL="${DESTINO}/backup_${FECHA}"
+    # Crear el directorio si no existe
+    mkdir -p "${RUTA_FINAL}"
+    SALIDA=(--out "$RUTA_FINAL")
+fi
 
 # Ejecutar el backup
 # Nota: Usamos -p para que pida contraseña si no la quieres hardcodeada, 
@@ -27,8 +37,27 @@ mongodump --host "$HOST" --port "$PUERTO" \
           --username "$USUARIO" \
           --password "$CONTRASENA" \
           --authenticationDatabase admin \
-          --out "$RUTA_FINAL"
+          "${SALIDA[@]}"
+DUMP_STATUS=$?
+
+if [ $DUMP_STATUS -ne 0 ]; then
+    echo "ERROR: mongodump terminó con código $DUMP_STATUS"
+    rm -f "${RUTA_FINAL}.tmp"
+    exit $DUMP_STATUS
+fi
+
+if [ -f "${RUTA_FINAL}.tmp" ]; then
+    mv "${RUTA_FINAL}.tmp" "$RUTA_FINAL"
+fi
+
+# Manifiesto con tamaño y bases del volcado (la interfaz web no vuelve a recorrer la
+# carpeta ni a descomprimir el archivo)
+PYTHON="${SCRIPT_DIR}/venv/bin/python3"
+if [ ! -x "$PYTHON" ]; then
+    PYTHON="python3"
+fi
+"$PYTHON" "${SCRIPT_DIR}/mongo_manifest.py" "$RUTA_FINAL"
 
 # Opcional: Mensaje de éxito
 echo "Backup completado en: $RUTA_FINAL"
-find $DESTINO -mindepth 1 -maxdepth 1 -type d -mtime +7 -ls
+find $DESTINO -mindepth 1 -maxdepth 1 \( -type d -o -name 'backup_*.archive.gz' \) -mtime +7 -ls
@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+"""
+Códecs de compresión de los dumps (gzip, zstd, sin comprimir)
+Cada códec define la extensión del archivo, cómo escribirlo en paralelo desde
+el ejecutor de backups y cómo descomprimirlo en streaming al restaurar.
+Incluye un comando para comparar niveles/hilos sobre un dump de muestra:
+
+    python3 backup_codecs.py bench <dump.sql[.gz|.zst]>
+"""
+
+import argparse
+import gzip
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard
+except ImportError:  # se usa el binario zstd si está instalado
+    zstandard = None
+
+READ_SIZE = 4 * 1024 * 1024
+
+# Miembros gzip con subcampo BGZF 'BC': cada bloque se comprime por separado y
+# restore_pipeline puede descomprimirlos en paralelo
+BLOCK_INPUT_SIZE = 0xff00
+BLOCK_MAX_SIZE = 0x10000
+BLOCK_HEADER = b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00'
+
+
+class CodecError(Exception):
+    """Códec desconocido o no disponible en este equipo."""
+
+
+def compress_block(data, level=6):
+    """Comprime data como uno (o más, si no entra en 64 KiB) miembros gzip con BSIZE."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    cdata = compressor.compress(data) + compressor.flush()
+    total = len(BLOCK_HEADER) + 2 + len(cdata) + 8
+    if total > BLOCK_MAX_SIZE:
+        half = len(data) // 2
+        return compress_block(data[:half], level) + compress_block(data[half:], level)
+    return b''.join((
+        BLOCK_HEADER,
+        struct.pack('<H', total - 1),
+        cdata,
+        struct.pack('<II', zlib.crc32(data), len(data) & 0xffffffff),
+    ))
+
+
+# Bloque vacío que marca el fin del archivo (igual que bgzip)
+EOF_BLOCK = compress_block(b'')
+
+
+class BlockGzipWriter:
+    """Escribe un .gz en bloques independientes comprimidos en un pool de hilos.
+
+    El orden de los bloques se conserva; como mucho hay 2 bloques pendientes por
+    hilo del pool para acotar la memoria.
+    """
+
+    def __init__(self, fileobj, pool, threads, level=6):
+        self.fileobj = fileobj
+        self.pool = pool
+        self.max_pending = max(2, threads * 2)
+        self.level = level
+        self.bytes_written = 0
+        self.mark_offsets = {}
+        self._buffer = bytearray()
+        self._pending = deque()
+        self._submitted = 0
+        self._written = 0
+        self._marks = deque()
+
+    def write(self, data):
+        self._buffer += data
+        while len(self._buffer) >= BLOCK_INPUT_SIZE:
+            block = bytes(self._buffer[:BLOCK_INPUT_SIZE])
+            del self._buffer[:BLOCK_INPUT_SIZE]
+            self._submit(block)
+
+    def mark(self):
+        """Corta el bloque actual: lo que se escriba después empieza un miembro gzip nuevo.
+
+        Devuelve una marca; tras close(), mark_offsets[marca] es el offset de
+        ese miembro en el archivo (desde ahí se puede descomprimir sin lo anterior).
+        """
+        if self._buffer:
+            self._submit(bytes(self._buffer))
+            self._buffer.clear()
+        self._marks.append(self._submitted)
+        return self._submitted
+
+    def _submit(self, block):
+        self._pending.append(self.pool.submit(compress_block, block, self.level))
+        self._submitted += 1
+        while len(self._pending) >= self.max_pending:
+            self._write_next()
+
+    def _record_marks(self):
+        while self._marks and self._marks[0] == self._written:
+            self.mark_offsets[self._marks.popleft()] = self.bytes_written
+
+    def _write_next(self):
+        member = self._pending.popleft().result()
+        self._record_marks()
+        self.fileobj.write(member)
+        self.bytes_written += len(member)
+        self._written += 1
+
+    def close(self):
+        if self._buffer:
+            self._submit(bytes(self._buffer))
+            self._buffer.clear()
+        while self._pending:
+            self._write_next()
+        self._record_marks()
+        self.fileobj.write(EOF_BLOCK)
+        self.bytes_written += len(EOF_BLOCK)
+
+
+class ZstdWriter:
+    """Escribe un .zst con los hilos internos de zstd (módulo zstandard o binario zstd)."""
+
+    def __init__(self, fileobj, threads, level=3):
+        self.fileobj = fileobj
+        self.bytes_written = 0
+        self._start = fileobj.tell()
+        if zstandard is not None:
+            compressor = zstandard.ZstdCompressor(level=level, threads=threads)
+            self._stream = compressor.stream_writer(fileobj, closefd=False)
+            self._proc = None
+        else:
+            fileobj.flush()
+            self._proc = subprocess.Popen(['zstd', '-q', f'-{level}', f'-T{threads}', '-c'],
+                                          stdin=subprocess.PIPE, stdout=fileobj)
+            self._stream = self._proc.stdin
+
+    def write(self, data):
+        self._stream.write(data)
+
+    def close(self):
+        self._stream.close()
+        if self._proc is not None and self._proc.wait() != 0:
+            raise CodecError(f'zstd terminó con código {self._proc.returncode}')
+        self.fileobj.seek(0, os.SEEK_END)
+        self.bytes_written = self.fileobj.tell() - self._start
+
+
+class PlainWriter:
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.bytes_written = 0
+        self.mark_offsets = {}
+
+    def write(self, data):
+        self.fileobj.write(data)
+        self.bytes_written += len(data)
+
+    def mark(self):
+        self.mark_offsets[self.bytes_written] = self.bytes_written
+        return self.bytes_written
+
+    def close(self):
+        pass
+
+
+def _gunzip_chunks(raw_chunks):
+    """Descomprime gzip (uno o varios miembros concatenados) en streaming.
+
+    Un miembro cortado antes de su final (archivo truncado) lanza CodecError.
+    """
+    decomp = zlib.decompressobj(wbits=31)
+    pending = False
+    for raw in raw_chunks:
+        while raw:
+            pending = True
+            data = decomp.decompress(raw)
+            if data:
+                yield data
+            if decomp.eof:
+                raw = decomp.unused_data
+                decomp = zlib.decompressobj(wbits=31)
+                pending = False
+            else:
+                raw = b''
+    tail = decomp.flush()
+    if tail:
+        yield tail
+    if pending and not decomp.eof:
+        raise CodecError('gzip truncado: el archivo termina antes del final del stream')
+
+
+def _feed_stdin(proc, raw_chunks, failures):
+    try:
+        for raw in raw_chunks:
+            proc.stdin.write(raw)
+    except BrokenPipeError:
+        pass
+    except BaseException as e:
+        failures.append(e)
+        proc.kill()
+    finally:
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+
+
+def _unzstd_chunks(raw_chunks):
+    """Descomprime zstd (uno o varios frames) en streaming.
+
+    Un frame cortado antes de su final (archivo truncado) lanza CodecError.
+    """
+    if zstandard is None:
+        yield from _unzstd_cli(raw_chunks)
+        return
+    decompressor = zstandard.ZstdDecompressor()
+    decomp = decompressor.decompressobj()
+    pending = False
+    for raw in raw_chunks:
+        while raw:
+            pending = True
+            data = decomp.decompress(raw)
+            if data:
+                yield data
+            if decomp.eof:
+                raw = decomp.unused_data
+                decomp = decompressor.decompressobj()
+                pending = False
+            else:
+                raw = b''
+    if pending and not decomp.eof:
+        raise CodecError('zstd truncado: el archivo termina antes del final del frame')
+
+
+def _unzstd_cli(raw_chunks):
+    proc = subprocess.Popen(['zstd', '-dcq'], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    failures = []
+    feeder = threading.Thread(target=_feed_stdin, args=(proc, raw_chunks, failures), daemon=True)
+    feeder.start()
+    try:
+        yield from iter(lambda: proc.stdout.read1(READ_SIZE), b'')
+    except BaseException:
+        proc.kill()
+        raise
+    finally:
+        proc.stdout.close()
+        proc.wait()
+        feeder.join()
+    if failures:
+        raise failures[0]
+    if proc.returncode != 0:
+        raise CodecError(f'zstd -d terminó con código {proc.returncode}')
+
+
+class Codec:
+    """Nombre, extensión y nivel por defecto de un códec.
+
+    Cada códec define además:
+      writer(fileobj, pool, threads, level) -> write()/close() y bytes_written, para el flujo de mysqldump
+      open_file(path, level)                -> archivo de escritura simple (un hilo), para chunked
+      decompress(raw_chunks)                -> generador de datos descomprimidos desde los bytes del archivo
+      open_reader(path)                     -> archivo de lectura (read/close) con el contenido descomprimido
+    """
+
+    def __init__(self, name, extension, default_level):
+        self.name = name
+        self.extension = extension
+        self.default_level = default_level
+
+    def available(self):
+        return True
+
+
+class GzipCodec(Codec):
+    def __init__(self):
+        super().__init__('gzip', '.gz', 9)
+
+    def writer(self, fileobj, pool, threads, level=None):
+        return BlockGzipWriter(fileobj, pool, threads, level or self.default_level)
+
+    def open_file(self, path, level=None):
+        return gzip.open(path, 'wb', compresslevel=level or self.default_level)
+
+    def decompress(self, raw_chunks):
+        return _gunzip_chunks(raw_chunks)
+
+    def open_reader(self, path):
+        return gzip.open(path, 'rb')
+
+
+class ZstdCodec(Codec):
+    def __init__(self):
+        super().__init__('zstd', '.zst', 3)
+
+    def available(self):
+        return zstandard is not None or shutil.which('zstd') is not None
+
+    def writer(self, fileobj, pool, threads, level=None):
+        return ZstdWriter(fileobj, threads, level or self.default_level)
+
+    def open_file(self, path, level=None):
+        return _ZstdFile(path, level or self.default_level)
+
+    def decompress(self, raw_chunks):
+        return _unzstd_chunks(raw_chunks)
+
+    def open_reader(self, path):
+        if zstandard is not None:
+            return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True)
+        return _ZstdCliReader(path)
+
+
+class _ZstdFile:
+    def __init__(self, path, level):
+        self._file = open(path, 'wb')
+        self._writer = ZstdWriter(self._file, 1, level)
+
+    def write(self, data):
+        self._writer.write(data)
+
+    def close(self):
+        try:
+            self._writer.close()
+        finally:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _ZstdCliReader:
+    def __init__(self, path):
+        self._proc = subprocess.Popen(['zstd', '-dcq', str(path)], stdout=subprocess.PIPE)
+
+    def read(self, size=-1):
+        return self._proc.stdout.read(size)
+
+    def close(self):
+        # Cerrar antes de terminar la lectura es válido (lector que solo avanza)
+        if self._proc.poll() is None:
+            self._proc.kill()
+        self._proc.stdout.close()
+        self._proc.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PlainCodec(Codec):
+    def __init__(self):
+        super().__init__('none', '', 0)
+
+    def writer(self, fileobj, pool, threads, level=None):
+        return PlainWriter(fileobj)
+
+    def open_file(self, path, level=None):
+        return open(path, 'wb')
+
+    def decompress(self, raw_chunks):
+        return raw_chunks
+
+    def open_reader(self, path):
+        return open(path, 'rb')
+
+
+CODECS = {codec.name: codec for codec in (GzipCodec(), ZstdCodec(), PlainCodec())}
+
+
+def get_codec(name):
+    codec = CODECS.get((name or '').strip().lower())
+    if codec is None:
+        raise CodecError(f'códec desconocido: {name} (opciones: {", ".join(CODECS)})')
+    if not codec.available():
+        raise CodecError(f'el códec {codec.name} requiere el módulo zstandard o el binario zstd')
+    return codec
+
+
+def codec_for_path(path):
+    """Códec según la extensión del archivo (.gz, .zst; cualquier otra = sin comprimir)."""
+    name = str(path)
+    for codec in CODECS.values():
+        if codec.extension and name.endswith(codec.extension):
+            return codec
+    return CODECS['none']
+
+
+def read_sample(path, size):
+    """Primeros size bytes descomprimidos de un dump."""
+    def raw_chunks():
+        with open(path, 'rb') as f:
+            yield from iter(lambda: f.read(READ_SIZE), b'')
+
+    sample = bytearray()
+    stream = codec_for_path(path).decompress(raw_chunks())
+    for data in stream:
+        sample += data
+        if len(sample) >= size:
+            stream.close()
+            break
+    return bytes(sample[:size])
+
+
+def bench_codec(codec, level, threads, sample):
+    """Comprime y descomprime sample; devuelve ratio y MB/s de cada sentido."""
+    with tempfile.TemporaryFile() as out, \
+            ThreadPoolExecutor(max_workers=threads, thread_name_prefix='bench') as pool:
+        started = time.monotonic()
+        writer = codec.writer(out, pool, threads, level)
+        for offset in range(0, len(sample), READ_SIZE):
+            writer.write(sample[offset:offset + READ_SIZE])
+        writer.close()
+        out.flush()
+        compress_seconds = max(time.monotonic() - started, 0.001)
+
+        out.seek(0)
+        started = time.monotonic()
+        restored = sum(len(data) for data in codec.decompress(iter(lambda: out.read(READ_SIZE), b'')))
+        decompress_seconds = max(time.monotonic() - started, 0.001)
+
+    if restored != len(sample):
+        raise CodecError(f'{codec.name}: se recuperaron {restored} de {len(sample)} bytes')
+    mb = len(sample) / (1024 * 1024)
+    return {
+        'codec': codec.name, 'level': level, 'threads': threads,
+        'ratio': len(sample) / max(writer.bytes_written, 1),
+        'compress_mb_s': mb / compress_seconds,
+        'decompress_mb_s': mb / decompress_seconds,
+    }
+
+
+def parse_levels(specs):
+    """['gzip=1,6,9', 'zstd=1,3'] -> [(codec, nivel), ...]."""
+    pairs = []
+    for spec in specs:
+        name, _, levels = spec.partition('=')
+        codec = get_codec(name)
+        for level in (levels.split(',') if levels else [codec.default_level]):
+            pairs.append((codec, int(level)))
+    return pairs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Códecs de compresión de los backups MySQL')
+    sub = parser.add_subparsers(dest='command', required=True)
+    bench = sub.add_parser('bench', help='compara niveles e hilos sobre un dump de muestra')
+    bench.add_argument('sample', help='dump .sql, .sql.gz o .sql.zst')
+    bench.add_argument('--size-mb', type=int, default=64, help='MB descomprimidos de la muestra')
+    bench.add_argument('--codecs', nargs='+',
+                       default=['gzip=1,6,9', 'zstd=1,3,9,19', 'none'],
+                       help='códec=niveles separados por coma')
+    bench.add_argument('--threads', default=f'1,{os.cpu_count() or 1}',
+                       help='cantidades de hilos separadas por coma')
+    args = parser.parse_args(argv)
+
+    try:
+        pairs = []
+        for spec in args.codecs:
+            try:
+                pairs.extend(parse_levels([spec]))
+            except CodecError as e:
+                print(f'Aviso: {e}; se omite')
+        sample = read_sample(args.sample, args.size_mb * 1024 * 1024)
+    except (OSError, CodecError, zlib.error) as e:
+        print(f'Error leyendo la muestra: {e}')
+        return 1
+    if not sample:
+        print('La muestra está vacía')
+        return 1
+
+    threads_list = sorted({max(1, int(t)) for t in args.threads.split(',') if t.strip()})
+    print(f'Muestra: {len(sample) / (1024 * 1024):.1f} MB de {args.sample}')
+    print(f'{"códec":<6} {"nivel":>5} {"hilos":>5} {"ratio":>7} {"comp MB/s":>10} {"desc MB/s":>10}')
+    for codec, level in pairs:
+        for threads in (threads_list if codec.name != 'none' else [1]):
+            result = bench_codec(codec, level, threads, sample)
+            print(f'{result["codec"]:<6} {result["level"]:>5} {result["threads"]:>5} {result["ratio"]:>7.2f} '
+                  f'{result["compress_mb_s"]:>10.1f} {result["decompress_mb_s"]:>10.1f}', flush=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
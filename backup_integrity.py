@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Verificación de dumps calculada al escribirlos
+Mientras backup_runner.py escribe un .sql[.gz|.zst] se calcula, sobre el mismo
+flujo que se comprime, el SHA-256 del SQL, los bytes sin comprimir y si
+mysqldump llegó a escribir su línea final "-- Dump completed". Todo se guarda
+en <backup>.meta.json, de modo que los listados muestran el estado
+(verificado / incompleto / sin verificar) sin abrir el backup.
+
+    python3 backup_integrity.py verify /mnt/backup/mysql/shop-back_2024-05-01_23-00.sql.gz
+    python3 backup_integrity.py write /mnt/backup/mysql/*.sql.gz   (backups anteriores, sin .meta.json)
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+from backup_codecs import codec_for_path
+from catalog import SOURCE_HISTORICAL, SOURCE_INCREMENTAL, BackupCatalog
+from config import CATALOG_PATH, DIR_DESTINO, DIR_DESTINO_INC
+
+SIDECAR_SUFFIX = '.meta.json'
+SIDECAR_VERSION = 1
+DUMP_COMPLETED_MARKER = b'-- Dump completed'
+# mysqldump termina con "-- Dump completed on <fecha>\n": alcanza con el final del flujo
+TRAILER_BYTES = 256
+READ_SIZE = 4 * 1024 * 1024
+
+STATUS_VERIFIED = 'verified'
+STATUS_INCOMPLETE = 'incomplete'
+STATUS_MODIFIED = 'modified'
+STATUS_UNVERIFIED = 'unverified'
+
+
+class DumpDigest:
+    """SHA-256, bytes y cola del SQL sin comprimir, alimentado por bloques."""
+
+    def __init__(self):
+        self.sha256 = hashlib.sha256()
+        self.bytes_raw = 0
+        self.tail = b''
+
+    def update(self, data):
+        self.sha256.update(data)
+        self.bytes_raw += len(data)
+        self.tail = (self.tail + data[-TRAILER_BYTES:])[-TRAILER_BYTES:]
+
+    @property
+    def completed(self):
+        return DUMP_COMPLETED_MARKER in self.tail
+
+
+def sidecar_path(path):
+    path = Path(path)
+    return path.with_name(path.name + SIDECAR_SUFFIX)
+
+
+def build_sidecar(digest, codec, file_size, started_at=None):
+    """Contenido del .meta.json; file_size es el tamaño final en disco.
+
+    started_at (epoch en que arrancó mysqldump) es el inicio del snapshot: de
+    ahí se parte en PITR cuando el dump no registra coordenadas de binlog.
+    """
+    meta = {
+        'version': SIDECAR_VERSION,
+        'codec': codec.name,
+        'sha256': digest.sha256.hexdigest(),
+        'bytes_raw': digest.bytes_raw,
+        'completed': digest.completed,
+        'file_size': file_size,
+        'created_at': time.time(),
+    }
+    if started_at is not None:
+        meta['started_at'] = started_at
+    return meta
+
+
+def write_sidecar(path, meta):
+    """Guarda <path>.meta.json de forma atómica (tmp + rename)."""
+    target = sidecar_path(path)
+    tmp = target.with_name(f'.{target.name}.{os.getpid()}.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp, target)
+
+
+def read_sidecar(path):
+    """Contenido de <path>.meta.json o None si falta o no es válido."""
+    try:
+        with open(sidecar_path(path)) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(meta, dict) or meta.get('version') != SIDECAR_VERSION:
+        return None
+    return meta
+
+
+def verification_status(path, stat):
+    """Estado del backup según su sidecar y el tamaño actual (no lee el backup)."""
+    meta = read_sidecar(path)
+    if meta is None:
+        return STATUS_UNVERIFIED, None
+    if meta.get('file_size') != stat.st_size:
+        return STATUS_MODIFIED, meta
+    if not meta.get('completed'):
+        return STATUS_INCOMPLETE, meta
+    return STATUS_VERIFIED, meta
+
+
+def restore_refusal(path):
+    """Motivo para no restaurar un dump según su .meta.json, o None.
+
+    Se rechazan los dumps que mysqldump no terminó y los que ya no tienen el
+    tamaño registrado al escribirlos (truncados o reemplazados). Sin sidecar no
+    hay con qué comparar y se restauran como antes.
+    """
+    path = Path(path)
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    status, meta = verification_status(path, stat)
+    if status == STATUS_INCOMPLETE:
+        return f'{path.name} no termina con "-- Dump completed" (mysqldump no terminó el volcado)'
+    if status == STATUS_MODIFIED:
+        return (f'{path.name} mide {stat.st_size} bytes y {sidecar_path(path).name} registra '
+                f'{meta.get("file_size")}: puede estar truncado (si fue reemplazado a propósito, '
+                f'regenerar con backup_integrity.py write --force)')
+    return None
+
+
+def digest_file(path):
+    """Recalcula el .meta.json leyendo y descomprimiendo el backup entero."""
+    path = Path(path)
+    codec = codec_for_path(path)
+    digest = DumpDigest()
+
+    def raw_chunks():
+        with open(path, 'rb') as f:
+            yield from iter(lambda: f.read(READ_SIZE), b'')
+
+    for data in codec.decompress(raw_chunks()):
+        digest.update(data)
+    return build_sidecar(digest, codec, path.stat().st_size)
+
+
+def verify_file(path):
+    """Compara el backup con su sidecar; devuelve la lista de diferencias (vacía = íntegro)."""
+    meta = read_sidecar(path)
+    if meta is None:
+        return ['no tiene .meta.json']
+    actual = digest_file(path)
+    problems = [
+        f'{key}: esperado {meta.get(key)}, actual {actual[key]}'
+        for key in ('file_size', 'bytes_raw', 'sha256')
+        if meta.get(key) != actual[key]
+    ]
+    if not actual['completed']:
+        problems.append('falta la línea final "-- Dump completed"')
+    return problems
+
+
+def forget_cached_status(paths):
+    """Quita del catálogo los backups con .meta.json nuevo para que la web relea su estado."""
+    sources = {Path(DIR_DESTINO).resolve(): (SOURCE_HISTORICAL, DIR_DESTINO),
+               Path(DIR_DESTINO_INC).resolve(): (SOURCE_INCREMENTAL, DIR_DESTINO_INC)}
+    names = {}
+    for path in paths:
+        path = Path(path).resolve()
+        if path.parent in sources:
+            names.setdefault(sources[path.parent], []).append(path.name)
+    if not names:
+        return
+    try:
+        catalog = BackupCatalog(CATALOG_PATH)
+        for (source, directory), items in names.items():
+            catalog.remove(source, directory, items)
+    except Exception as e:
+        print(f'Aviso: no se pudo actualizar el catálogo ({e}); la web mostrará el estado anterior')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Verificación de backups MySQL (.meta.json)')
+    sub = parser.add_subparsers(dest='command', required=True)
+    verify = sub.add_parser('verify', help='relee y descomprime los backups y los compara con su .meta.json')
+    verify.add_argument('paths', nargs='+')
+    write = sub.add_parser('write', help='genera el .meta.json de backups que no lo tienen')
+    write.add_argument('paths', nargs='+')
+    write.add_argument('--force', action='store_true', help='reemplazar .meta.json existentes')
+    args = parser.parse_args(argv)
+
+    failed = 0
+    written = []
+    for path in args.paths:
+        name = Path(path).name
+        try:
+            if args.command == 'verify':
+                problems = verify_file(path)
+                print(f'{name}: {"OK" if not problems else "; ".join(problems)}')
+                failed += bool(problems)
+            elif args.force or read_sidecar(path) is None:
+                meta = digest_file(path)
+                write_sidecar(path, meta)
+                written.append(path)
+                print(f'{name}: {meta["bytes_raw"] / (1024 * 1024):.1f} MB, '
+                      f'{"completo" if meta["completed"] else "SIN línea Dump completed"}')
+        except Exception as e:
+            print(f'{name}: error leyendo el backup: {e}')
+            failed += 1
+    forget_cached_status(written)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
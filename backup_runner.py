@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+"""
+Ejecutor de backups MySQL por base de datos en paralelo
+Reemplaza el bucle serial de back-sql-single.sh y back-sql-single-inc.sh:
+varias bases a la vez (las más grandes primero) y compresión en paralelo
+(gzip en bloques repartidos entre hilos, o zstd multihilo)
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+from backup_codecs import CODECS, CodecError, get_codec
+from backup_integrity import DumpDigest, build_sidecar, sidecar_path, write_sidecar
+from catalog import BackupCatalog
+from chunked_backup import CHUNKED_SUFFIX, dump_chunked
+from config import (
+    CATALOG_PATH, DEDUP_STORE_DIR, DIR_DESTINO, DIR_DESTINO_INC, EXCLUDE_DB, FECHA_FORMAT,
+    MYSQL_HOST, MYSQL_PASS, MYSQL_USER, env, mysql_client_env
+)
+from dedup_store import DEDUP_SUFFIX, DedupStore, DedupWriter, write_manifest
+from load_governor import BACKUP_THROTTLE, LoadGovernor
+from metrics import record_command
+from mysql_meta import ServerMetadata
+from table_index import SectionIndexer, index_path, supports_index, write_index
+
+KIND_HISTORICAL = 'historical'
+KIND_INCREMENTAL = 'incremental'
+
+FORMAT_SQL = 'sql'
+FORMAT_CHUNKED = 'chunked'
+FORMAT_DEDUP = 'dedup'
+
+# Bases que se vuelcan en simultáneo y hilos de compresión compartidos entre ellas
+BACKUP_WORKERS = int(env.get('BACKUP_WORKERS', '4'))
+BACKUP_COMPRESS_THREADS = int(env.get('BACKUP_COMPRESS_THREADS', '0')) or os.cpu_count() or 1
+# Códec de los backups históricos: gzip (.sql.gz), zstd (.sql.zst) o none (.sql)
+BACKUP_CODEC = env.get('BACKUP_CODEC', 'gzip').strip() or 'gzip'
+BACKUP_GZIP_LEVEL = int(env.get('BACKUP_GZIP_LEVEL', '9'))
+BACKUP_ZSTD_LEVEL = int(env.get('BACKUP_ZSTD_LEVEL', '3'))
+# sql: un .sql[.gz|.zst] por base; chunked: directorio por base con un archivo por tabla/rango de PK;
+# dedup: manifiesto por base y chunks sin repetir en DEDUP_STORE_DIR
+BACKUP_FORMAT = env.get('BACKUP_FORMAT', FORMAT_SQL).strip() or FORMAT_SQL
+# Conexiones (mismo snapshot) por base en formato chunked
+BACKUP_CHUNK_WORKERS = int(env.get('BACKUP_CHUNK_WORKERS', '4'))
+# Filas estimadas por archivo de datos al partir tablas por rangos de PK
+BACKUP_CHUNK_ROWS = int(env.get('BACKUP_CHUNK_ROWS', '500000'))
+# Índice de tablas (<backup>.tables.json) para restaurar tablas sueltas de los .sql/.sql.gz
+BACKUP_TABLE_INDEX = env.get('BACKUP_TABLE_INDEX', '1').strip().lower() in ('1', 'true', 'yes', 'si')
+# Coordenadas del binlog (--master-data=2) también en históricos y dedup para que sirvan de base
+# de PITR; requiere privilegio RELOAD y solo se pide si el servidor tiene el binlog activo
+BACKUP_BINLOG_COORDINATES = env.get('BACKUP_BINLOG_COORDINATES', '1').strip().lower() in ('1', 'true', 'yes', 'si')
+
+READ_SIZE = 1024 * 1024
+STDERR_TAIL_LINES = 50
+
+MYSQLDUMP_OPTIONS = [
+    '--routines',
+    '--events',
+    '--triggers',
+    '--single-transaction',
+    '--add-drop-database',
+    '--set-gtid-purged=OFF',
+]
+
+
+def _collect_tail(stream, tail):
+    for line in iter(stream.readline, b''):
+        tail.append(line)
+    stream.close()
+
+
+def codec_level(codec):
+    """Nivel configurado en .env para el códec."""
+    return {'gzip': BACKUP_GZIP_LEVEL, 'zstd': BACKUP_ZSTD_LEVEL}.get(codec.name, codec.default_level)
+
+
+def backup_path(kind, db_name, fecha, codec=None):
+    """Mismo esquema de nombres que lista la interfaz web."""
+    if kind == KIND_INCREMENTAL:
+        return Path(DIR_DESTINO_INC) / f'{db_name}-back.sql'
+    return Path(DIR_DESTINO) / f'{db_name}-back_{fecha}.sql{(codec or CODECS["gzip"]).extension}'
+
+
+def mysqldump_cmd(kind, db_name, coordinates=False):
+    cmd = ['mysqldump', f'-u{MYSQL_USER}', f'-h{MYSQL_HOST}', '--databases', db_name] + MYSQLDUMP_OPTIONS
+    if kind == KIND_INCREMENTAL or coordinates:
+        # Coordenadas del binlog como comentario CHANGE MASTER (referencia PITR)
+        cmd.insert(cmd.index('--single-transaction'), '--master-data=2')
+    return cmd
+
+
+def dump_database(kind, db_name, fecha, pool, compress_threads, codec=None, level=None,
+                  table_index=BACKUP_TABLE_INDEX, throttle=None, coordinates=False):
+    """Vuelca una base a un archivo temporal y lo renombra al terminar bien.
+
+    El backup incremental (base de PITR) se guarda siempre sin comprimir.
+    En la misma pasada se calcula el SHA-256 del SQL y se busca la línea
+    "-- Dump completed"; el resultado queda en <backup>.meta.json. Con
+    table_index (gzip o sin comprimir) cada tabla empieza un bloque nuevo y sus
+    offsets quedan en <backup>.tables.json. throttle (LoadGovernor) limita los
+    MB/s leídos de mysqldump. coordinates agrega --master-data=2 a los
+    históricos (el incremental lo lleva siempre).
+    Devuelve un dict con estado, duración y bytes (sin comprimir / escritos).
+    """
+    codec = CODECS['none'] if kind == KIND_INCREMENTAL else codec or CODECS['gzip']
+    path = backup_path(kind, db_name, fecha, codec)
+    partial = path.with_name(f'.{path.name}.partial')
+    result = {'db_name': db_name, 'path': str(path), 'started_at': time.time()}
+    started = time.monotonic()
+    print(f'Iniciando backup de: {db_name} en {path}', flush=True)
+
+    proc = subprocess.Popen(mysqldump_cmd(kind, db_name, coordinates), stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, env=mysql_client_env())
+    stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+    collector = threading.Thread(target=_collect_tail, args=(proc.stderr, stderr_tail), daemon=True)
+    collector.start()
+
+    digest = DumpDigest()
+    indexer = None
+    write_error = None
+    try:
+        with open(partial, 'wb') as out:
+            writer = codec.writer(out, pool, compress_threads, level or codec_level(codec))
+            if table_index and supports_index(writer):
+                writer = indexer = SectionIndexer(writer)
+            for data in iter(lambda: proc.stdout.read1(READ_SIZE), b''):
+                if throttle is not None:
+                    throttle.consume(len(data))
+                digest.update(data)
+                writer.write(data)
+            writer.close()
+    except Exception as e:
+        proc.kill()
+        write_error = str(e)
+    finally:
+        proc.wait()
+        collector.join()
+        proc.stdout.close()
+
+    result['seconds'] = max(time.monotonic() - started, 0.001)
+    record_command(['mysqldump'], result['seconds'], proc.returncode)
+    result['bytes_raw'] = digest.bytes_raw
+    stderr = b''.join(stderr_tail).decode('utf-8', errors='replace').strip()
+    if write_error or proc.returncode != 0:
+        partial.unlink(missing_ok=True)
+        result['status'] = 'error'
+        result['error'] = write_error or stderr or f'mysqldump terminó con código {proc.returncode}'
+        return result
+
+    # El .meta.json se escribe antes del rename: un backup visible nunca queda
+    # con el sidecar de la corrida anterior
+    meta = build_sidecar(digest, codec, partial.stat().st_size, result['started_at'])
+    try:
+        write_sidecar(path, meta)
+    except OSError as e:
+        sidecar_path(path).unlink(missing_ok=True)
+        print(f'Aviso: no se pudo guardar {sidecar_path(path).name}: {e}', flush=True)
+    try:
+        if indexer is not None:
+            write_index(path, indexer.index(codec, meta['file_size']))
+        else:
+            index_path(path).unlink(missing_ok=True)
+    except OSError as e:
+        index_path(path).unlink(missing_ok=True)
+        print(f'Aviso: no se pudo guardar {index_path(path).name}: {e}', flush=True)
+    os.replace(partial, path)
+    if not meta['completed']:
+        print(f'Aviso: {path.name} no termina con "-- Dump completed"', flush=True)
+    result['status'] = 'success'
+    result['bytes_written'] = meta['file_size']
+    result['sha256'] = meta['sha256']
+    result['completed'] = meta['completed']
+    return result
+
+
+def dump_database_dedup(db_name, fecha, store, pool, compress_threads, throttle=None, coordinates=False):
+    """Vuelca una base al almacén deduplicado; solo se escriben los chunks nuevos.
+
+    El manifiesto se escribe como .partial y se renombra al terminar bien.
+    """
+    path = Path(DIR_DESTINO) / f'{db_name}-back_{fecha}{DEDUP_SUFFIX}'
+    partial = path.with_name(f'.{path.name}.partial')
+    result = {'db_name': db_name, 'path': str(path), 'started_at': time.time(), 'bytes_raw': 0}
+    started = time.monotonic()
+    print(f'Iniciando backup de: {db_name} en {path}', flush=True)
+
+    proc = subprocess.Popen(mysqldump_cmd(KIND_HISTORICAL, db_name, coordinates), stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, env=mysql_client_env())
+    stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+    collector = threading.Thread(target=_collect_tail, args=(proc.stderr, stderr_tail), daemon=True)
+    collector.start()
+
+    write_error = None
+    writer = DedupWriter(store, pool, compress_threads)
+    try:
+        # Lock compartido: la limpieza de chunks no corre mientras haya backups escribiendo
+        with store.lock():
+            for data in iter(lambda: proc.stdout.read1(READ_SIZE), b''):
+                if throttle is not None:
+                    throttle.consume(len(data))
+                writer.write(data)
+            writer.close()
+            if proc.wait() == 0:
+                write_manifest(partial, writer.manifest(db_name))
+                os.replace(partial, path)
+    except Exception as e:
+        proc.kill()
+        write_error = str(e)
+    finally:
+        proc.wait()
+        collector.join()
+        proc.stdout.close()
+
+    result['seconds'] = max(time.monotonic() - started, 0.001)
+    record_command(['mysqldump'], result['seconds'], proc.returncode)
+    result['bytes_raw'] = writer.bytes_raw
+    stderr = b''.join(stderr_tail).decode('utf-8', errors='replace').strip()
+    if write_error or proc.returncode != 0:
+        partial.unlink(missing_ok=True)
+        result['status'] = 'error'
+        result['error'] = write_error or stderr or f'mysqldump terminó con código {proc.returncode}'
+        return result
+
+    result['status'] = 'success'
+    result['bytes_written'] = writer.bytes_new
+    return result
+
+
+def dump_database_chunked(db_name, fecha, chunk_workers, codec=None, level=None):
+    """Vuelca una base en formato chunked a un directorio temporal y lo renombra al terminar."""
+    path = Path(DIR_DESTINO) / f'{db_name}-back_{fecha}{CHUNKED_SUFFIX}'
+    partial = path.with_name(f'.{path.name}.partial')
+    result = {'db_name': db_name, 'path': str(path), 'started_at': time.time(), 'bytes_raw': 0}
+    started = time.monotonic()
+    print(f'Iniciando backup de: {db_name} en {path} ({chunk_workers} conexiones)', flush=True)
+
+    shutil.rmtree(partial, ignore_errors=True)
+    try:
+        manifest = dump_chunked(db_name, partial, MYSQL_HOST, MYSQL_USER, MYSQL_PASS,
+                                workers=chunk_workers, codec=codec or CODECS['gzip'],
+                                level=level or codec_level(codec or CODECS['gzip']),
+                                chunk_rows=BACKUP_CHUNK_ROWS)
+        # Igual que con los .sql.gz: una segunda corrida en el mismo minuto reemplaza el backup
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(partial, path)
+    except Exception as e:
+        shutil.rmtree(partial, ignore_errors=True)
+        result['seconds'] = max(time.monotonic() - started, 0.001)
+        result['status'] = 'error'
+        result['error'] = str(e)
+        return result
+
+    result['seconds'] = max(time.monotonic() - started, 0.001)
+    result['status'] = 'success'
+    result['bytes_raw'] = manifest['bytes_raw']
+    result['bytes_written'] = manifest['bytes_written']
+    return result
+
+
+def failed_result(db_name, error):
+    """Resultado de error para una base cuyo volcado lanzó una excepción."""
+    return {'db_name': db_name, 'started_at': time.time(), 'status': 'error', 'error': error}
+
+
+def governed(governor, fn, *args, **kwargs):
+    """Ejecuta fn dentro de un cupo de la regulación por carga (si está activa)."""
+    if governor is None:
+        return fn(*args, **kwargs)
+    with governor.slot():
+        return fn(*args, **kwargs)
+
+
+def describe_result(result):
+    mb = result['bytes_raw'] / (1024 * 1024)
+    written = result['bytes_written'] / (1024 * 1024)
+    return (f"{mb:.1f} MB en {result['seconds']:.1f} s, {mb / result['seconds']:.1f} MB/s"
+            f", {written:.1f} MB {'nuevos en el almacén' if result['path'].endswith(DEDUP_SUFFIX) else 'en disco'}")
+
+
+def database_sizes(meta):
+    """Tamaño estimado (datos + índices) por base según information_schema."""
+    try:
+        rows = meta.query(
+            'SELECT table_schema, COALESCE(SUM(data_length + index_length), 0) '
+            'FROM information_schema.tables GROUP BY table_schema'
+        )
+    except Exception as e:
+        print(f'Aviso: no se pudo estimar el tamaño de las bases ({e}); se respeta el orden alfabético')
+        return {}
+    return {row[0]: int(float(row[1] or 0)) for row in rows}
+
+
+def plan_databases(meta, only=None):
+    """Bases a respaldar (sin las excluidas), de mayor a menor tamaño estimado."""
+    databases = [
+        db for db in meta.databases()
+        if db.strip().lower() not in EXCLUDE_DB and (not only or db in only)
+    ]
+    sizes = database_sizes(meta)
+    return sorted(databases, key=lambda db: (-sizes.get(db, 0), db)), sizes
+
+
+def binlog_enabled(meta):
+    """True si el servidor escribe binlog (sin él mysqldump --master-data falla)."""
+    try:
+        return str(meta.variable('log_bin') or '').upper() in ('ON', '1')
+    except Exception as e:
+        print(f'Aviso: no se pudo consultar log_bin ({e}); los históricos no registran coordenadas de binlog')
+        return False
+
+
+def run_backups(kind, workers=BACKUP_WORKERS, compress_threads=BACKUP_COMPRESS_THREADS, only=None,
+                backup_format=FORMAT_SQL, chunk_workers=BACKUP_CHUNK_WORKERS, codec=None, level=None,
+                throttle=BACKUP_THROTTLE):
+    """Respalda todas las bases en paralelo; devuelve la lista de resultados.
+
+    Con throttle, un LoadGovernor ajusta durante la corrida cuántas bases se
+    vuelcan a la vez (hasta workers) y los MB/s leídos de mysqldump; en formato
+    chunked solo se regula la cantidad de bases.
+    """
+    meta = ServerMetadata(MYSQL_HOST, MYSQL_USER, MYSQL_PASS, pool_size=1)
+    databases, sizes = plan_databases(meta, only)
+    fecha = datetime.now().strftime(FECHA_FORMAT)
+    run_id = uuid.uuid4().hex
+    Path(DIR_DESTINO_INC if kind == KIND_INCREMENTAL else DIR_DESTINO).mkdir(parents=True, exist_ok=True)
+
+    try:
+        catalog = BackupCatalog(CATALOG_PATH)
+    except Exception as e:
+        print(f'Aviso: no se pudo abrir el catálogo ({e}); no se registrarán las duraciones')
+        catalog = None
+
+    codec = codec or CODECS['gzip']
+    print(f'{len(databases)} bases a respaldar con {workers} en paralelo '
+          f'({compress_threads} hilos de compresión, {codec.name})', flush=True)
+    coordinates = BACKUP_BINLOG_COORDINATES and binlog_enabled(meta)
+    governor = LoadGovernor(meta, workers) if throttle else None
+    if governor is not None:
+        governor.start()
+    results = []
+    try:
+        with ThreadPoolExecutor(max_workers=compress_threads, thread_name_prefix='compress') as pool, \
+                ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='dump') as dumps:
+            # El executor toma las tareas en orden: las bases grandes arrancan primero
+            if backup_format == FORMAT_CHUNKED:
+                futures = {
+                    dumps.submit(governed, governor, dump_database_chunked, db_name, fecha, chunk_workers,
+                                 codec, level): db_name
+                    for db_name in databases
+                }
+            elif backup_format == FORMAT_DEDUP:
+                store = DedupStore(DEDUP_STORE_DIR)
+                futures = {
+                    dumps.submit(governed, governor, dump_database_dedup, db_name, fecha, store, pool,
+                                 compress_threads, throttle=governor, coordinates=coordinates): db_name
+                    for db_name in databases
+                }
+            else:
+                futures = {
+                    dumps.submit(governed, governor, dump_database, kind, db_name, fecha, pool, compress_threads,
+                                 codec, level, throttle=governor, coordinates=coordinates): db_name
+                    for db_name in databases
+                }
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # Un fallo inesperado de una base no corta la corrida ni el registro del resto
+                    result = failed_result(futures[future], f'{type(e).__name__}: {e}')
+                result['estimated_bytes'] = sizes.get(result['db_name'])
+                results.append(result)
+                if result['status'] == 'success':
+                    print(f" [OK] Backup completado: {result['path']} ({describe_result(result)})", flush=True)
+                else:
+                    print(f" [ERROR] Falló el backup de: {result['db_name']}: {result['error']}", flush=True)
+                if catalog is not None:
+                    try:
+                        catalog.record_run(run_id, kind, result)
+                    except Exception as e:
+                        print(f'Aviso: no se pudo registrar el resultado en el catálogo: {e}')
+    finally:
+        if governor is not None:
+            governor.stop()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Backup MySQL por base de datos en paralelo')
+    parser.add_argument('kind', choices=[KIND_HISTORICAL, KIND_INCREMENTAL],
+                        help='historical: .sql[.gz|.zst] con fecha en DIR_DESTINO; '
+                             'incremental: .sql con coordenadas de binlog en DIR_DESTINO_INC')
+    parser.add_argument('--workers', type=int, default=BACKUP_WORKERS,
+                        help='bases que se vuelcan en simultáneo')
+    parser.add_argument('--compress-threads', type=int, default=BACKUP_COMPRESS_THREADS,
+                        help='hilos de compresión compartidos (gzip) o por base (zstd)')
+    parser.add_argument('--codec', choices=list(CODECS), default=None,
+                        help='compresión de los backups historical (por defecto BACKUP_CODEC)')
+    parser.add_argument('--level', type=int, default=None,
+                        help='nivel del códec (por defecto BACKUP_GZIP_LEVEL / BACKUP_ZSTD_LEVEL)')
+    parser.add_argument('--databases', default='',
+                        help='lista separada por comas para respaldar solo esas bases')
+    parser.add_argument('--format', choices=[FORMAT_SQL, FORMAT_CHUNKED, FORMAT_DEDUP],
+                        help='chunked: directorio por base con archivos por tabla; dedup: chunks sin '
+                             'repetir en DEDUP_STORE_DIR (solo historical, por defecto BACKUP_FORMAT)')
+    parser.add_argument('--chunk-workers', type=int, default=BACKUP_CHUNK_WORKERS,
+                        help='conexiones en paralelo por base en formato chunked')
+    parser.add_argument('--throttle', action=argparse.BooleanOptionalAction, default=BACKUP_THROTTLE,
+                        help='ajustar bases en simultáneo y MB/s según la carga del servidor '
+                             '(por defecto BACKUP_THROTTLE)')
+    args = parser.parse_args(argv)
+    if args.format in (FORMAT_CHUNKED, FORMAT_DEDUP) and args.kind != KIND_HISTORICAL:
+        parser.error(f'el formato {args.format} solo aplica a backups historical')
+    # El backup base de PITR (incremental) siempre es un .sql
+    backup_format = args.format or (BACKUP_FORMAT if args.kind == KIND_HISTORICAL else FORMAT_SQL)
+    try:
+        codec = get_codec(args.codec or BACKUP_CODEC)
+    except CodecError as e:
+        parser.error(str(e))
+
+    only = {db.strip() for db in args.databases.split(',') if db.strip()}
+    started = time.monotonic()
+    results = run_backups(args.kind, workers=args.workers,
+                          compress_threads=max(1, args.compress_threads), only=only,
+                          backup_format=backup_format, chunk_workers=max(1, args.chunk_workers),
+                          codec=codec, level=args.level, throttle=args.throttle)
+    failed = [r for r in results if r['status'] != 'success']
+    print(f'Proceso finalizado: {len(results) - len(failed)} OK, {len(failed)} con error, '
+          f'{time.monotonic() - started:.1f} s en total.')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
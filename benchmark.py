@@ -0,0 +1,748 @@
+#!/usr/bin/env python3
+"""
+Benchmark sin servidores: árbol de backups sintético y clientes de reemplazo
+Genera en un directorio de trabajo miles de <base>-back_<fecha>.sql.gz, backups
+incrementales .sql grandes, carpetas backup_* de MongoDB con muchas colecciones
+y binlogs v4, más un bin/ con mysql, mysqldump, mysqlbinlog, mongorestore y
+mysqladmin de reemplazo que leen o escriben datos a BENCH_STUB_MB_S (0 = lo
+más rápido posible). Las mediciones corren en un proceso aparte que carga la
+app con ese .env (MYSQL_BACKUP_ENV) y ese PATH: latencia de las páginas,
+velocidad del listado, MB/s de restauración y backup, y tiempo de limpieza.
+El resultado es un JSON para comparar versiones:
+
+    python3 benchmark.py run --output antes.json
+    python3 benchmark.py run --historical 5000 --restore-mb 512 --output despues.json
+    python3 benchmark.py compare antes.json despues.json [--fail-above 10]
+"""
+
+import argparse
+import gzip
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parent
+RESULT_VERSION = 1
+MB = 1024 * 1024
+
+FECHA_FORMAT = '%Y-%m-%d_%H-%M'
+STUB_NAME = 'bench_stub.py'
+STUB_TOOLS = ('mysql', 'mysqldump', 'mysqlbinlog', 'mongorestore', 'mysqladmin')
+DUMP_DATABASE = 'benchdump'
+RESTORE_DATABASE = 'benchrestore'
+PAGES = ('/', '/historical', '/mongodb', '/pitr')
+
+# Sufijo de la métrica -> True si más es mejor (compare); el resto se muestra sin veredicto
+DIRECTIONS = (('_mb_s', True), ('_per_s', True), ('_ms', False), ('_seconds', False))
+
+# Cliente de reemplazo: el nombre con que se lo invoca (symlink) decide qué herramienta imita
+STUB_SOURCE = '''\
+import os
+import sys
+import time
+
+RATE = float(os.environ.get('BENCH_STUB_MB_S', '0') or 0) * 1024 * 1024
+CHUNK = 1024 * 1024
+DATABASES = [db for db in os.environ.get('BENCH_DATABASES', '').split(',') if db]
+SERVER_DIR = os.environ.get('BENCH_SERVER_DIR', '/tmp')
+
+
+class Pacer:
+    """Duerme lo necesario para no superar RATE bytes/s."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.bytes = 0
+
+    def __call__(self, size):
+        self.bytes += size
+        if RATE:
+            delay = self.bytes / RATE - (time.monotonic() - self.started)
+            if delay > 0:
+                time.sleep(delay)
+
+
+def consume(stream, pace):
+    for data in iter(lambda: stream.read(CHUNK), b''):
+        pace(len(data))
+
+
+def answer(sql):
+    if 'SHOW DATABASES' in sql:
+        return [[db] for db in ['information_schema', 'mysql', 'sys'] + DATABASES]
+    if 'information_schema.tables' in sql:
+        return [[db, str(64 * 1024 * 1024)] for db in DATABASES]
+    if 'binlog_format' in sql:
+        return [['ROW']]
+    if 'log_bin_basename' in sql:
+        return [['log_bin_basename', os.path.join(SERVER_DIR, 'mysql-bin')]]
+    if 'datadir' in sql:
+        return [['datadir', SERVER_DIR + '/']]
+    return []
+
+
+def mysql(args):
+    if '-e' in args:
+        for row in answer(args[args.index('-e') + 1]):
+            print('\\t'.join(row))
+        return 0
+    consume(sys.stdin.buffer, Pacer())
+    return 0
+
+
+def mysqldump(args):
+    total = int(float(os.environ.get('BENCH_DUMP_MB', '64')) * 1024 * 1024)
+    db_name = args[args.index('--databases') + 1] if '--databases' in args else 'bench'
+    out = sys.stdout.buffer
+    pace = Pacer()
+    out.write(f'-- MySQL dump (benchmark)\\nCREATE DATABASE `{db_name}`;\\nUSE `{db_name}`;\\n'.encode())
+    written = 0
+    batch = 0
+    while written < total:
+        noise = os.urandom(100 * 16).hex().encode()
+        values = b','.join(b"(%d,'%s','pedido',%d.50)" % (batch * 100 + i, noise[i * 32:(i + 1) * 32], i * 7)
+                           for i in range(100))
+        data = b'INSERT INTO `t` VALUES ' + values + b';\\n'
+        out.write(data)
+        pace(len(data))
+        written += len(data)
+        batch += 1
+    out.write(b'-- Dump completed on 2024-01-01  0:00:00\\n')
+    return 0
+
+
+def mysqlbinlog(args):
+    paths = [arg for arg in args if arg == '-' or not arg.startswith('-')]
+    out = sys.stdout.buffer
+    pace = Pacer()
+    for path in paths:
+        stream = sys.stdin.buffer if path == '-' else open(path, 'rb')
+        with stream:
+            for data in iter(lambda: stream.read(CHUNK), b''):
+                out.write(data)
+                pace(len(data))
+    return 0
+
+
+def mongorestore(args):
+    paths = [arg.split('=', 1)[1] for arg in args if arg.startswith('--archive=')]
+    paths += [arg for arg in args if not arg.startswith('-') and os.path.exists(arg)]
+    pace = Pacer()
+    documents = 0
+    for path in paths:
+        files = [path] if os.path.isfile(path) else [
+            os.path.join(root, name) for root, _, names in os.walk(path) for name in names
+        ]
+        for name in files:
+            with open(name, 'rb') as stream:
+                consume(stream, pace)
+            if name.endswith('.bson'):
+                documents += 1
+    print(f'{documents} document(s) restored successfully. 0 document(s) failed to restore.', file=sys.stderr)
+    return 0
+
+
+TOOLS = {'mysql': mysql, 'mysqldump': mysqldump, 'mysqlbinlog': mysqlbinlog,
+         'mongorestore': mongorestore, 'mysqladmin': lambda args: 0}
+
+if __name__ == '__main__':
+    sys.exit(TOOLS[os.path.basename(sys.argv[0])](sys.argv[1:]))
+'''
+
+
+# --- Árbol sintético ---
+
+WORDS = ('alfa', 'bravo', 'cliente', 'pedido', 'factura', 'stock', 'envío', 'proveedor', 'caja', 'remito')
+
+
+def sql_block(rng, rows=400):
+    """Bloque de INSERTs con datos variados (la compresión no es trivial)."""
+    values = ','.join(
+        f"({rng.randrange(10 ** 9)},'{rng.getrandbits(128):032x}','{rng.choice(WORDS)} {rng.choice(WORDS)}',"
+        f"{rng.random() * 10000:.2f},'2024-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}')"
+        for _ in range(rows)
+    )
+    return f'INSERT INTO `pedidos` VALUES {values};\n'.encode()
+
+
+def write_sql(out, size, seed, header=b''):
+    """Escribe unos `size` bytes de SQL en out; devuelve los bytes escritos."""
+    rng = random.Random(seed)
+    blocks = [sql_block(rng) for _ in range(32)]
+    out.write(header)
+    written = len(header)
+    while written < size:
+        data = blocks[rng.randrange(len(blocks))]
+        out.write(data)
+        written += len(data)
+    footer = b'-- Dump completed on 2024-01-01  0:00:00\n'
+    out.write(footer)
+    return written + len(footer)
+
+
+def set_mtime(path, moment):
+    os.utime(path, (moment, moment))
+
+
+def generate_historical(directory, count, databases, now):
+    """count backups chicos repartidos entre las bases, uno por día desde ayer hacia atrás."""
+    names = [f'db{i:03d}' for i in range(databases)]
+    rng = random.Random(1)
+    block = sql_block(rng, rows=20)
+    total = 0
+    for i in range(count):
+        db_name = names[i % databases]
+        moment = (now - timedelta(days=i // databases + 1)).replace(hour=23, minute=i % 60)
+        path = directory / f'{db_name}-back_{moment.strftime(FECHA_FORMAT)}.sql.gz'
+        payload = b'USE `%s`;\n' % db_name.encode() + block + b'-- Dump completed on 2024-01-01  0:00:00\n'
+        path.write_bytes(gzip.compress(payload, compresslevel=1))
+        set_mtime(path, moment.timestamp())
+        total += path.stat().st_size
+    return names, total
+
+
+def generate_restore_target(directory, size_mb, now):
+    """Un backup histórico grande en gzip por bloques (el formato que escribe backup_runner)."""
+    from backup_codecs import BlockGzipWriter
+
+    path = directory / f'{RESTORE_DATABASE}-back_{now.strftime(FECHA_FORMAT)}.sql.gz'
+    threads = os.cpu_count() or 1
+    with open(path, 'wb') as out, ThreadPoolExecutor(max_workers=threads) as pool:
+        writer = BlockGzipWriter(out, pool, threads, level=1)
+        raw = write_sql(writer, size_mb * MB, 2, f'USE `{RESTORE_DATABASE}`;\n'.encode())
+        writer.close()
+    return path, raw
+
+
+def generate_incremental(directory, count, size_mb, now):
+    paths = []
+    for i in range(count):
+        path = directory / f'inc{i:02d}-back.sql'
+        header = (f"-- CHANGE MASTER TO MASTER_LOG_FILE='mysql-bin.000001', MASTER_LOG_POS=4;\n"
+                  f'USE `inc{i:02d}`;\n').encode()
+        with open(path, 'wb') as out:
+            write_sql(out, size_mb * MB, 10 + i, header)
+        set_mtime(path, now.timestamp())
+        paths.append(path)
+    return paths
+
+
+def generate_mongo(directory, count, collections, now):
+    """Carpetas backup_<fecha>/<base>/<colección>.bson + .metadata.json, una por día hacia atrás."""
+    document = os.urandom(4096)
+    per_db = max(1, collections // 4)
+    total = 0
+    for i in range(count):
+        moment = (now - timedelta(days=i + 1)).replace(hour=23, minute=20)
+        backup = directory / f'backup_{moment.strftime(FECHA_FORMAT)}'
+        for c in range(collections):
+            db_dir = backup / f'mongo{c // per_db}'
+            db_dir.mkdir(parents=True, exist_ok=True)
+            (db_dir / f'col{c:04d}.bson').write_bytes(document)
+            (db_dir / f'col{c:04d}.metadata.json').write_text('{"indexes": [], "uuid": ""}')
+            total += len(document)
+        for root, dirs, files in os.walk(backup, topdown=False):
+            for name in files + dirs:
+                set_mtime(os.path.join(root, name), moment.timestamp())
+        set_mtime(backup, moment.timestamp())
+    return total
+
+
+def binlog_event(timestamp, code, body, position):
+    size = 19 + len(body) + 4
+    header = struct.pack('<IBIIIH', timestamp, code, 1, size, position + size, 0)
+    return header + body + b'\0\0\0\0'
+
+
+def format_description(timestamp):
+    post_header = bytes([56, 13, 0, 8, 0, 18, 0, 4, 4, 4, 4, 18, 0, 0, 0, 0, 0, 0, 8, 0, 10, 10, 10, 0, 0,
+                         0, 0, 0, 0, 0, 0, 0, 42, 42, 0, 18, 52, 0, 1, 0])
+    return (struct.pack('<H', 4) + b'8.0.36'.ljust(50, b'\0') + struct.pack('<I', timestamp) + bytes([19])
+            + post_header + b'\x01')
+
+
+def write_binlog(path, start, size, sequence, databases, payload=8192):
+    """Binlog v4 con transacciones de filas (GTID anónimo, BEGIN, TABLE_MAP, WRITE_ROWS, XID)."""
+    out = bytearray(b'\xfebin')
+    rows = b'x' * payload
+
+    def add(timestamp, code, body):
+        out.extend(binlog_event(timestamp, code, body, len(out)))
+
+    add(start, 15, format_description(start))
+    add(start, 35, b'\0' * 8)
+    transaction = 0
+    while len(out) < size:
+        timestamp = start + transaction // 10
+        db_name = databases[transaction % len(databases)].encode()
+        table_id = (100 + transaction).to_bytes(6, 'little')
+        status = b'\0' * 5
+        add(timestamp, 34, b'\0' * 42)
+        add(timestamp, 2, struct.pack('<IIBHH', 1, 0, len(db_name), 0, len(status)) + status + db_name
+            + b'\0BEGIN')
+        add(timestamp, 19, table_id + b'\1\0' + bytes([len(db_name)]) + db_name + b'\0\x07pedidos\0\1\3\0\0')
+        add(timestamp, 30, table_id + b'\1\0\2\0\1\x01\xff' + rows)
+        add(timestamp, 16, struct.pack('<Q', transaction))
+        transaction += 1
+    add(start + transaction // 10, 4, struct.pack('<Q', 4) + f'mysql-bin.{sequence + 1:06d}'.encode())
+    path.write_bytes(bytes(out))
+    set_mtime(path, start + transaction // 10)
+
+
+def generate_binlogs(directory, count, size_mb, databases, now):
+    start = int(now.timestamp()) - (count + 1) * 600
+    paths = []
+    for i in range(count):
+        path = directory / f'mysql-bin.{i + 1:06d}'
+        write_binlog(path, start + i * 600, size_mb * MB, i + 1, databases[:4])
+        paths.append(path)
+    return paths
+
+
+def write_stubs(bin_dir):
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    stub = bin_dir / STUB_NAME
+    stub.write_text(f'#!{sys.executable}\n' + STUB_SOURCE)
+    stub.chmod(0o755)
+    for tool in STUB_TOOLS:
+        (bin_dir / tool).symlink_to(STUB_NAME)
+
+
+def write_env(workspace, layout, args):
+    values = {
+        'MYSQL_USER': 'bench',
+        'MYSQL_PASS': 'bench',
+        'MYSQL_HOST': '127.0.0.1',
+        'DIR_DESTINO': layout['historical'],
+        'DIR_DESTINO_INC': layout['incremental'],
+        'BINLOG_BACKUP_DIR': layout['binlogs'],
+        'DESTINO': layout['mongo'],
+        'HORA_INICIO': '00:00:00',
+        'CATALOG_PATH': workspace / 'catalog.sqlite3',
+        'JOB_LOCK_DIR': workspace / 'jobs',
+        'METRICS_DIR': workspace / 'metrics',
+        'RETENTION_BATCH_PAUSE': args.cleanup_pause,
+        'RETENTION_MAX_MB_S': args.cleanup_mb_s,
+        'BACKUP_TABLE_INDEX': '0',
+    }
+    path = workspace / 'bench.env'
+    path.write_text(''.join(f'{key}="{value}"\n' for key, value in values.items()))
+    return path
+
+
+def generate_tree(workspace, args):
+    """Arma el árbol sintético; devuelve (layout, resumen del árbol)."""
+    now = datetime.now().replace(second=0, microsecond=0)
+    data = workspace / 'data'
+    layout = {
+        'historical': data / 'mysql',
+        'incremental': data / 'mysql' / 'incremental',
+        'binlogs': data / 'mysql' / 'binlogs',
+        'mongo': data / 'mongo',
+        'server': workspace / 'server',
+    }
+    for directory in layout.values():
+        directory.mkdir(parents=True, exist_ok=True)
+
+    started = time.monotonic()
+    databases, historical_bytes = generate_historical(layout['historical'], args.historical, args.databases, now)
+    restore_path, restore_raw = generate_restore_target(layout['historical'], args.restore_mb, now)
+    incremental = generate_incremental(layout['incremental'], args.incremental, args.incremental_mb, now)
+    mongo_bytes = generate_mongo(layout['mongo'], args.mongo_backups, args.collections, now)
+    binlogs = generate_binlogs(layout['binlogs'], args.binlogs, args.binlog_mb, databases, now)
+    tree = {
+        'historical_files': args.historical + 1,
+        'historical_bytes': historical_bytes + restore_path.stat().st_size,
+        'databases': args.databases,
+        'restore_file': restore_path.name,
+        'restore_raw_bytes': restore_raw,
+        'restore_file_bytes': restore_path.stat().st_size,
+        'incremental_files': [path.name for path in incremental],
+        'incremental_bytes': sum(path.stat().st_size for path in incremental),
+        'mongo_backups': args.mongo_backups,
+        'mongo_collections': args.collections,
+        'mongo_bytes': mongo_bytes,
+        'binlog_files': [path.name for path in binlogs],
+        'binlog_bytes': sum(path.stat().st_size for path in binlogs),
+        'generate_seconds': round(time.monotonic() - started, 3),
+    }
+    return layout, databases, tree
+
+
+# --- Mediciones (proceso hijo) ---
+
+def latency_summary(samples):
+    ordered = sorted(samples)
+    return {
+        'p50_ms': round(statistics.median(ordered) * 1000, 2),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+        'max_ms': round(ordered[-1] * 1000, 2),
+    }
+
+
+def timed(fn, *args, **kwargs):
+    started = time.monotonic()
+    result = fn(*args, **kwargs)
+    return result, max(time.monotonic() - started, 1e-6)
+
+
+def throughput(nbytes, seconds):
+    return {'bytes': nbytes, 'seconds': round(seconds, 3), 'mb_s': round(nbytes / seconds / MB, 2)}
+
+
+def get_ok(client, url, **kwargs):
+    response = client.get(url, **kwargs)
+    if response.status_code not in (200, 304):
+        raise RuntimeError(f'GET {url}: {response.status_code}')
+    return response
+
+
+def wait_job(client, job_id, timeout=3600):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = get_ok(client, f'/api/jobs/{job_id}').get_json()['job']
+        if job['status'] not in ('queued', 'running'):
+            if job['status'] != 'success':
+                raise RuntimeError(f"trabajo {job_id}: {job['error'] or job['status']}")
+            return job
+        time.sleep(0.02)
+    raise RuntimeError(f'trabajo {job_id}: sin terminar tras {timeout} s')
+
+
+def run_job(client, url, payload):
+    """POST que encola un trabajo y espera a que termine; devuelve (job, segundos)."""
+    started = time.monotonic()
+    response = client.post(url, json=payload)
+    if response.status_code != 202:
+        raise RuntimeError(f'POST {url}: {response.status_code} {response.get_data(as_text=True)}')
+    job = wait_job(client, response.get_json()['job_id'])
+    return job, max(time.monotonic() - started, 1e-6)
+
+
+def measure_pages(web, client, repeat):
+    """La primera pasada encuentra el catálogo vacío (arranque en frío); después se repite."""
+    results = {}
+    for url in PAGES:
+        _, cold = timed(get_ok, client, url)
+        samples = [timed(get_ok, client, url)[1] for _ in range(repeat)]
+        results[url] = {'cold_ms': round(cold * 1000, 2), **latency_summary(samples)}
+    return results
+
+
+def measure_listing(web, client, repeat, workspace):
+    from catalog import BackupCatalog
+
+    results = {}
+    sources = (
+        (web.SOURCE_HISTORICAL, web.DIR_DESTINO, web.parse_historical_entry, False),
+        (web.SOURCE_INCREMENTAL, web.DIR_DESTINO_INC, web.parse_incremental_entry, True),
+        (web.SOURCE_MONGO, web.MONGO_BACKUP_DEST, web.parse_mongo_entry, False),
+        (web.SOURCE_BINLOG, web.BINLOG_BACKUP_DIR, web.parse_binlog_entry, True),
+    )
+    # Escaneo completo sobre un catálogo nuevo y re-escaneo sin cambios sobre el mismo
+    catalog = BackupCatalog(str(workspace / 'cold-catalog.sqlite3'), settle_seconds=web.CATALOG_SETTLE_SECONDS)
+    for source, directory, parse_entry, volatile in sources:
+        _, cold = timed(catalog.refresh, source, directory, parse_entry, volatile=volatile)
+        files = catalog.summary(source, directory)[0]
+        warm = [timed(catalog.refresh, source, directory, parse_entry, volatile=volatile)[1]
+                for _ in range(repeat)]
+        results[f'scan_{source}'] = {
+            'files': files,
+            'cold_seconds': round(cold, 4),
+            'files_per_s': round(files / cold, 1),
+            'rescan_ms': round(statistics.median(warm) * 1000, 2),
+        }
+
+    rows = pages = 0
+    cursor = None
+    started = time.monotonic()
+    while True:
+        url = f'/api/backups?source=historical&limit={web.BACKUPS_PAGE_MAX}'
+        body = get_ok(client, url + (f'&cursor={cursor}' if cursor else '')).get_json()
+        rows += len(body['backups'])
+        pages += 1
+        cursor = body['next_cursor']
+        if not cursor:
+            break
+    seconds = max(time.monotonic() - started, 1e-6)
+    results['api_backups_full'] = {'rows': rows, 'pages': pages, 'seconds': round(seconds, 4),
+                                   'rows_per_s': round(rows / seconds, 1)}
+
+    first = f'/api/backups?source=historical&limit={web.BACKUPS_PAGE_SIZE}'
+    etag = get_ok(client, first).headers.get('ETag', '').strip('"')
+    results['api_backups_first_page'] = latency_summary([timed(get_ok, client, first)[1] for _ in range(repeat)])
+    results['api_backups_filtered'] = latency_summary([
+        timed(get_ok, client, first + '&q=db00&sort=size')[1] for _ in range(repeat)
+    ])
+    results['api_backups_not_modified'] = latency_summary([
+        timed(get_ok, client, first, headers={'If-None-Match': f'"{etag}"'})[1] for _ in range(repeat)
+    ])
+    return results
+
+
+def measure_restore(web, tree):
+    from config import mysql_client_env
+    from restore_pipeline import pipe_processes, restore_file
+
+    results = {}
+    historical = Path(web.DIR_DESTINO) / tree['restore_file']
+    stats, seconds = timed(restore_file, historical, web.mysql_client_cmd(), env=mysql_client_env(),
+                           threads=web.RESTORE_DECOMPRESS_THREADS)
+    results['historical_gzip'] = {**throughput(stats['bytes_out'], seconds),
+                                  'threads': web.RESTORE_DECOMPRESS_THREADS,
+                                  'file_mb_s': round(tree['restore_file_bytes'] / seconds / MB, 2)}
+
+    incremental = Path(web.DIR_DESTINO_INC) / tree['incremental_files'][0]
+    stats, seconds = timed(restore_file, incremental, web.mysql_client_cmd(), env=mysql_client_env())
+    results['incremental_sql'] = throughput(stats['bytes_out'], seconds)
+
+    binlogs = [str(Path(web.BINLOG_BACKUP_DIR) / name) for name in tree['binlog_files']]
+    stats, seconds = timed(pipe_processes, ['mysqlbinlog', *binlogs], web.mysql_client_cmd(),
+                           env=mysql_client_env())
+    results['binlog_replay'] = throughput(stats['bytes_out'], seconds)
+
+    mongo = sorted(Path(web.MONGO_BACKUP_DEST).glob('backup_*'))[-1]
+    result, seconds = timed(web.run_command, web.build_mongorestore_base_cmd() + ['--drop', str(mongo)],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f'mongorestore: {result.stderr}')
+    mongo_bytes = sum(path.stat().st_size for path in mongo.rglob('*') if path.is_file())
+    results['mongo_full'] = {**throughput(mongo_bytes, seconds), 'collections': tree['mongo_collections']}
+    return results
+
+
+def measure_backup():
+    import backup_runner
+
+    results = backup_runner.run_backups(backup_runner.KIND_HISTORICAL, workers=1, only=[DUMP_DATABASE],
+                                        throttle=False)
+    if not results or results[0]['status'] != 'success':
+        raise RuntimeError(f'backup: {results[0].get("error") if results else "sin resultados"}')
+    result = results[0]
+    return {
+        'historical_gzip': {
+            **throughput(result['bytes_raw'], result['seconds']),
+            'bytes_written': result['bytes_written'],
+            'threads': backup_runner.BACKUP_COMPRESS_THREADS,
+            'level': backup_runner.BACKUP_GZIP_LEVEL,
+        }
+    }
+
+
+def measure_cleanup(web, client):
+    """Limpieza real por la API (trabajos en segundo plano) sobre el árbol ya medido."""
+    results = {}
+    job, seconds = run_job(client, '/api/retention/apply', {'backup_type': 'mysql_historical', 'confirm': 'SI'})
+    removed = len(job['details'] or [])
+    results['mysql_gfs'] = {'backups_removed': removed, 'seconds': round(seconds, 3),
+                            'backups_per_s': round(removed / seconds, 1)}
+    job, seconds = run_job(client, '/api/cleanup/backups',
+                           {'backup_type': 'mongo_historical', 'days': 7, 'confirm': 'SI'})
+    removed = len(job['details'] or [])
+    results['mongo_age'] = {'backups_removed': removed, 'seconds': round(seconds, 3),
+                            'backups_per_s': round(removed / seconds, 1)}
+    return results
+
+
+def worker(workspace, repeat):
+    """Proceso hijo: la app ya lee bench.env (MYSQL_BACKUP_ENV) y el PATH apunta a los reemplazos."""
+    import mysql_meta
+
+    # Metadatos por el cliente mysql de reemplazo aunque PyMySQL esté instalado
+    mysql_meta.pymysql = None
+    import app as web
+
+    workspace = Path(workspace)
+    tree = json.loads((workspace / 'tree.json').read_text())
+    tree.pop('database_names')
+    client = web.app.test_client()
+    results = {}
+    results['pages'] = measure_pages(web, client, repeat)
+    results['listing'] = measure_listing(web, client, repeat, workspace)
+    results['restore'] = measure_restore(web, tree)
+    results['backup'] = measure_backup()
+    results['cleanup'] = measure_cleanup(web, client)
+    (workspace / 'results.json').write_text(json.dumps(results))
+
+
+# --- Orquestación y comparación ---
+
+def git_revision():
+    try:
+        result = subprocess.run(['git', '-C', str(BASE_DIR), 'describe', '--always', '--dirty'],
+                                capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def run(args):
+    if args.workdir:
+        Path(args.workdir).mkdir(parents=True, exist_ok=True)
+    workspace = Path(tempfile.mkdtemp(prefix='mysql_backup_bench_', dir=args.workdir))
+    try:
+        print(f'Generando árbol sintético en {workspace}...', file=sys.stderr, flush=True)
+        layout, databases, tree = generate_tree(workspace, args)
+        write_stubs(workspace / 'bin')
+        env_path = write_env(workspace, layout, args)
+        (workspace / 'tree.json').write_text(json.dumps({**tree, 'database_names': databases}))
+        print(f"Árbol listo en {tree['generate_seconds']} s; midiendo...", file=sys.stderr, flush=True)
+
+        child_env = {
+            **os.environ,
+            'MYSQL_BACKUP_ENV': str(env_path),
+            'PATH': f"{workspace / 'bin'}{os.pathsep}{os.environ.get('PATH', '')}",
+            'BENCH_STUB_MB_S': str(args.rate),
+            'BENCH_DUMP_MB': str(args.dump_mb),
+            'BENCH_DATABASES': ','.join(databases + [DUMP_DATABASE, RESTORE_DATABASE]),
+            'BENCH_SERVER_DIR': str(layout['server']),
+        }
+        # La salida de la app va a stderr: stdout queda para el JSON
+        proc = subprocess.run([sys.executable, str(Path(__file__).resolve()), 'worker', str(workspace),
+                               '--repeat', str(args.repeat)],
+                              cwd=BASE_DIR, env=child_env, stdout=sys.stderr)
+        if proc.returncode != 0:
+            print(f'Error: la medición terminó con código {proc.returncode}', file=sys.stderr)
+            return 1
+        results = json.loads((workspace / 'results.json').read_text())
+    finally:
+        if args.keep:
+            print(f'Árbol conservado en {workspace}', file=sys.stderr)
+        else:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    report = {
+        'version': RESULT_VERSION,
+        'meta': {
+            'revision': git_revision(),
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'params': {key: value for key, value in vars(args).items() if key not in ('command', 'output', 'workdir')},
+        'tree': tree,
+        'results': results,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(text + '\n')
+        print(f'Resultados guardados en {args.output}', file=sys.stderr)
+    else:
+        print(text)
+    return 0
+
+
+def flatten(values, prefix=''):
+    flat = {}
+    for key, value in values.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def direction(metric):
+    leaf = metric.rsplit('.', 1)[-1]
+    for suffix, higher_is_better in DIRECTIONS:
+        if leaf.endswith(suffix) or leaf == suffix[1:]:
+            return higher_is_better
+    return None
+
+
+def compare(args):
+    old, new = (json.loads(Path(path).read_text()) for path in (args.old, args.new))
+    before, after = flatten(old['results']), flatten(new['results'])
+    if old.get('params') != new.get('params'):
+        print('Aviso: las corridas usan parámetros distintos', file=sys.stderr)
+    print(f"{'métrica':<52} {'antes':>12} {'después':>12} {'cambio':>9}")
+    regressions = []
+    for metric in sorted(before.keys() & after.keys()):
+        higher_is_better = direction(metric)
+        a, b = before[metric], after[metric]
+        change = (b - a) * 100 / a if a else 0.0
+        verdict = ''
+        if higher_is_better is not None and abs(change) >= args.threshold:
+            better = change > 0 if higher_is_better else change < 0
+            verdict = 'mejor' if better else 'peor'
+            if not better:
+                regressions.append((metric, abs(change)))
+        print(f'{metric:<52} {a:>12} {b:>12} {change:>+8.1f}% {verdict}')
+    for metric in sorted(before.keys() ^ after.keys()):
+        print(f'{metric:<52} (solo en {"antes" if metric in before else "después"})')
+    if args.fail_above is not None:
+        failed = [metric for metric, change in regressions if change > args.fail_above]
+        if failed:
+            print(f'{len(failed)} métricas empeoraron más de {args.fail_above}%: {", ".join(failed)}',
+                  file=sys.stderr)
+            return 1
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark sin servidores con árbol de backups sintético')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='genera el árbol, mide y emite el JSON de resultados')
+    run_parser.add_argument('--historical', type=int, default=2000, help='backups históricos chicos (.sql.gz)')
+    run_parser.add_argument('--databases', type=int, default=20, help='bases entre las que se reparten')
+    run_parser.add_argument('--restore-mb', type=int, default=128,
+                            help='SQL sin comprimir del backup histórico que se restaura')
+    run_parser.add_argument('--incremental', type=int, default=2, help='backups incrementales .sql')
+    run_parser.add_argument('--incremental-mb', type=int, default=64, help='tamaño de cada incremental')
+    run_parser.add_argument('--mongo-backups', type=int, default=30, help='carpetas backup_* de MongoDB')
+    run_parser.add_argument('--collections', type=int, default=200, help='colecciones por backup MongoDB')
+    run_parser.add_argument('--binlogs', type=int, default=8, help='binlogs sintéticos')
+    run_parser.add_argument('--binlog-mb', type=int, default=8, help='tamaño de cada binlog')
+    run_parser.add_argument('--dump-mb', type=int, default=64, help='SQL que emite el mysqldump de reemplazo')
+    run_parser.add_argument('--rate', type=float, default=0,
+                            help='MB/s de los clientes de reemplazo (0 = sin límite)')
+    run_parser.add_argument('--repeat', type=int, default=20, help='repeticiones de cada request medido')
+    run_parser.add_argument('--cleanup-pause', type=float, default=0,
+                            help='RETENTION_BATCH_PAUSE durante la medición de limpieza')
+    run_parser.add_argument('--cleanup-mb-s', type=float, default=0,
+                            help='RETENTION_MAX_MB_S durante la medición de limpieza (0 = sin límite)')
+    run_parser.add_argument('--workdir', default=None,
+                            help='directorio donde crear el árbol (se crea si no existe; por defecto /tmp)')
+    run_parser.add_argument('--keep', action='store_true', help='no borrar el árbol al terminar')
+    run_parser.add_argument('--output', help='archivo JSON de salida (por defecto stdout)')
+
+    compare_parser = commands.add_parser('compare', help='compara dos JSON de resultados')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=5,
+                                help='%% de cambio a partir del cual se marca mejor/peor')
+    compare_parser.add_argument('--fail-above', type=float, default=None,
+                                help='salir con código 1 si alguna métrica empeora más de este %%')
+
+    worker_parser = commands.add_parser('worker', help=argparse.SUPPRESS)
+    worker_parser.add_argument('workspace')
+    worker_parser.add_argument('--repeat', type=int, default=20)
+
+    args = parser.parse_args(argv)
+    if args.command == 'worker':
+        worker(args.workspace, max(1, args.repeat))
+        return 0
+    if args.command == 'compare':
+        return compare(args)
+    if args.repeat < 1 or args.databases < 1 or args.incremental < 1 or args.mongo_backups < 1 \
+            or args.binlogs < 1 or args.collections < 1:
+        parser.error('las cantidades deben ser al menos 1')
+    return run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
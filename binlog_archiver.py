@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Archivador incremental de binlogs MySQL
+Copia a BINLOG_BACKUP_DIR solo los binlogs cerrados que todavía no figuran en
+el manifiesto (nombre, tamaño y SHA-256), los comprime en segundo plano con
+BINLOG_ARCHIVE_CODEC mientras sigue copiando, y borra los archivados que
+superan BINLOG_RETENTION_DAYS. Reemplaza el cp -u de rotate_binlogs.sh:
+
+    python3 binlog_archiver.py [--no-flush] [--verify]
+"""
+
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from backup_codecs import CODECS, CodecError, codec_for_path, get_codec
+from binlog_reader import BinlogFormatError, BinlogIndex
+from config import CATALOG_PATH, MYSQL_HOST, MYSQL_PASS, MYSQL_USER, env
+from mysql_meta import ServerMetadata
+
+BINLOG_BACKUP_DIR = env.get('BINLOG_BACKUP_DIR', '').strip() or '/mnt/backup/mysql/binlogs'
+# Códec de los binlogs archivados: zstd (.zst), gzip (.gz) o none (copia sin comprimir)
+BINLOG_ARCHIVE_CODEC = env.get('BINLOG_ARCHIVE_CODEC', 'zstd').strip() or 'zstd'
+BINLOG_ARCHIVE_LEVEL = int(env.get('BINLOG_ARCHIVE_LEVEL', '0')) or None
+BINLOG_ARCHIVE_THREADS = int(env.get('BINLOG_ARCHIVE_THREADS', '0')) or os.cpu_count() or 1
+# Días que se conservan los binlogs archivados (0 = no se borran)
+BINLOG_RETENTION_DAYS = float(env.get('BINLOG_RETENTION_DAYS', '1'))
+
+MANIFEST_NAME = 'binlog_archive.json'
+MANIFEST_VERSION = 1
+LOCK_NAME = '.binlog_archiver.lock'
+COPY_SIZE = 4 * 1024 * 1024
+
+ARCHIVE_NAME_RE = re.compile(r'(.+\.\d+)(\.gz|\.zst)?$')
+
+
+class ArchiveError(Exception):
+    """Copia o compresión fallida (tamaño o checksum distintos al origen)."""
+
+
+def sha256_file(path, codec=None):
+    """SHA-256 del contenido (descomprimido si el archivo lo está)."""
+    digest = hashlib.sha256()
+    stream = (codec or codec_for_path(path)).open_reader(path)
+    try:
+        for data in iter(lambda: stream.read(COPY_SIZE), b''):
+            digest.update(data)
+    finally:
+        stream.close()
+    return digest.hexdigest()
+
+
+class ArchiveManifest:
+    """binlog_archive.json: binlogs archivados por nombre, con tamaño, SHA-256 y archivo guardado."""
+
+    def __init__(self, archive_dir):
+        self.path = Path(archive_dir) / MANIFEST_NAME
+        self.binlogs = {}
+        self._lock = threading.Lock()
+        if self.path.exists():
+            try:
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                raise ArchiveError(f'{self.path.name}: manifiesto ilegible ({e})')
+            if data.get('version') != MANIFEST_VERSION:
+                raise ArchiveError(f'{self.path.name}: versión de manifiesto no soportada')
+            self.binlogs = data.get('binlogs', {})
+
+    def get(self, name):
+        return self.binlogs.get(name)
+
+    def update(self, name, **fields):
+        with self._lock:
+            self.binlogs.setdefault(name, {}).update(fields)
+            self._save()
+
+    def remove(self, name):
+        with self._lock:
+            self.binlogs.pop(name, None)
+            self._save()
+
+    def _save(self):
+        tmp = self.path.with_name(f'.{self.path.name}.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'binlogs': self.binlogs}, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+
+class BinlogArchiver:
+    def __init__(self, archive_dir, codec, level=None, index=None):
+        self.archive_dir = Path(archive_dir)
+        self.codec = codec
+        self.level = level
+        self.index = index
+        self.manifest = ArchiveManifest(self.archive_dir)
+        self.errors = []
+
+    def is_archived(self, name, size):
+        """Ya está en el manifiesto con el mismo tamaño y su archivo sigue en disco."""
+        entry = self.manifest.get(name)
+        return (entry is not None and entry.get('size') == size
+                and (self.archive_dir / entry.get('file', '')).is_file())
+
+    def copy(self, source):
+        """Copia un binlog cerrado calculando su SHA-256; devuelve la ruta de la copia sin comprimir."""
+        source = Path(source)
+        target = self.archive_dir / source.name
+        tmp = self.archive_dir / f'.{source.name}.tmp'
+        digest = hashlib.sha256()
+        stat = source.stat()
+        size = 0
+        try:
+            with open(source, 'rb') as src, open(tmp, 'wb') as dst:
+                for data in iter(lambda: src.read(COPY_SIZE), b''):
+                    digest.update(data)
+                    dst.write(data)
+                    size += len(data)
+            if size != stat.st_size:
+                raise ArchiveError(f'{source.name}: se copiaron {size} de {stat.st_size} bytes')
+            os.utime(tmp, (stat.st_atime, stat.st_mtime))
+            os.replace(tmp, target)
+        finally:
+            tmp.unlink(missing_ok=True)
+        self.manifest.update(source.name, size=size, sha256=digest.hexdigest(), mtime=stat.st_mtime,
+                             archived_at=time.time(), file=target.name, stored_size=size, codec='none')
+        return target
+
+    def compress(self, name):
+        """Comprime la copia de name y verifica el resultado contra el SHA-256 del manifiesto."""
+        entry = self.manifest.get(name)
+        raw = self.archive_dir / entry['file']
+        target = raw.with_name(raw.name + self.codec.extension)
+        tmp = self.archive_dir / f'.{target.name}.tmp'
+        try:
+            with open(raw, 'rb') as src, self.codec.open_file(tmp, self.level) as dst:
+                for data in iter(lambda: src.read(COPY_SIZE), b''):
+                    dst.write(data)
+            if sha256_file(tmp, self.codec) != entry['sha256']:
+                raise ArchiveError(f'{name}: el archivo comprimido no coincide con el original')
+            os.utime(tmp, (entry['mtime'], entry['mtime']))
+            os.replace(tmp, target)
+        finally:
+            tmp.unlink(missing_ok=True)
+        self.manifest.update(name, file=target.name, stored_size=target.stat().st_size, codec=self.codec.name)
+        raw.unlink()
+        if self.index is not None:
+            self.index.forget(raw)
+        return target
+
+    def index_archive(self, path):
+        # El escaneo de un comprimido se hace acá y no al abrir la página de PITR
+        if self.index is None:
+            return
+        try:
+            self.index.refresh(path)
+        except (OSError, BinlogFormatError) as e:
+            print(f'Aviso: no se pudo indexar {Path(path).name}: {e}')
+
+    def archive_and_compress(self, name):
+        try:
+            self.index_archive(self.compress(name))
+            print(f'Comprimido: {name} ({self.codec.name})', flush=True)
+        except (OSError, ArchiveError, CodecError) as e:
+            self.errors.append(f'{name}: {e}')
+            print(f'ERROR comprimiendo {name}: {e}', flush=True)
+
+    def pending_compression(self):
+        """Binlogs del manifiesto que todavía están sin comprimir (corrida anterior interrumpida)."""
+        if self.codec.name == 'none':
+            return []
+        return sorted(name for name, entry in self.manifest.binlogs.items()
+                      if entry.get('codec') == 'none' and (self.archive_dir / entry['file']).is_file())
+
+    def adopt_existing(self, prefix):
+        """Registra binlogs sin comprimir copiados por versiones anteriores (cp -u) que no estén en el manifiesto."""
+        stored = {entry.get('file') for entry in self.manifest.binlogs.values()}
+        adopted = []
+        for path in sorted(self.archive_dir.glob(f'{prefix}.*')):
+            match = ARCHIVE_NAME_RE.match(path.name)
+            if not match or match.group(2) or path.name in stored or not path.is_file():
+                continue
+            stat = path.stat()
+            self.manifest.update(path.name, size=stat.st_size, sha256=sha256_file(path), mtime=stat.st_mtime,
+                                 archived_at=time.time(), file=path.name, stored_size=stat.st_size,
+                                 codec='none')
+            adopted.append(path.name)
+        return adopted
+
+    def apply_retention(self, days, prefix):
+        """Borra los archivados (y copias sueltas del prefijo) modificados hace más de days días."""
+        if days <= 0:
+            return []
+        cutoff = time.time() - days * 86400
+        removed = []
+        for name, entry in sorted(self.manifest.binlogs.items()):
+            if entry.get('mtime', 0) >= cutoff:
+                continue
+            path = self.archive_dir / entry['file']
+            path.unlink(missing_ok=True)
+            if self.index is not None:
+                self.index.forget(path)
+            self.manifest.remove(name)
+            removed.append(name)
+        for path in self.archive_dir.glob(f'{prefix}.*'):
+            if ARCHIVE_NAME_RE.match(path.name) and path.is_file() and path.stat().st_mtime < cutoff:
+                path.unlink()
+                removed.append(path.name)
+        return removed
+
+    def verify(self):
+        """Recalcula el SHA-256 de cada archivado; devuelve los nombres que no coinciden."""
+        failed = []
+        for name, entry in sorted(self.manifest.binlogs.items()):
+            try:
+                ok = sha256_file(self.archive_dir / entry['file']) == entry['sha256']
+            except (OSError, CodecError, EOFError) as e:
+                print(f'ERROR leyendo {entry["file"]}: {e}')
+                ok = False
+            print(f'{"OK" if ok else "ERROR"}: {entry["file"]}')
+            if not ok:
+                failed.append(name)
+        return failed
+
+
+def closed_binlogs(meta):
+    """(directorio, binlogs cerrados [(nombre, tamaño)], binlog activo) según el servidor."""
+    basename = meta.log_bin_basename()
+    source_dir = Path(basename).parent if basename else Path(meta.datadir() or '')
+    logs = [(row[0], int(row[1])) for row in meta.query('SHOW BINARY LOGS') if row and row[0]]
+    if not logs:
+        raise ArchiveError('el servidor no informa binlogs (¿log_bin desactivado?)')
+    return source_dir, logs[:-1], logs[-1][0]
+
+
+def run_archive(archive_dir, codec, level=None, flush=True, retention_days=BINLOG_RETENTION_DAYS,
+                threads=BINLOG_ARCHIVE_THREADS):
+    """Una corrida completa; devuelve la lista de errores."""
+    meta = ServerMetadata(MYSQL_HOST, MYSQL_USER, MYSQL_PASS, pool_size=1)
+    if flush:
+        # Cierra el binlog actual para que entre en esta corrida
+        print('Rotando logs binarios...', flush=True)
+        meta.query('FLUSH BINARY LOGS')
+    source_dir, closed, active = closed_binlogs(meta)
+    print(f'Log actual activo: {active} (no se copia)', flush=True)
+
+    try:
+        index = BinlogIndex(CATALOG_PATH)
+    except Exception as e:
+        print(f'Aviso: no se pudo abrir el índice de binlogs ({e}); no se pre-indexarán')
+        index = None
+    archiver = BinlogArchiver(archive_dir, codec, level, index)
+    prefix = Path(active).stem
+    for name in archiver.adopt_existing(prefix):
+        print(f'Registrado en el manifiesto: {name}')
+
+    copied = 0
+    with ThreadPoolExecutor(max_workers=max(1, threads), thread_name_prefix='binlog-compress') as pool:
+        # La compresión corre en el pool mientras se siguen copiando los siguientes
+        for name in archiver.pending_compression():
+            pool.submit(archiver.archive_and_compress, name)
+        for name, size in closed:
+            if archiver.is_archived(name, size):
+                continue
+            try:
+                target = archiver.copy(source_dir / name)
+            except (OSError, ArchiveError) as e:
+                archiver.errors.append(f'{name}: {e}')
+                print(f'ERROR copiando {name}: {e}', flush=True)
+                continue
+            copied += 1
+            print(f'Copiado: {name}', flush=True)
+            if codec.name == 'none':
+                archiver.index_archive(target)
+            else:
+                pool.submit(archiver.archive_and_compress, name)
+
+    removed = archiver.apply_retention(retention_days, prefix)
+    print(f'Archivado finalizado: {copied} binlogs nuevos, {len(removed)} borrados por retención, '
+          f'{len(archiver.errors)} errores.')
+    return archiver.errors
+
+
+def acquire_lock(archive_dir):
+    """Lock exclusivo no bloqueante; None si otra corrida está en curso."""
+    handle = open(Path(archive_dir) / LOCK_NAME, 'a')
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        handle.close()
+        return None
+    return handle
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Archivado incremental de binlogs MySQL')
+    parser.add_argument('--dest', default=BINLOG_BACKUP_DIR, help='directorio de archivo (BINLOG_BACKUP_DIR)')
+    parser.add_argument('--codec', choices=list(CODECS), default=None,
+                        help='compresión de los binlogs archivados (por defecto BINLOG_ARCHIVE_CODEC)')
+    parser.add_argument('--level', type=int, default=BINLOG_ARCHIVE_LEVEL, help='nivel del códec')
+    parser.add_argument('--threads', type=int, default=BINLOG_ARCHIVE_THREADS,
+                        help='binlogs que se comprimen en simultáneo')
+    parser.add_argument('--retention-days', type=float, default=BINLOG_RETENTION_DAYS,
+                        help='días que se conservan los archivados (0 = no borrar)')
+    parser.add_argument('--no-flush', action='store_true', help='no rotar el binlog activo antes de copiar')
+    parser.add_argument('--verify', action='store_true',
+                        help='solo verificar el SHA-256 de los binlogs archivados')
+    args = parser.parse_args(argv)
+
+    try:
+        codec = get_codec(args.codec or BINLOG_ARCHIVE_CODEC)
+    except CodecError as e:
+        if args.codec:
+            parser.error(str(e))
+        print(f'Aviso: {e}; se usa gzip')
+        codec = CODECS['gzip']
+
+    archive_dir = Path(args.dest)
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    lock = acquire_lock(archive_dir)
+    if lock is None:
+        print('Otra corrida del archivador está en curso; se omite esta.')
+        return 0
+    try:
+        if args.verify:
+            failed = BinlogArchiver(archive_dir, codec).verify()
+            return 1 if failed else 0
+        errors = run_archive(archive_dir, codec, args.level, flush=not args.no_flush,
+                             retention_days=args.retention_days, threads=args.threads)
+    except ArchiveError as e:
+        print(f'ERROR: {e}')
+        return 1
+    except Exception as e:
+        print(f'ERROR: no se pudo consultar el servidor MySQL: {e}')
+        return 1
+    finally:
+        lock.close()
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
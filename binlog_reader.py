@@ -0,0 +1,768 @@
+#!/usr/bin/env python3
+"""
+Lector nativo de binlogs MySQL/MariaDB (formato v4)
+Lee solo las cabeceras de eventos (19 bytes) para ubicar límites de
+transacción, y mantiene en SQLite un índice disperso timestamp -> offset por
+binlog para planificar PITR con --start-position/--stop-position, más un mapa
+de rangos de bytes por base (TABLE_MAP/QUERY) para extraer solo los eventos
+de una base. Los binlogs archivados comprimidos (.gz/.zst) se leen en
+streaming, sin descomprimirlos a disco
+"""
+
+import os
+import re
+import sqlite3
+import struct
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from backup_codecs import codec_for_path
+
+BINLOG_MAGIC = b'\xfebin'
+HEADER_SIZE = 19
+HEADER = struct.Struct('<IBIIIH')
+
+QUERY_EVENT = 2
+STOP_EVENT = 3
+ROTATE_EVENT = 4
+INTVAR_EVENT = 5
+RAND_EVENT = 13
+USER_VAR_EVENT = 14
+FORMAT_DESCRIPTION_EVENT = 15
+XID_EVENT = 16
+TABLE_MAP_EVENT = 19
+HEARTBEAT_LOG_EVENT = 27
+GTID_LOG_EVENT = 33
+ANONYMOUS_GTID_LOG_EVENT = 34
+PREVIOUS_GTIDS_LOG_EVENT = 35
+XA_PREPARE_LOG_EVENT = 38
+TRANSACTION_PAYLOAD_EVENT = 40
+MARIADB_BINLOG_CHECKPOINT_EVENT = 161
+MARIADB_GTID_EVENT = 162
+MARIADB_GTID_LIST_EVENT = 163
+
+MARIADB_FL_STANDALONE = 0x01
+
+# Eventos que preceden a una sentencia en binlog STATEMENT sin BEGIN explícito
+STATEMENT_CONTEXT_EVENTS = (INTVAR_EVENT, RAND_EVENT, USER_VAR_EVENT)
+
+# Eventos de control del archivo: nunca forman parte de una transacción
+FILE_CONTROL_EVENTS = (
+    STOP_EVENT, ROTATE_EVENT, FORMAT_DESCRIPTION_EVENT, HEARTBEAT_LOG_EVENT, PREVIOUS_GTIDS_LOG_EVENT,
+    MARIADB_BINLOG_CHECKPOINT_EVENT, MARIADB_GTID_LIST_EVENT,
+)
+
+# Transacciones que no se pueden atribuir a una base (payload comprimido,
+# sentencias sin USE) se registran con este nombre y aplican a todas
+ANY_DATABASE = '*'
+
+# Estados del seguimiento de transacciones
+_IDLE = 0
+_AWAITING_STATEMENT = 1
+_IN_TRANSACTION = 2
+
+POINT_INTERVAL = 1024 * 1024
+QUERY_PREFIX_BYTES = 32
+# Rangos de una misma base separados por menos que esto se guardan como uno
+# solo; lo intercalado de otras bases lo descarta mysqlbinlog --database
+DB_RANGE_MERGE_GAP = 64 * 1024
+EXTRACT_READ_SIZE = 4 * 1024 * 1024
+SKIP_READ_SIZE = 1024 * 1024
+
+CHANGE_MASTER_RE = re.compile(
+    r"CHANGE (?:MASTER|REPLICATION SOURCE) TO (?:MASTER|SOURCE)_LOG_FILE='([^']+)',\s*"
+    r"(?:MASTER|SOURCE)_LOG_POS=(\d+)"
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS binlog_files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    scanned_to INTEGER NOT NULL,
+    resume_offset INTEGER NOT NULL,
+    first_ts INTEGER,
+    last_ts INTEGER,
+    transactions INTEGER NOT NULL DEFAULT 0,
+    db_ranges INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS binlog_points (
+    path TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    timestamp INTEGER NOT NULL,
+    PRIMARY KEY (path, offset)
+);
+CREATE TABLE IF NOT EXISTS binlog_db_ranges (
+    path TEXT NOT NULL,
+    database TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL,
+    PRIMARY KEY (path, database, start)
+);
+"""
+
+
+class BinlogFormatError(Exception):
+    """El archivo no es un binlog v4 legible (cifrado, truncado o de otro formato)."""
+
+
+class BinlogChainError(Exception):
+    """Los binlogs elegidos no forman una cadena continua desde el backup base."""
+
+
+class _ForwardReader:
+    """seek/read sobre un binlog comprimido: avanzar descarta bytes, retroceder reabre."""
+
+    def __init__(self, codec, path):
+        self.codec = codec
+        self.path = path
+        self._stream = codec.open_reader(path)
+        self._position = 0
+
+    def tell(self):
+        return self._position
+
+    def read(self, size):
+        parts = []
+        while size > 0:
+            data = self._stream.read(size)
+            if not data:
+                break
+            parts.append(data)
+            size -= len(data)
+            self._position += len(data)
+        return b''.join(parts)
+
+    def seek(self, offset):
+        if offset < self._position:
+            self._stream.close()
+            self._stream = self.codec.open_reader(self.path)
+            self._position = 0
+        while self._position < offset:
+            if not self.read(min(SKIP_READ_SIZE, offset - self._position)):
+                break
+
+    def close(self):
+        self._stream.close()
+
+
+def is_compressed_binlog(path):
+    return codec_for_path(path).name != 'none'
+
+
+class BinlogEvent:
+    __slots__ = ('offset', 'timestamp', 'type_code', 'server_id', 'size', 'next_position', 'flags')
+
+    def __init__(self, offset, timestamp, type_code, server_id, size, next_position, flags):
+        self.offset = offset
+        self.timestamp = timestamp
+        self.type_code = type_code
+        self.server_id = server_id
+        self.size = size
+        self.next_position = next_position
+        self.flags = flags
+
+    @property
+    def end(self):
+        return self.offset + self.size
+
+
+class BinlogReader:
+    """Recorre los eventos de un binlog leyendo cabeceras y, a pedido, el cuerpo.
+
+    En un binlog comprimido los offsets son los del archivo original y la
+    lectura conviene que sea hacia adelante (retroceder vuelve a descomprimir).
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        codec = codec_for_path(self.path)
+        self.compressed = codec.name != 'none'
+        self.file = _ForwardReader(codec, self.path) if self.compressed else open(self.path, 'rb')
+        if self.file.read(4) != BINLOG_MAGIC:
+            self.file.close()
+            raise BinlogFormatError('no es un binlog (cabecera inválida)')
+        self.query_post_header = 13
+        self.table_map_post_header = 8
+        self._query_head = (None, b'')
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def events(self, start=4):
+        """Itera eventos desde start (un límite de evento); se detiene ante un evento incompleto."""
+        offset = start
+        # Un archivo comprimido es un binlog cerrado: no hay evento a medio escribir
+        file_size = None if self.compressed else os.fstat(self.file.fileno()).st_size
+        if start > 4:
+            self._read_format_description()
+        while True:
+            self.file.seek(offset)
+            raw = self.file.read(HEADER_SIZE)
+            if len(raw) < HEADER_SIZE:
+                return
+            timestamp, type_code, server_id, size, next_position, flags = HEADER.unpack(raw)
+            if size < HEADER_SIZE:
+                raise BinlogFormatError(f'evento inválido en offset {offset}')
+            event = BinlogEvent(offset, timestamp, type_code, server_id, size, next_position, flags)
+            if type_code == FORMAT_DESCRIPTION_EVENT:
+                self._parse_format_description(self.read_body(event))
+            if file_size is not None and event.end > file_size:
+                return
+            yield event
+            offset = event.end
+
+    def read_body(self, event, limit=None):
+        """Cuerpo del evento (sin la cabecera de 19 bytes), opcionalmente truncado."""
+        length = event.size - HEADER_SIZE if limit is None else min(limit, event.size - HEADER_SIZE)
+        self.file.seek(event.offset + HEADER_SIZE)
+        return self.file.read(length)
+
+    def _read_query_head(self, event):
+        # Seguimiento de transacciones y mapa por base leen el mismo evento
+        if self._query_head[0] != event.offset:
+            self._query_head = (event.offset, self.read_body(event, self.query_post_header + 4096))
+        return self._query_head[1]
+
+    def query_prefix(self, event):
+        """Primeros bytes del texto SQL de un QUERY_EVENT (BEGIN, COMMIT, DDL...)."""
+        head = self._read_query_head(event)
+        if len(head) < 13:
+            return ''
+        db_len = head[8]
+        status_len = struct.unpack('<H', head[11:13])[0]
+        start = self.query_post_header + status_len + db_len + 1
+        return head[start:start + QUERY_PREFIX_BYTES].decode('utf-8', errors='replace')
+
+    def query_database(self, event):
+        """Base por defecto (USE) registrada en un QUERY_EVENT."""
+        head = self._read_query_head(event)
+        if len(head) < 13:
+            return ''
+        db_len = head[8]
+        status_len = struct.unpack('<H', head[11:13])[0]
+        start = self.query_post_header + status_len
+        return head[start:start + db_len].decode('utf-8', errors='replace')
+
+    def table_map_database(self, event):
+        """Base de la tabla descrita por un TABLE_MAP_EVENT."""
+        return self.table_map_name(event)[0]
+
+    def table_map_name(self, event):
+        """(base, tabla) descritos por un TABLE_MAP_EVENT."""
+        # post-header | db_len | db | 0 | table_len | table | 0
+        body = self.read_body(event, self.table_map_post_header + 2 * (1 + 256 + 1))
+        start = self.table_map_post_header
+        if len(body) <= start:
+            return '', ''
+        db_len = body[start]
+        database = body[start + 1:start + 1 + db_len].decode('utf-8', errors='replace')
+        table_start = start + 1 + db_len + 1
+        if len(body) <= table_start:
+            return database, ''
+        table_len = body[table_start]
+        return database, body[table_start + 1:table_start + 1 + table_len].decode('utf-8', errors='replace')
+
+    def event_bytes(self, offset, size):
+        self.file.seek(offset)
+        return self.file.read(size)
+
+    def _read_format_description(self):
+        self.file.seek(4)
+        raw = self.file.read(HEADER_SIZE)
+        if len(raw) == HEADER_SIZE:
+            event = BinlogEvent(4, *HEADER.unpack(raw))
+            if event.type_code == FORMAT_DESCRIPTION_EVENT:
+                self._parse_format_description(self.read_body(event))
+
+    def _parse_format_description(self, body):
+        # binlog_version(2) server_version(50) create_timestamp(4) header_length(1) post_header_lengths[]
+        if len(body) > 57 + QUERY_EVENT - 1:
+            self.query_post_header = body[57 + QUERY_EVENT - 1]
+        if len(body) > 57 + TABLE_MAP_EVENT - 1:
+            self.table_map_post_header = body[57 + TABLE_MAP_EVENT - 1]
+
+
+class TransactionTracker:
+    """Detecta el evento que inicia cada transacción (o sentencia DDL autónoma).
+
+    Un offset de inicio de transacción es seguro para --start-position y
+    --stop-position: nunca parte una transacción a la mitad.
+    """
+
+    def __init__(self):
+        self.state = _IDLE
+
+    def feed(self, reader, event):
+        """Procesa un evento; devuelve True si inicia una transacción."""
+        code = event.type_code
+        starts = False
+
+        if code in (GTID_LOG_EVENT, ANONYMOUS_GTID_LOG_EVENT):
+            starts = True
+            self.state = _AWAITING_STATEMENT
+        elif code == MARIADB_GTID_EVENT:
+            starts = True
+            body = reader.read_body(event, 13)
+            standalone = len(body) >= 13 and body[12] & MARIADB_FL_STANDALONE
+            self.state = _AWAITING_STATEMENT if standalone else _IN_TRANSACTION
+        elif code in STATEMENT_CONTEXT_EVENTS:
+            starts = self.state == _IDLE
+            if self.state == _IDLE:
+                self.state = _AWAITING_STATEMENT
+        elif code == QUERY_EVENT:
+            starts = self.state == _IDLE
+            query = reader.query_prefix(event).lstrip().upper()
+            if query.startswith('BEGIN') or query.startswith('XA START'):
+                self.state = _IN_TRANSACTION
+            elif self.state == _IN_TRANSACTION and not (query.startswith('COMMIT') or query.startswith('ROLLBACK')):
+                pass
+            else:
+                self.state = _IDLE
+        elif code in (XID_EVENT, XA_PREPARE_LOG_EVENT):
+            self.state = _IDLE
+        elif code == TRANSACTION_PAYLOAD_EVENT:
+            self.state = _IDLE
+        return starts
+
+
+def event_databases(reader, event):
+    """Bases que modifica un evento de datos (vacío si no modifica ninguna)."""
+    code = event.type_code
+    if code == TABLE_MAP_EVENT:
+        return {reader.table_map_database(event) or ANY_DATABASE}
+    if code == QUERY_EVENT:
+        query = reader.query_prefix(event).lstrip().upper()
+        if query.startswith(('BEGIN', 'COMMIT', 'ROLLBACK', 'XA ')):
+            return set()
+        return {reader.query_database(event) or ANY_DATABASE}
+    if code == TRANSACTION_PAYLOAD_EVENT:
+        return {ANY_DATABASE}
+    return set()
+
+
+class DatabaseRangeMap:
+    """Arma rangos [start, end) por base a partir de transacciones consecutivas."""
+
+    def __init__(self, merge_gap=DB_RANGE_MERGE_GAP):
+        self.merge_gap = merge_gap
+        self.open = {}
+        self.closed = []
+        self.current = None
+
+    def start_transaction(self, offset):
+        self.end_transaction()
+        self.current = [offset, offset, set()]
+
+    def add_event(self, reader, event):
+        if self.current is None or event.type_code in FILE_CONTROL_EVENTS:
+            return
+        self.current[1] = event.end
+        self.current[2] |= event_databases(reader, event)
+
+    def end_transaction(self):
+        if self.current is None:
+            return
+        start, end, databases = self.current
+        for database in databases:
+            last = self.open.get(database)
+            if last is not None and start - last[1] <= self.merge_gap:
+                last[1] = end
+            else:
+                if last is not None:
+                    self.closed.append((database, last[0], last[1]))
+                self.open[database] = [start, end]
+        self.current = None
+
+    def ranges(self):
+        """Todos los rangos (base, start, end), cerrando la transacción en curso."""
+        self.end_transaction()
+        return self.closed + [(database, start, end) for database, (start, end) in self.open.items()]
+
+
+def iter_transaction_starts(reader, start=4):
+    """(offset, timestamp) de cada inicio de transacción desde start."""
+    tracker = TransactionTracker()
+    for event in reader.events(start):
+        if tracker.feed(reader, event):
+            yield event.offset, event.timestamp
+
+
+def binlog_sequence(name):
+    """Número de secuencia de mysql-bin.000123[.gz|.zst] (para ordenar/comparar binlogs)."""
+    match = re.search(r'\.(\d+)(?:\.gz|\.zst)?$', Path(name).name)
+    return int(match.group(1)) if match else -1
+
+
+def binlog_chain_gap(paths, start_file=None):
+    """Motivo por el que paths (ordenados) no son una cadena continua desde start_file, o None."""
+    if start_file and (not paths or binlog_sequence(paths[0].name) != binlog_sequence(start_file)):
+        return f'{Path(start_file).name} ya no está entre los binlogs archivados'
+    for previous, path in zip(paths, paths[1:]):
+        if binlog_sequence(path.name) != binlog_sequence(previous.name) + 1:
+            return f'falta al menos un binlog entre {previous.name} y {path.name}'
+    return None
+
+
+def parse_dump_coordinates(head):
+    """Coordenadas CHANGE MASTER en el comienzo (texto) de un dump, o None."""
+    match = CHANGE_MASTER_RE.search(head)
+    if not match:
+        return None
+    return {'file': match.group(1), 'position': int(match.group(2))}
+
+
+def read_dump_coordinates(dump_path, max_bytes=256 * 1024):
+    """Archivo y posición del binlog grabados por mysqldump --master-data=2 (o None)."""
+    stream = codec_for_path(dump_path).open_reader(dump_path)
+    try:
+        head = stream.read(max_bytes)
+    finally:
+        stream.close()
+    return parse_dump_coordinates(head.decode('utf-8', errors='replace'))
+
+
+def parse_datetime(value):
+    """Acepta 'YYYY-MM-DD HH:MM[:SS]' o el formato de <input type=datetime-local>."""
+    return datetime.fromisoformat(value.strip().replace(' ', 'T')).timestamp()
+
+
+class BinlogIndex:
+    """Índice disperso timestamp -> offset de inicios de transacción por binlog.
+
+    Se guarda un punto cada point_interval bytes; los binlogs activos se
+    re-escanean solo desde el último inicio de transacción conocido.
+    """
+
+    def __init__(self, db_path, point_interval=POINT_INTERVAL):
+        self.db_path = str(db_path)
+        self.point_interval = point_interval
+        self._local = threading.local()
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(binlog_files)')}
+            if 'db_ranges' not in columns:
+                # Índices previos al mapa por base: se re-escanean en el próximo refresh
+                conn.execute('ALTER TABLE binlog_files ADD COLUMN db_ranges INTEGER NOT NULL DEFAULT 0')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def refresh(self, path):
+        """Actualiza el índice de un binlog si cambió; devuelve su fila."""
+        path = str(path)
+        stat = os.stat(path)
+        conn = self._connection()
+        row = conn.execute('SELECT * FROM binlog_files WHERE path = ?', (path,)).fetchone()
+        if (row is not None and row['db_ranges'] and row['size'] == stat.st_size
+                and row['mtime'] == stat.st_mtime):
+            return dict(row)
+
+        if (row is None or not row['db_ranges'] or stat.st_size < row['scanned_to']
+                or is_compressed_binlog(path)):
+            # Nuevo, reemplazado, comprimido (no crece) o sin mapa por base: escaneo completo
+            with conn:
+                conn.execute('DELETE FROM binlog_points WHERE path = ?', (path,))
+                conn.execute('DELETE FROM binlog_db_ranges WHERE path = ?', (path,))
+            resume, first_ts, last_ts, transactions = 4, None, None, 0
+        else:
+            resume, first_ts, last_ts = row['resume_offset'], row['first_ts'], row['last_ts']
+            transactions = row['transactions'] - 1 if row['resume_offset'] > 4 else row['transactions']
+            # La última transacción se vuelve a leer completa desde resume
+            with conn:
+                conn.execute('DELETE FROM binlog_db_ranges WHERE path = ? AND start >= ?', (path, resume))
+                conn.execute('UPDATE binlog_db_ranges SET end = ? WHERE path = ? AND end > ?', (resume, path, resume))
+
+        points = []
+        last_point = -self.point_interval
+        scanned_to = resume
+        range_map = DatabaseRangeMap()
+        with BinlogReader(path) as reader:
+            tracker = TransactionTracker()
+            for event in reader.events(resume):
+                if tracker.feed(reader, event):
+                    transactions += 1
+                    resume = event.offset
+                    range_map.start_transaction(event.offset)
+                    if first_ts is None:
+                        first_ts = event.timestamp
+                    if event.offset - last_point >= self.point_interval:
+                        points.append((path, event.offset, event.timestamp))
+                        last_point = event.offset
+                range_map.add_event(reader, event)
+                if event.type_code != FORMAT_DESCRIPTION_EVENT:
+                    last_ts = max(last_ts or 0, event.timestamp)
+                scanned_to = event.end
+
+        with conn:
+            conn.executemany('INSERT OR REPLACE INTO binlog_points (path, offset, timestamp) VALUES (?, ?, ?)', points)
+            conn.executemany(
+                'INSERT OR REPLACE INTO binlog_db_ranges (path, database, start, end) VALUES (?, ?, ?, ?)',
+                [(path, database, start, end) for database, start, end in range_map.ranges()]
+            )
+            conn.execute(
+                'INSERT OR REPLACE INTO binlog_files (path, size, mtime, scanned_to, resume_offset, first_ts, '
+                'last_ts, transactions, db_ranges, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1, ?)',
+                (path, stat.st_size, stat.st_mtime, scanned_to, resume, first_ts, last_ts, transactions, time.time())
+            )
+        return dict(conn.execute('SELECT * FROM binlog_files WHERE path = ?', (path,)).fetchone())
+
+    def forget(self, path):
+        """Descarta el índice de un binlog borrado o reemplazado por su versión comprimida."""
+        path = str(path)
+        with self._connection() as conn:
+            for table in ('binlog_points', 'binlog_db_ranges', 'binlog_files'):
+                conn.execute(f'DELETE FROM {table} WHERE path = ?', (path,))
+
+    def cached_summary(self, path):
+        """(fila guardada o None, si está al día) sin leer el binlog: para listados."""
+        path = str(path)
+        row = self._connection().execute('SELECT * FROM binlog_files WHERE path = ?', (path,)).fetchone()
+        if row is None:
+            return None, False
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return dict(row), False
+        current = bool(row['db_ranges']) and row['size'] == stat.st_size and row['mtime'] == stat.st_mtime
+        return dict(row), current
+
+    def summary(self, path):
+        """Primer/último evento y cantidad de transacciones (None si no se puede leer)."""
+        try:
+            return self.refresh(path)
+        except (OSError, BinlogFormatError) as e:
+            print(f'Error indexando binlog {path}: {e}')
+            return None
+
+    def position_for_time(self, path, timestamp):
+        """Offset del primer inicio de transacción con timestamp >= dado, o None."""
+        self.refresh(path)
+        row = self._connection().execute(
+            'SELECT offset FROM binlog_points WHERE path = ? AND timestamp < ? ORDER BY offset DESC LIMIT 1',
+            (str(path), timestamp)
+        ).fetchone()
+        start = row['offset'] if row else 4
+        with BinlogReader(path) as reader:
+            for offset, event_ts in iter_transaction_starts(reader, start):
+                if event_ts >= timestamp:
+                    return offset
+        return None
+
+    def database_ranges(self, path, database, start=4, stop=None):
+        """Rangos [start, end) del binlog con eventos de database, recortados a la ventana dada."""
+        self.refresh(path)
+        rows = self._connection().execute(
+            'SELECT start, end FROM binlog_db_ranges WHERE path = ? AND database IN (?, ?) AND end > ? '
+            'ORDER BY start',
+            (str(path), database, ANY_DATABASE, start)
+        ).fetchall()
+        ranges = []
+        for row in rows:
+            begin, end = max(row['start'], start), row['end'] if stop is None else min(row['end'], stop)
+            if begin >= end:
+                continue
+            if ranges and begin <= ranges[-1][1]:
+                ranges[-1][1] = max(ranges[-1][1], end)
+            else:
+                ranges.append([begin, end])
+        return [tuple(r) for r in ranges]
+
+
+def plan_replay(index, paths, start_coordinates=None, start_time=None, stop_time=None):
+    """Decide qué binlogs aplicar y con qué posiciones.
+
+    start_coordinates ({'file', 'position'} de --master-data) tiene prioridad
+    sobre start_time (epoch). Devuelve files (en orden), start_position (para
+    el primero), stop_position (para el último) y skipped (omitidos enteros).
+    Lanza BinlogChainError si falta el binlog de las coordenadas o hay un
+    hueco en la secuencia de los que se aplicarían.
+    """
+    paths = sorted((Path(p) for p in paths), key=lambda p: (binlog_sequence(p.name), p.name))
+    plan = {'files': [], 'start_position': None, 'stop_position': None, 'skipped': []}
+    summaries = {p: index.refresh(p) for p in paths}
+
+    selected = list(paths)
+    if start_coordinates:
+        start_seq = binlog_sequence(start_coordinates['file'])
+        plan['skipped'] += [p.name for p in selected if binlog_sequence(p.name) < start_seq]
+        selected = [p for p in selected if binlog_sequence(p.name) >= start_seq]
+        if selected:
+            # Sin el binlog de las coordenadas se perdería todo lo anterior al siguiente
+            gap = binlog_chain_gap(selected[:1], start_coordinates['file'])
+            if gap:
+                raise BinlogChainError(gap)
+            plan['start_position'] = start_coordinates['position']
+    elif start_time is not None:
+        while selected:
+            first = selected[0]
+            position = None
+            if (summaries[first]['last_ts'] or 0) >= start_time:
+                position = index.position_for_time(first, start_time)
+            if position is not None:
+                plan['start_position'] = position if position > 4 else None
+                break
+            plan['skipped'].append(first.name)
+            selected.pop(0)
+
+    if stop_time is not None:
+        kept = []
+        for i, path in enumerate(selected):
+            summary = summaries[path]
+            if summary['first_ts'] is not None and summary['first_ts'] >= stop_time:
+                plan['skipped'] += [p.name for p in selected[i:]]
+                break
+            kept.append(path)
+            if (summary['last_ts'] or 0) >= stop_time:
+                plan['stop_position'] = index.position_for_time(path, stop_time)
+                plan['skipped'] += [p.name for p in selected[i + 1:]]
+                break
+        selected = kept
+
+    gap = binlog_chain_gap(selected)
+    if gap:
+        raise BinlogChainError(gap)
+
+    if (len(selected) == 1 and plan['start_position'] and plan['stop_position']
+            and plan['stop_position'] <= plan['start_position']):
+        plan['skipped'].append(selected[0].name)
+        selected = []
+
+    plan['files'] = selected
+    return plan
+
+
+def plan_database_extract(index, plan, database):
+    """Rangos de bytes de database dentro de un plan de plan_replay.
+
+    Devuelve segments [(path, [(start, end), ...])], bytes (a extraer) y
+    source_bytes (lo que leería mysqlbinlog sobre los archivos completos).
+    """
+    extract = {'segments': [], 'bytes': 0, 'source_bytes': 0}
+    files = plan['files']
+    for i, path in enumerate(files):
+        start = (plan['start_position'] or 4) if i == 0 else 4
+        stop = plan['stop_position'] if i == len(files) - 1 else None
+        ranges = index.database_ranges(path, database, start, stop)
+        extract['source_bytes'] += (stop or index.refresh(path)['scanned_to']) - start
+        if ranges:
+            extract['segments'].append((path, ranges))
+            extract['bytes'] += sum(end - begin for begin, end in ranges)
+    return extract
+
+
+def plan_window_extract(index, plan):
+    """Ventanas completas de un plan de plan_replay, con la forma de plan_database_extract.
+
+    Para binlogs comprimidos, que mysqlbinlog no puede abrir ni posicionar:
+    las posiciones de inicio/fin se aplican al armar el binlog sintético.
+    """
+    extract = {'segments': [], 'bytes': 0, 'source_bytes': 0}
+    files = plan['files']
+    for i, path in enumerate(files):
+        start = (plan['start_position'] or 4) if i == 0 else 4
+        stop = plan['stop_position'] if i == len(files) - 1 else None
+        end = stop or index.refresh(path)['scanned_to']
+        extract['source_bytes'] += end - start
+        if end > start:
+            extract['segments'].append((path, [(start, end)]))
+            extract['bytes'] += end - start
+    return extract
+
+
+def iter_extracted_events(extract, read_size=EXTRACT_READ_SIZE):
+    """Binlog sintético: cabecera, y por archivo su FORMAT_DESCRIPTION_EVENT más los rangos.
+
+    Los eventos se copian sin modificar (checksums intactos); mysqlbinlog lo
+    lee desde stdin ('-') igual que un relay log con varios FDE.
+    """
+    yield BINLOG_MAGIC
+    for path, ranges in extract['segments']:
+        with BinlogReader(path) as reader:
+            header = reader.event_bytes(4, HEADER_SIZE)
+            if len(header) < HEADER_SIZE or header[4] != FORMAT_DESCRIPTION_EVENT:
+                raise BinlogFormatError(f'{Path(path).name}: falta FORMAT_DESCRIPTION_EVENT')
+            fde_size = HEADER.unpack(header)[3]
+            yield header + reader.event_bytes(4 + HEADER_SIZE, fde_size - HEADER_SIZE)
+            for start, end in ranges:
+                # El FDE ya se copió arriba
+                offset = max(start, 4 + fde_size)
+                while offset < end:
+                    data = reader.event_bytes(offset, min(read_size, end - offset))
+                    if not data:
+                        raise BinlogFormatError(f'{Path(path).name}: truncado en offset {offset}')
+                    offset += len(data)
+                    yield data
+
+
+def iter_binlog_stream(paths, read_size=EXTRACT_READ_SIZE):
+    """Binlogs completos (comprimidos o no) concatenados como un único flujo para 'mysqlbinlog -'."""
+    yield BINLOG_MAGIC
+    for path in paths:
+        stream = codec_for_path(path).open_reader(path)
+        try:
+            if stream.read(4) != BINLOG_MAGIC:
+                raise BinlogFormatError(f'{Path(path).name}: no es un binlog (cabecera inválida)')
+            yield from iter(lambda: stream.read(read_size), b'')
+        finally:
+            stream.close()
+
+
+def format_timestamp(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime('%d/%m/%Y %H:%M:%S') if timestamp else '-'
+
+
+def main(argv=None):
+    """Uso: binlog_reader.py ARCHIVO... -> primer/último evento de cada binlog.
+       binlog_reader.py --cat ARCHIVO... -> flujo único (descomprimido) para 'mysqlbinlog -'."""
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv == ['--cat']:
+        print(main.__doc__)
+        return 1
+    if argv[0] == '--cat':
+        try:
+            for data in iter_binlog_stream(argv[1:]):
+                sys.stdout.buffer.write(data)
+        except (OSError, BinlogFormatError, EOFError) as e:
+            print(f'Error leyendo binlogs: {e}', file=sys.stderr)
+            return 1
+        return 0
+    status = 0
+    for path in argv:
+        try:
+            with BinlogReader(path) as reader:
+                first = last = None
+                transactions = 0
+                for offset, timestamp in iter_transaction_starts(reader):
+                    transactions += 1
+                    first = timestamp if first is None else first
+                    last = timestamp
+        except (OSError, BinlogFormatError) as e:
+            print(f'{path}: {e}')
+            status = 1
+            continue
+        print(f'{Path(path).name}: primer evento {format_timestamp(first)}, '
+              f'última transacción {format_timestamp(last)}, {transactions} transacciones')
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
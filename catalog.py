@@ -0,0 +1,368 @@
+"""
+Catálogo persistente de backups (SQLite)
+Indexa los directorios de backup para no recorrer/stat-ear todo en cada request
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from metrics import record_refresh
+
+SOURCE_HISTORICAL = 'historical'
+SOURCE_INCREMENTAL = 'incremental'
+SOURCE_MONGO = 'mongo'
+SOURCE_BINLOG = 'binlog'
+
+# Orden permitido en page(): clave pública -> expresión SQL (sin NULL, para comparar cursores)
+SORT_COLUMNS = {
+    'date': 'timestamp',
+    'name': 'name',
+    'size': 'size',
+    'db': "COALESCE(db_name, '')",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    source TEXT NOT NULL,
+    directory TEXT NOT NULL,
+    name TEXT NOT NULL,
+    path TEXT NOT NULL,
+    db_name TEXT,
+    timestamp REAL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    kind TEXT,
+    extra TEXT,
+    checked_at REAL NOT NULL,
+    PRIMARY KEY (source, directory, name)
+);
+CREATE INDEX IF NOT EXISTS idx_entries_mtime ON entries (source, directory, mtime);
+CREATE INDEX IF NOT EXISTS idx_entries_timestamp ON entries (source, directory, timestamp, name);
+CREATE TABLE IF NOT EXISTS directories (
+    source TEXT NOT NULL,
+    directory TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    scanned_at REAL NOT NULL,
+    PRIMARY KEY (source, directory)
+);
+CREATE TABLE IF NOT EXISTS backup_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    db_name TEXT NOT NULL,
+    path TEXT,
+    status TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    seconds REAL,
+    bytes_raw INTEGER,
+    bytes_written INTEGER,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_backup_runs_started ON backup_runs (started_at);
+"""
+
+
+class BackupCatalog:
+    """Índice incremental de archivos de backup por origen y directorio.
+
+    Cada origen se refresca comparando el mtime del directorio: si no cambió,
+    no se lista el directorio y solo se vuelven a consultar las entradas
+    "calientes" (modificadas hace menos de settle_seconds) o, en orígenes
+    volátiles (archivos que se reescriben en el lugar), todas las entradas.
+    """
+
+    def __init__(self, db_path, settle_seconds=3 * 3600, recheck_seconds=60):
+        self.db_path = str(db_path)
+        self.settle_seconds = settle_seconds
+        self.recheck_seconds = recheck_seconds
+        self._local = threading.local()
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def refresh(self, source, directory, parse_entry, volatile=False):
+        """Sincroniza el catálogo de un directorio.
+
+        parse_entry(path, stat) devuelve un dict (db_name, timestamp, kind,
+        size, extra) o None si el archivo no pertenece al origen.
+        """
+        started = time.monotonic()
+        counts = {'listed': 0, 'parsed': 0}
+        try:
+            self._refresh(source, str(directory), parse_entry, volatile, counts)
+        finally:
+            record_refresh(source, time.monotonic() - started, counts['listed'], counts['parsed'])
+
+    def _refresh(self, source, directory, parse_entry, volatile, counts):
+        try:
+            dir_stat = os.stat(directory)
+        except OSError:
+            self._forget_directory(source, directory)
+            return
+
+        conn = self._connection()
+        row = conn.execute(
+            'SELECT mtime_ns FROM directories WHERE source = ? AND directory = ?',
+            (source, directory)
+        ).fetchone()
+        known = {
+            r['name']: r for r in conn.execute(
+                'SELECT name, mtime, size, checked_at FROM entries WHERE source = ? AND directory = ?',
+                (source, directory)
+            )
+        }
+
+        now = time.time()
+        dir_changed = row is None or row['mtime_ns'] != dir_stat.st_mtime_ns
+        if dir_changed:
+            names = self._list_names(directory)
+            counts['listed'] = len(names)
+            removed = [name for name in known if name not in names]
+            candidates = [
+                name for name in names
+                if name not in known or self._needs_recheck(known[name], now, volatile)
+            ]
+        else:
+            removed = []
+            candidates = [
+                name for name, entry in known.items()
+                if self._needs_recheck(entry, now, volatile)
+            ]
+
+        upserts = []
+        for name in candidates:
+            path = Path(directory) / name
+            try:
+                stat = path.stat()
+            except OSError:
+                if name in known:
+                    removed.append(name)
+                continue
+
+            previous = known.get(name)
+            if (previous is not None and previous['mtime'] == stat.st_mtime
+                    and not self._is_hot(stat.st_mtime, now)):
+                continue
+
+            counts['parsed'] += 1
+            record = parse_entry(path, stat)
+            if record is None:
+                if previous is not None:
+                    removed.append(name)
+                continue
+            upserts.append(record_row(source, directory, name, path, stat, record, now))
+
+        if not upserts and not removed and not dir_changed:
+            return
+
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany(
+                'INSERT OR REPLACE INTO entries '
+                '(source, directory, name, path, db_name, timestamp, mtime, size, kind, extra, checked_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                upserts
+            )
+            conn.executemany(
+                'DELETE FROM entries WHERE source = ? AND directory = ? AND name = ?',
+                [(source, directory, name) for name in removed]
+            )
+            conn.execute(
+                'INSERT OR REPLACE INTO directories (source, directory, mtime_ns, scanned_at) VALUES (?, ?, ?, ?)',
+                (source, directory, dir_stat.st_mtime_ns, now)
+            )
+
+    def entries(self, source, directory, descending=False):
+        """Entradas del catálogo ordenadas por nombre."""
+        order = 'DESC' if descending else 'ASC'
+        rows = self._connection().execute(
+            f'SELECT * FROM entries WHERE source = ? AND directory = ? ORDER BY name {order}',
+            (source, str(directory))
+        ).fetchall()
+        return [row_to_dict(row) for row in rows]
+
+    def older_than(self, source, directory, cutoff_ts):
+        """Entradas cuyo mtime es anterior a cutoff_ts (epoch)."""
+        rows = self._connection().execute(
+            'SELECT * FROM entries WHERE source = ? AND directory = ? AND mtime < ? ORDER BY name',
+            (source, str(directory), cutoff_ts)
+        ).fetchall()
+        return [row_to_dict(row) for row in rows]
+
+    @staticmethod
+    def _filters(source, directory, db_name=None, db_contains=None, kinds=None, since=None, until=None,
+                 exclude_db=()):
+        clauses = ['source = ?', 'directory = ?']
+        params = [source, str(directory)]
+        if db_name:
+            clauses.append('db_name = ?')
+            params.append(db_name)
+        if db_contains:
+            escaped = db_contains.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            clauses.append("LOWER(db_name) LIKE ? ESCAPE '\\'")
+            params.append(f'%{escaped}%')
+        if kinds:
+            clauses.append(f'kind IN ({", ".join("?" * len(kinds))})')
+            params.extend(kinds)
+        if since is not None:
+            clauses.append('timestamp >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('timestamp < ?')
+            params.append(until)
+        if exclude_db:
+            clauses.append(f"LOWER(COALESCE(db_name, '')) NOT IN ({', '.join('?' * len(exclude_db))})")
+            params.extend(sorted(exclude_db))
+        return clauses, params
+
+    def page(self, source, directory, limit=50, sort='date', descending=True, after=None, **filters):
+        """Una página de entradas filtradas y ordenadas, con paginación por cursor.
+
+        after es la clave (valor de orden, nombre) de la última entrada de la
+        página anterior. Devuelve (entradas, clave para pedir la siguiente o None).
+        Filtros: db_name, db_contains, kinds, since/until (epoch), exclude_db.
+        """
+        column = SORT_COLUMNS[sort]
+        clauses, params = self._filters(source, directory, **filters)
+        op, order = ('<', 'DESC') if descending else ('>', 'ASC')
+        if after is not None:
+            clauses.append(f'({column} {op} ? OR ({column} = ? AND name {op} ?))')
+            params.extend([after[0], after[0], after[1]])
+        rows = self._connection().execute(
+            f'SELECT *, {column} AS sort_key FROM entries WHERE {" AND ".join(clauses)} '
+            f'ORDER BY {column} {order}, name {order} LIMIT ?',
+            (*params, limit + 1)
+        ).fetchall()
+        entries = [row_to_dict(row) for row in rows[:limit]]
+        next_key = (rows[limit - 1]['sort_key'], rows[limit - 1]['name']) if len(rows) > limit else None
+        for entry in entries:
+            entry.pop('sort_key')
+        return entries, next_key
+
+    def summary(self, source, directory, **filters):
+        """(cantidad, última modificación en epoch) de las entradas filtradas.
+
+        La última modificación incluye el mtime del directorio, que cambia
+        también cuando se borra un backup.
+        """
+        clauses, params = self._filters(source, directory, **filters)
+        conn = self._connection()
+        count, last_mtime = conn.execute(
+            f'SELECT COUNT(*), MAX(mtime) FROM entries WHERE {" AND ".join(clauses)}', params
+        ).fetchone()
+        dir_row = conn.execute(
+            'SELECT mtime_ns FROM directories WHERE source = ? AND directory = ?', (source, str(directory))
+        ).fetchone()
+        modified = [value for value in (last_mtime, dir_row and dir_row['mtime_ns'] / 1e9) if value]
+        return count, max(modified) if modified else None
+
+    def latest_by_db(self, source, directory):
+        """Backup más nuevo de cada base (db_name, name, timestamp, size)."""
+        rows = self._connection().execute(
+            'SELECT db_name, name, MAX(timestamp) AS timestamp, size FROM entries '
+            'WHERE source = ? AND directory = ? GROUP BY db_name',
+            (source, str(directory))
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def remove(self, source, directory, names):
+        """Quita entradas del catálogo (tras borrarlas del disco)."""
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                'DELETE FROM entries WHERE source = ? AND directory = ? AND name = ?',
+                [(source, str(directory), name) for name in names]
+            )
+
+    def record_run(self, run_id, kind, result):
+        """Registra el resultado de un backup de una base (duración y volumen)."""
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                'INSERT INTO backup_runs (run_id, kind, db_name, path, status, started_at, seconds, '
+                'bytes_raw, bytes_written, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (run_id, kind, result['db_name'], result.get('path'), result['status'],
+                 result['started_at'], result.get('seconds'), result.get('bytes_raw'),
+                 result.get('bytes_written'), result.get('error'))
+            )
+
+    def recent_runs(self, limit=100):
+        rows = self._connection().execute(
+            'SELECT * FROM backup_runs ORDER BY started_at DESC LIMIT ?', (limit,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def last_runs(self):
+        """Última corrida registrada de cada base y tipo de backup."""
+        rows = self._connection().execute(
+            'SELECT kind, db_name, status, MAX(started_at) AS started_at, seconds, bytes_raw, bytes_written '
+            'FROM backup_runs GROUP BY kind, db_name'
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def last_run(self, path):
+        """Último backup exitoso registrado para path (o None)."""
+        row = self._connection().execute(
+            "SELECT * FROM backup_runs WHERE path = ? AND status = 'success' ORDER BY started_at DESC LIMIT 1",
+            (str(path),)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def _forget_directory(self, source, directory):
+        conn = self._connection()
+        exists = conn.execute(
+            'SELECT 1 FROM directories WHERE source = ? AND directory = ?', (source, directory)
+        ).fetchone()
+        if not exists:
+            return
+        with conn:
+            conn.execute('DELETE FROM entries WHERE source = ? AND directory = ?', (source, directory))
+            conn.execute('DELETE FROM directories WHERE source = ? AND directory = ?', (source, directory))
+
+    def _is_hot(self, mtime, now):
+        return now - mtime < self.settle_seconds
+
+    def _needs_recheck(self, entry, now, volatile):
+        if volatile:
+            return True
+        return self._is_hot(entry['mtime'], now) and now - entry['checked_at'] >= self.recheck_seconds
+
+    @staticmethod
+    def _list_names(directory):
+        with os.scandir(directory) as it:
+            return {entry.name for entry in it}
+
+
+def record_row(source, directory, name, path, stat, record, now):
+    extra = record.get('extra')
+    return (
+        source, directory, name, str(path),
+        record.get('db_name'),
+        record.get('timestamp', stat.st_mtime),
+        stat.st_mtime,
+        record.get('size', stat.st_size),
+        record.get('kind'),
+        json.dumps(extra) if extra is not None else None,
+        now,
+    )
+
+
+def row_to_dict(row):
+    data = dict(row)
+    data['extra'] = json.loads(data['extra']) if data['extra'] else {}
+    return data
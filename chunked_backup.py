@@ -0,0 +1,558 @@
+"""
+Formato de backup por tablas (directorio <db>-back_<fecha>.chunked/)
+Volcado en paralelo de tablas y rangos de clave primaria bajo un único
+snapshot consistente, y carga en paralelo: esquema -> datos -> índices ->
+claves foráneas, rutinas y eventos, vistas y triggers
+"""
+
+import json
+import math
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import pymysql
+except ImportError:  # El formato chunked necesita PyMySQL para el snapshot compartido
+    pymysql = None
+
+from backup_codecs import CODECS
+from restore_pipeline import restore_file, restore_files
+
+FORMAT_VERSION = 1
+CHUNKED_SUFFIX = '.chunked'
+MANIFEST_NAME = 'manifest.json'
+# Orden de carga de post/: las vistas pueden llamar funciones de la base (MySQL
+# las valida al crear la vista), así que las rutinas van antes, como en mysqldump
+POST_ORDER = ('foreign_keys', 'routines', 'views', 'triggers')
+
+CHUNK_ROWS = 500000
+INSERT_MAX_BYTES = 1024 * 1024
+FETCH_ROWS = 1000
+
+# Igual que mysqldump: fechas en UTC y sin reasignar AUTO_INCREMENT a los 0
+SESSION_HEADER = (
+    "SET NAMES utf8mb4;\n"
+    "SET time_zone = '+00:00';\n"
+    "SET sql_mode = 'NO_AUTO_VALUE_ON_ZERO';\n"
+    "SET foreign_key_checks = 0;\n"
+    "SET unique_checks = 0;\n"
+)
+
+INTEGER_TYPES = {'tinyint', 'smallint', 'mediumint', 'int', 'integer', 'bigint'}
+NUMERIC_TYPES = INTEGER_TYPES | {'decimal', 'numeric', 'float', 'double', 'real', 'year'}
+BINARY_TYPES = {
+    'binary', 'varbinary', 'tinyblob', 'blob', 'mediumblob', 'longblob', 'bit',
+    'geometry', 'point', 'linestring', 'polygon', 'multipoint', 'multilinestring',
+    'multipolygon', 'geometrycollection', 'geomcollection',
+}
+
+# Definiciones que se crean después de cargar los datos
+DEFERRED_KEY_RE = re.compile(r'^(UNIQUE KEY|KEY|FULLTEXT KEY|SPATIAL KEY|UNIQUE INDEX|INDEX)\b')
+FOREIGN_KEY_RE = re.compile(r'^CONSTRAINT\s+`(?:[^`]|``)+`\s+FOREIGN KEY\b')
+AUTO_INCREMENT_COLUMN_RE = re.compile(r'^`((?:[^`]|``)+)`\s.*\bAUTO_INCREMENT\b')
+
+
+class ChunkedBackupError(Exception):
+    """Error de volcado o carga del formato chunked."""
+
+
+def quote_name(name):
+    return '`' + name.replace('`', '``') + '`'
+
+
+def safe_filename(name):
+    return re.sub(r'[^\w.-]', '_', name)
+
+
+def is_chunked_backup(path):
+    path = Path(path)
+    return path.name.endswith(CHUNKED_SUFFIX) and (path / MANIFEST_NAME).is_file()
+
+
+def read_manifest(path):
+    with open(Path(path) / MANIFEST_NAME) as f:
+        return json.load(f)
+
+
+def split_create_table(create_sql):
+    """Separa SHOW CREATE TABLE en (CREATE sin índices secundarios, índices, claves foráneas).
+
+    Se conserva el índice que contenga la columna AUTO_INCREMENT (InnoDB lo
+    exige al crear la tabla).
+    """
+    lines = create_sql.split('\n')
+    close = next(i for i in range(1, len(lines)) if lines[i].startswith(')'))
+    definitions = [line.strip().rstrip(',') for line in lines[1:close]]
+
+    auto_increment = None
+    for definition in definitions:
+        match = AUTO_INCREMENT_COLUMN_RE.match(definition)
+        if match:
+            auto_increment = quote_name(match.group(1).replace('``', '`'))
+
+    keep, indexes, foreign_keys = [], [], []
+    for definition in definitions:
+        if FOREIGN_KEY_RE.match(definition):
+            foreign_keys.append(definition)
+        elif DEFERRED_KEY_RE.match(definition) and not (auto_increment and f'({auto_increment}' in definition):
+            indexes.append(definition)
+        else:
+            keep.append(definition)
+
+    create = '\n'.join([lines[0], ',\n'.join(f'  {d}' for d in keep)] + lines[close:])
+    return create, indexes, foreign_keys
+
+
+def alter_statements(table, indexes):
+    """ALTER TABLE para agregar índices: uno para los normales y uno por FULLTEXT
+    (InnoDB solo crea un FULLTEXT por sentencia)."""
+    normal = [d for d in indexes if not d.startswith('FULLTEXT')]
+    statements = []
+    if normal:
+        statements.append(f'ALTER TABLE {quote_name(table)} ' + ', '.join(f'ADD {d}' for d in normal) + ';')
+    for definition in indexes:
+        if definition.startswith('FULLTEXT'):
+            statements.append(f'ALTER TABLE {quote_name(table)} ADD {definition};')
+    return statements
+
+
+def column_expression(column, data_type):
+    """Expresión SQL que el servidor devuelve ya escapada como literal."""
+    name = quote_name(column)
+    if data_type in NUMERIC_TYPES:
+        return f"IFNULL({name}, 'NULL')"
+    if data_type in BINARY_TYPES:
+        return f"IF({name} IS NULL, 'NULL', IF(LENGTH({name}) = 0, '''''', CONCAT('0x', HEX({name}))))"
+    return f'QUOTE(CONVERT({name} USING utf8mb4))'
+
+
+def _query(conn, sql, args=None):
+    with conn.cursor() as cursor:
+        cursor.execute(sql, args)
+        return cursor.fetchall()
+
+
+class SnapshotSessions:
+    """Conexiones que comparten el mismo snapshot InnoDB.
+
+    Con FLUSH TABLES WITH READ LOCK tomado se abre START TRANSACTION WITH
+    CONSISTENT SNAPSHOT en todas y se libera el lock: cada conexión ve los mismos
+    datos y se registra la posición del binlog de ese instante (también con una
+    sola conexión, para que el backup sirva de base de PITR). Sin privilegio
+    RELOAD se usa una sola conexión (consistente, pero sin paralelismo ni
+    coordenadas de binlog).
+    """
+
+    def __init__(self, host, user, password, size):
+        self.host = host
+        self.user = user
+        self.password = password
+        self.size = max(1, size)
+        self.binlog = None
+        self._connections = []
+        self._idle = queue.Queue()
+
+    def _connect(self):
+        conn = pymysql.connect(host=self.host, user=self.user, password=self.password,
+                               charset='utf8mb4', autocommit=True, connect_timeout=10)
+        _query(conn, "SET SESSION time_zone = '+00:00'")
+        _query(conn, 'SET SESSION TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        return conn
+
+    def open(self):
+        self._connections = [self._connect() for _ in range(self.size)]
+        leader = self._connections[0]
+        locked = False
+        try:
+            _query(leader, 'FLUSH TABLES WITH READ LOCK')
+            locked = True
+        except pymysql.MySQLError as e:
+            print(f'Aviso: FLUSH TABLES WITH READ LOCK no disponible ({e}); se usa una sola conexión '
+                  f'y el backup no registra coordenadas de binlog')
+            for conn in self._connections[1:]:
+                conn.close()
+            self._connections = [leader]
+        try:
+            if locked:
+                self.binlog = read_binlog_position(leader)
+            for conn in self._connections:
+                _query(conn, 'START TRANSACTION WITH CONSISTENT SNAPSHOT')
+        finally:
+            if locked:
+                _query(leader, 'UNLOCK TABLES')
+        for conn in self._connections:
+            self._idle.put(conn)
+        return self
+
+    @property
+    def workers(self):
+        return len(self._connections)
+
+    @contextmanager
+    def connection(self):
+        conn = self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        for conn in self._connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._connections = []
+
+
+def read_binlog_position(conn):
+    """Archivo/posición del binlog (None si el binlog está deshabilitado)."""
+    for sql in ('SHOW MASTER STATUS', 'SHOW BINARY LOG STATUS'):
+        try:
+            rows = _query(conn, sql)
+        except pymysql.MySQLError:
+            continue
+        if rows:
+            row = rows[0]
+            return {'file': row[0], 'position': int(row[1]),
+                    'gtid_executed': row[4] if len(row) > 4 else None}
+        return None
+    return None
+
+
+def _table_metadata(conn, db_name):
+    tables = {}
+    for name, rows, data_length in _query(
+        conn,
+        'SELECT TABLE_NAME, TABLE_ROWS, DATA_LENGTH FROM information_schema.TABLES '
+        "WHERE TABLE_SCHEMA = %s AND TABLE_TYPE = 'BASE TABLE'", (db_name,)
+    ):
+        tables[name] = {'name': name, 'rows': int(rows or 0), 'data_length': int(data_length or 0),
+                        'columns': [], 'primary_key': []}
+
+    for table, column, data_type, extra in _query(
+        conn,
+        'SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE, EXTRA FROM information_schema.COLUMNS '
+        'WHERE TABLE_SCHEMA = %s ORDER BY TABLE_NAME, ORDINAL_POSITION', (db_name,)
+    ):
+        if table in tables and 'GENERATED' not in (extra or '').upper():
+            tables[table]['columns'].append((column, data_type.lower()))
+
+    for table, column in _query(
+        conn,
+        'SELECT TABLE_NAME, COLUMN_NAME FROM information_schema.STATISTICS '
+        "WHERE TABLE_SCHEMA = %s AND INDEX_NAME = 'PRIMARY' ORDER BY TABLE_NAME, SEQ_IN_INDEX", (db_name,)
+    ):
+        if table in tables:
+            tables[table]['primary_key'].append(column)
+    return tables
+
+
+def _plan_chunks(conn, db_name, table, chunk_rows):
+    """Rangos [lo, hi) sobre una PK entera de una columna; si no hay, la tabla entera."""
+    pk = table['primary_key']
+    types = dict(table['columns'])
+    if len(pk) != 1 or types.get(pk[0]) not in INTEGER_TYPES or table['rows'] <= chunk_rows:
+        return [None]
+
+    column = quote_name(pk[0])
+    low, high = _query(conn, f'SELECT MIN({column}), MAX({column}) '
+                             f'FROM {quote_name(db_name)}.{quote_name(table["name"])}')[0]
+    if low is None:
+        return [None]
+    count = math.ceil(table['rows'] / chunk_rows)
+    step = max(1, math.ceil((int(high) - int(low) + 1) / count))
+    ranges = []
+    start = int(low)
+    while start <= int(high):
+        end = start + step
+        ranges.append((start, end if end <= int(high) else None))
+        start = end
+    return [
+        f'{column} >= {lo}' + (f' AND {column} < {hi}' if hi is not None else '')
+        for lo, hi in ranges
+    ]
+
+
+def _dump_chunk(snapshot, db_name, table, where, path, codec, level):
+    columns = ', '.join(quote_name(column) for column, _ in table['columns'])
+    row_sql = ', '.join(column_expression(column, data_type) for column, data_type in table['columns'])
+    sql = (f"SELECT CONCAT('(', CONCAT_WS(',', {row_sql}), ')') "
+           f'FROM {quote_name(db_name)}.{quote_name(table["name"])}')
+    if where:
+        sql += f' WHERE {where}'
+    insert = f'INSERT INTO {quote_name(table["name"])} ({columns}) VALUES\n'
+
+    rows = 0
+    bytes_raw = 0
+    with snapshot.connection() as conn, codec.open_file(path, level) as out:
+        def write(text):
+            nonlocal bytes_raw
+            data = text.encode('utf-8')
+            out.write(data)
+            bytes_raw += len(data)
+
+        write(SESSION_HEADER + f'USE {quote_name(db_name)};\n')
+        batch, batch_size = [], 0
+        with conn.cursor(pymysql.cursors.SSCursor) as cursor:
+            cursor.execute(sql)
+            while True:
+                fetched = cursor.fetchmany(FETCH_ROWS)
+                if not fetched:
+                    break
+                for (value,) in fetched:
+                    if value is None:
+                        raise ChunkedBackupError(
+                            f'{db_name}.{table["name"]}: fila mayor que max_allowed_packet')
+                    batch.append(value)
+                    batch_size += len(value) + 2
+                    rows += 1
+                    if batch_size >= INSERT_MAX_BYTES:
+                        write(insert + ',\n'.join(batch) + ';\n')
+                        batch, batch_size = [], 0
+        if batch:
+            write(insert + ',\n'.join(batch) + ';\n')
+    return {'rows': rows, 'bytes_raw': bytes_raw, 'bytes': path.stat().st_size}
+
+
+def _show_create(conn, sql, column):
+    rows = _query(conn, sql)
+    return (rows[0][1], rows[0][column]) if rows else (None, None)
+
+
+def _routines_sql(conn, db_name):
+    """Procedimientos, funciones y eventos con su sql_mode original."""
+    statements = []
+    for kind in ('PROCEDURE', 'FUNCTION'):
+        for row in _query(conn, f'SHOW {kind} STATUS WHERE Db = %s', (db_name,)):
+            sql_mode, create = _show_create(
+                conn, f'SHOW CREATE {kind} {quote_name(db_name)}.{quote_name(row[1])}', 2)
+            if create is None:
+                print(f'Aviso: sin permisos para leer {kind} {db_name}.{row[1]}; se omite')
+                continue
+            statements.append((sql_mode, create))
+    for row in _query(conn, f'SHOW EVENTS FROM {quote_name(db_name)}'):
+        sql_mode, create = _show_create(conn, f'SHOW CREATE EVENT {quote_name(db_name)}.{quote_name(row[1])}', 3)
+        if create is not None:
+            statements.append((sql_mode, create))
+    return statements
+
+
+def _triggers_sql(conn, db_name):
+    statements = []
+    for (name,) in _query(
+        conn,
+        'SELECT TRIGGER_NAME FROM information_schema.TRIGGERS WHERE TRIGGER_SCHEMA = %s '
+        'ORDER BY EVENT_OBJECT_TABLE, ACTION_TIMING, EVENT_MANIPULATION, ACTION_ORDER', (db_name,)
+    ):
+        sql_mode, create = _show_create(conn, f'SHOW CREATE TRIGGER {quote_name(db_name)}.{quote_name(name)}', 2)
+        if create is not None:
+            statements.append((sql_mode, create))
+    return statements
+
+
+def _views_sql(conn, db_name, views):
+    """CREATE VIEW ordenadas para que una vista se cree después de las que usa."""
+    creates = {
+        name: _query(conn, f'SHOW CREATE VIEW {quote_name(db_name)}.{quote_name(name)}')[0][1]
+        for name in views
+    }
+    ordered, pending = [], dict(creates)
+    while pending:
+        ready = [
+            name for name, create in pending.items()
+            if not any(quote_name(other) in create for other in pending if other != name)
+        ] or sorted(pending)[:1]
+        for name in sorted(ready):
+            ordered.append(pending.pop(name) + ';')
+    return ordered
+
+
+def _delimited(statements):
+    lines = ['DELIMITER ;;']
+    for sql_mode, create in statements:
+        lines.append(f"SET sql_mode = '{sql_mode}';;")
+        lines.append(f'{create};;')
+    lines.append('DELIMITER ;')
+    return '\n'.join(lines) + '\n'
+
+
+def _write_text(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding='utf-8')
+    return path.stat().st_size
+
+
+def dump_chunked(db_name, target, host, user, password, workers=4, level=6, chunk_rows=CHUNK_ROWS, codec=None):
+    """Vuelca db_name al directorio target y devuelve el manifiesto.
+
+    Los archivos de datos se comprimen con codec (gzip por defecto).
+    """
+    codec = codec or CODECS['gzip']
+    if pymysql is None:
+        raise ChunkedBackupError('El formato chunked requiere PyMySQL (pip install PyMySQL)')
+
+    started = time.time()
+    target = Path(target)
+    target.mkdir(parents=True, exist_ok=True)
+    header = SESSION_HEADER + f'USE {quote_name(db_name)};\n'
+    manifest = {
+        'format': 'chunked', 'version': FORMAT_VERSION, 'db_name': db_name, 'created_at': started,
+        'codec': codec.name,
+        'schema': [], 'data': [], 'indexes': [], 'post': [],
+    }
+    bytes_written = 0
+
+    snapshot = SnapshotSessions(host, user, password, workers).open()
+    try:
+        manifest['binlog'] = snapshot.binlog
+        manifest['workers'] = snapshot.workers
+        with snapshot.connection() as conn:
+            create_db = _query(conn, f'SHOW CREATE DATABASE {quote_name(db_name)}')[0][1]
+            bytes_written += _write_text(
+                target / 'schema' / '00-database.sql',
+                f'{SESSION_HEADER}DROP DATABASE IF EXISTS {quote_name(db_name)};\n{create_db};\n'
+            )
+            manifest['schema'].append('schema/00-database.sql')
+
+            tables = _table_metadata(conn, db_name)
+            views = [row[0] for row in _query(conn, f'SHOW FULL TABLES FROM {quote_name(db_name)} '
+                                                    "WHERE Table_type = 'VIEW'")]
+            foreign_keys = []
+            chunks = []
+            used_names = set()
+            for name in sorted(tables, key=lambda t: -tables[t]['data_length']):
+                table = tables[name]
+                filename = safe_filename(name)
+                while filename in used_names:
+                    filename += '_'
+                used_names.add(filename)
+
+                create = _query(conn, f'SHOW CREATE TABLE {quote_name(db_name)}.{quote_name(name)}')[0][1]
+                create, indexes, table_fks = split_create_table(create)
+                bytes_written += _write_text(target / 'schema' / f'{filename}.sql', f'{header}{create};\n')
+                manifest['schema'].append(f'schema/{filename}.sql')
+                if indexes:
+                    relative = f'post/indexes/{filename}.sql'
+                    bytes_written += _write_text(target / relative,
+                                                 header + '\n'.join(alter_statements(name, indexes)) + '\n')
+                    manifest['indexes'].append(relative)
+                foreign_keys.extend(f'ALTER TABLE {quote_name(name)} ADD {fk};' for fk in table_fks)
+
+                if table['columns']:
+                    for n, where in enumerate(_plan_chunks(conn, db_name, table, chunk_rows)):
+                        chunks.append((table, where, f'data/{filename}.{n:05d}.sql{codec.extension}'))
+
+            routines = _routines_sql(conn, db_name)
+            triggers = _triggers_sql(conn, db_name)
+            post = [  # en POST_ORDER
+                ('foreign_keys', '\n'.join(foreign_keys) if foreign_keys else None),
+                ('routines', _delimited(routines) if routines else None),
+                ('views', '\n'.join(_views_sql(conn, db_name, views)) if views else None),
+                ('triggers', _delimited(triggers) if triggers else None),
+            ]
+            for name, body in post:
+                if body:
+                    relative = f'post/{name}.sql'
+                    bytes_written += _write_text(target / relative, f'{header}{body}\n')
+                    manifest['post'].append(relative)
+
+        (target / 'data').mkdir(exist_ok=True)
+        with ThreadPoolExecutor(max_workers=snapshot.workers, thread_name_prefix='chunk') as pool:
+            futures = [
+                (table, relative, pool.submit(_dump_chunk, snapshot, db_name, table, where, target / relative, codec, level))
+                for table, where, relative in chunks
+            ]
+            try:
+                for table, relative, future in futures:
+                    result = future.result()
+                    manifest['data'].append({'table': table['name'], 'file': relative, **result})
+            except BaseException:
+                for _, _, future in futures:
+                    future.cancel()
+                raise
+    finally:
+        snapshot.close()
+
+    manifest['bytes_raw'] = sum(item['bytes_raw'] for item in manifest['data'])
+    manifest['bytes_written'] = bytes_written + sum(item['bytes'] for item in manifest['data'])
+    manifest['seconds'] = time.time() - started
+    with open(target / MANIFEST_NAME, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_chunked(path, cmd, env=None, job=None, threads=4):
+    """Carga un backup chunked con `threads` clientes en paralelo.
+
+    Fases: esquema (un cliente) -> datos (paralelo) -> índices (paralelo, una
+    tabla por cliente) -> claves foráneas, rutinas, vistas y triggers (en
+    POST_ORDER también para backups anteriores que las guardaron en otro orden).
+    """
+    path = Path(path)
+    manifest = read_manifest(path)
+    started = time.monotonic()
+    totals = {'bytes_out': 0}
+
+    if job is not None:
+        job.set_phase('Creando esquema')
+    totals['bytes_out'] += restore_files([path / f for f in manifest['schema']], cmd, env=env)['bytes_out']
+
+    data_bytes = sum(item['bytes'] for item in manifest['data'])
+    if job is not None:
+        job.set_phase(f'Cargando datos ({len(manifest["data"])} bloques, {threads} en paralelo)',
+                      total_bytes=data_bytes)
+    _run_parallel([(path / item['file'], item['bytes']) for item in manifest['data']],
+                  cmd, env, job, threads, totals)
+
+    if manifest['indexes']:
+        if job is not None:
+            job.set_phase(f'Creando índices ({len(manifest["indexes"])} tablas)')
+        _run_parallel([(path / f, (path / f).stat().st_size) for f in manifest['indexes']],
+                      cmd, env, job, threads, totals)
+
+    if manifest['post']:
+        if job is not None:
+            job.set_phase('Claves foráneas, rutinas, vistas y triggers')
+        post = sorted(manifest['post'], key=lambda f: POST_ORDER.index(Path(f).stem)
+                      if Path(f).stem in POST_ORDER else len(POST_ORDER))
+        totals['bytes_out'] += restore_files([path / f for f in post], cmd, env=env)['bytes_out']
+
+    seconds = max(time.monotonic() - started, 0.001)
+    return {
+        'bytes_read': manifest.get('bytes_written', 0),
+        'bytes_out': totals['bytes_out'],
+        'seconds': seconds,
+        'mb_s': totals['bytes_out'] / seconds / (1024 * 1024),
+    }
+
+
+def _run_parallel(files, cmd, env, job, threads, totals):
+    """Restaura archivos independientes con varios clientes; corta ante el primer error."""
+    lock = threading.Lock()
+    progress = {'bytes_read': 0, 'bytes_out': 0}
+
+    def load(item):
+        file_path, size = item
+        stats = restore_file(file_path, cmd, env=env, threads=1)
+        with lock:
+            progress['bytes_read'] += size
+            progress['bytes_out'] += stats['bytes_out']
+            if job is not None:
+                job.update(**progress)
+
+    with ThreadPoolExecutor(max_workers=max(1, threads), thread_name_prefix='load') as pool:
+        futures = [pool.submit(load, item) for item in files]
+        try:
+            for future in futures:
+                future.result()
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    totals['bytes_out'] += progress['bytes_out']
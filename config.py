@@ -0,0 +1,58 @@
+"""
+Configuración compartida (.env) entre la interfaz web y los scripts de backup
+"""
+
+import os
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parent
+
+
+# Cargar configuración desde .env (MYSQL_BACKUP_ENV permite usar otro archivo, p. ej. benchmark.py)
+def load_env():
+    env_path = Path(os.environ.get('MYSQL_BACKUP_ENV', '').strip() or BASE_DIR / '.env')
+    env_vars = {}
+    if env_path.exists():
+        with open(env_path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#') and '=' in line:
+                    key, value = line.split('=', 1)
+                    # Remover comillas si existen
+                    value = value.strip('"\'')
+                    env_vars[key] = value
+    return env_vars
+
+
+env = load_env()
+
+# Credenciales MySQL
+MYSQL_HOST = env.get('MYSQL_HOST', '127.0.0.1')
+MYSQL_USER = env.get('MYSQL_USER', '')
+MYSQL_PASS = env.get('MYSQL_PASS', '')
+
+# Configuración de directorios
+DIR_DESTINO = env.get('DIR_DESTINO', '/mnt/backup/mysql')
+DIR_DESTINO_INC = env.get('DIR_DESTINO_INC', '/mnt/backup/mysql/incremental')
+FECHA_FORMAT = env.get('FECHA_FORMAT', '%Y-%m-%d_%H-%M')
+EXCLUDE_DB = {
+    db.strip().lower()
+    for db in env.get('EXCLUDE_DB', 'information_schema|performance_schema|mysql|sys').split('|')
+    if db.strip()
+}
+
+# Catálogo persistente de backups (evita glob+stat en cada request)
+CATALOG_PATH = env.get('CATALOG_PATH', '').strip() or str(BASE_DIR / 'backup_catalog.sqlite3')
+CATALOG_SETTLE_SECONDS = int(env.get('CATALOG_SETTLE_SECONDS', '10800'))
+
+# Almacén de chunks de los backups deduplicados (BACKUP_FORMAT="dedup")
+DEDUP_STORE_DIR = env.get('DEDUP_STORE_DIR', '').strip() or str(Path(DIR_DESTINO) / '.dedup-store')
+
+# Metadatos del servidor MySQL (pool de conexiones + caché TTL)
+MYSQL_META_TTL = int(env.get('MYSQL_META_TTL', '60'))
+MYSQL_POOL_SIZE = int(env.get('MYSQL_POOL_SIZE', '4'))
+
+
+def mysql_client_env():
+    """Entorno para clientes mysql/mysqldump: la contraseña va por MYSQL_PWD (no en argv)."""
+    return {**os.environ, 'MYSQL_PWD': MYSQL_PASS}
@@ -0,0 +1,274 @@
+"""
+Almacén deduplicado de backups MySQL
+Parte el flujo de mysqldump en chunks definidos por contenido, guarda cada
+chunk distinto una sola vez (zlib, nombrado por su SHA-256) y registra cada
+backup como un manifiesto JSON <db>-back_<fecha>.dedup en DIR_DESTINO
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+from restore_pipeline import feed_process
+
+DEDUP_SUFFIX = '.dedup'
+MANIFEST_VERSION = 1
+
+# Cortes posibles: fin de línea o separador de filas de un INSERT extendido.
+# Se corta en uno de ellos cuando el CRC de los bytes previos cumple la
+# máscara: el mismo contenido produce los mismos cortes aunque se haya
+# insertado o borrado algo antes (los chunks siguientes vuelven a coincidir)
+BOUNDARY_RE = re.compile(rb'\n|\),\(')
+BOUNDARY_WINDOW = 48
+BOUNDARY_MASK = 0xff
+CHUNK_MIN_SIZE = 64 * 1024
+CHUNK_MAX_SIZE = 4 * 1024 * 1024
+
+CHUNK_LEVEL = 6
+
+
+class DedupStoreError(Exception):
+    """Manifiesto ilegible o chunk faltante/corrupto en el almacén."""
+
+
+class ContentChunker:
+    """Acumula datos y devuelve chunks cuyos límites dependen solo del contenido."""
+
+    def __init__(self, min_size=CHUNK_MIN_SIZE, max_size=CHUNK_MAX_SIZE, mask=BOUNDARY_MASK):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.mask = mask
+        self._buffer = bytearray()
+        self._scan = min_size
+
+    def feed(self, data):
+        """Agrega data y devuelve la lista de chunks completos."""
+        self._buffer += data
+        chunks = []
+        while True:
+            cut = self._find_cut()
+            if cut is None:
+                return chunks
+            chunks.append(bytes(self._buffer[:cut]))
+            del self._buffer[:cut]
+            self._scan = self.min_size
+
+    def finish(self):
+        """Último chunk (lo que quede en el buffer), o None."""
+        if not self._buffer:
+            return None
+        chunk = bytes(self._buffer)
+        self._buffer.clear()
+        return chunk
+
+    def _find_cut(self):
+        buffer = self._buffer
+        limit = min(len(buffer), self.max_size)
+        pos = self._scan
+        while pos < limit:
+            match = BOUNDARY_RE.search(buffer, pos, limit)
+            if match is None:
+                break
+            cut = match.end()
+            if zlib.crc32(buffer[cut - BOUNDARY_WINDOW:cut]) & self.mask == 0:
+                return cut
+            pos = cut
+        if len(buffer) >= self.max_size:
+            return self.max_size
+        # Un separador de 3 bytes puede quedar partido entre dos lecturas
+        self._scan = max(self.min_size, len(buffer) - 2)
+        return None
+
+
+class DedupStore:
+    """Chunks comprimidos en <root>/chunks/<hh>/<sha256>.
+
+    Los backups toman un lock compartido mientras escriben; la limpieza de
+    chunks sin referencias toma el lock exclusivo.
+    """
+
+    def __init__(self, root, level=CHUNK_LEVEL):
+        self.root = Path(root)
+        self.level = level
+        self.chunks_dir = self.root / 'chunks'
+
+    def chunk_path(self, digest):
+        return self.chunks_dir / digest[:2] / digest
+
+    @contextmanager
+    def lock(self, exclusive=False, blocking=True):
+        """Lock compartido (escritura de backups) o exclusivo (recolección)."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / '.lock', 'a') as handle:
+            flags = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+            fcntl.flock(handle, flags if blocking else flags | fcntl.LOCK_NB)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def put(self, data):
+        """Guarda data si no existe; devuelve (sha256, bytes, bytes escritos en disco)."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.chunk_path(digest)
+        if path.exists():
+            return digest, len(data), 0
+        compressed = zlib.compress(data, self.level)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f'.{digest}.{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(compressed)
+        os.replace(tmp, path)
+        return digest, len(data), len(compressed)
+
+    def get(self, digest):
+        """Contenido de un chunk verificado contra su SHA-256."""
+        try:
+            data = zlib.decompress(self.chunk_path(digest).read_bytes())
+        except (OSError, zlib.error) as e:
+            raise DedupStoreError(f'chunk {digest[:12]} ilegible: {e}')
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise DedupStoreError(f'chunk {digest[:12]} corrupto (SHA-256 distinto)')
+        return data
+
+    def collect_garbage(self, manifest_dirs, blocking=False):
+        """Borra los chunks que ningún manifiesto referencia.
+
+        Devuelve (chunks borrados, bytes liberados), o None si hay backups
+        escribiendo en el almacén y blocking es False.
+        """
+        try:
+            with self.lock(exclusive=True, blocking=blocking):
+                referenced = set()
+                for directory in manifest_dirs:
+                    for manifest_path in Path(directory).glob(f'*{DEDUP_SUFFIX}'):
+                        referenced.update(digest for digest, _ in read_manifest(manifest_path)['chunks'])
+                removed = freed = 0
+                if not self.chunks_dir.exists():
+                    return removed, freed
+                for entry in self.chunks_dir.glob('*/*'):
+                    if entry.name in referenced:
+                        continue
+                    freed += entry.stat().st_size
+                    entry.unlink()
+                    removed += 1
+                return removed, freed
+        except BlockingIOError:
+            return None
+
+
+class DedupWriter:
+    """Recibe el flujo de un dump y lo guarda en el almacén chunk por chunk.
+
+    Hash, compresión y escritura de cada chunk corren en el pool; como
+    mucho hay 2 chunks pendientes por hilo para acotar la memoria.
+    """
+
+    def __init__(self, store, pool, threads):
+        self.store = store
+        self.pool = pool
+        self.max_pending = max(2, threads * 2)
+        self.chunker = ContentChunker()
+        self.chunks = []
+        self.bytes_raw = 0
+        self.bytes_new = 0
+        self.new_chunks = 0
+        self._pending = deque()
+
+    def write(self, data):
+        self.bytes_raw += len(data)
+        for chunk in self.chunker.feed(data):
+            self._submit(chunk)
+
+    def _submit(self, chunk):
+        self._pending.append(self.pool.submit(self.store.put, chunk))
+        while len(self._pending) >= self.max_pending:
+            self._collect_next()
+
+    def _collect_next(self):
+        digest, size, stored = self._pending.popleft().result()
+        self.chunks.append([digest, size])
+        if stored:
+            self.bytes_new += stored
+            self.new_chunks += 1
+
+    def close(self):
+        last = self.chunker.finish()
+        if last is not None:
+            self._submit(last)
+        while self._pending:
+            self._collect_next()
+
+    def manifest(self, db_name):
+        return {
+            'version': MANIFEST_VERSION,
+            'db_name': db_name,
+            'created_at': time.time(),
+            'bytes_raw': self.bytes_raw,
+            'bytes_new': self.bytes_new,
+            'new_chunks': self.new_chunks,
+            'chunks': self.chunks,
+        }
+
+
+def is_dedup_backup(path):
+    return Path(path).name.endswith(DEDUP_SUFFIX) and Path(path).is_file()
+
+
+def read_manifest(path):
+    try:
+        with open(path, 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise DedupStoreError(f'{Path(path).name}: manifiesto ilegible ({e})')
+    if manifest.get('version') != MANIFEST_VERSION or 'chunks' not in manifest:
+        raise DedupStoreError(f'{Path(path).name}: versión de manifiesto no soportada')
+    return manifest
+
+
+def write_manifest(path, manifest):
+    with open(path, 'w') as f:
+        json.dump(manifest, f, separators=(',', ':'))
+
+
+def iter_backup(store, manifest, threads=None):
+    """Contenido del dump en orden, leyendo y verificando chunks en paralelo."""
+    threads = threads or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='dedup') as pool:
+        pending = deque()
+        for digest, _ in manifest['chunks']:
+            pending.append(pool.submit(store.get, digest))
+            if len(pending) >= threads * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def restore_backup(store, manifest_path, cmd, job=None, env=None, threads=None, wrap=None):
+    """Restaura un backup deduplicado sobre el stdin de cmd (mismas estadísticas que restore_file)."""
+    manifest = read_manifest(manifest_path)
+    missing = sum(1 for digest, _ in manifest['chunks'] if not store.chunk_path(digest).exists())
+    if missing:
+        # Antes de tocar la base: un restore a medias sería peor que ninguno
+        raise DedupStoreError(f'faltan {missing} chunks en el almacén {store.root}')
+    counter = {}
+
+    def chunks():
+        bytes_read = 0
+        for data in iter_backup(store, manifest, threads):
+            bytes_read += len(data)
+            counter['bytes_read'] = bytes_read
+            if job is not None:
+                job.update(bytes_read=bytes_read)
+            yield data
+
+    return feed_process(cmd, wrap(chunks()) if wrap is not None else chunks(), job=job, env=env, counter=counter)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Perfil de carga rápida para restaurar dumps de mysqldump
+Envuelve el flujo que recibe el cliente mysql con ajustes de sesión
+(foreign_key_checks y unique_checks apagados, autocommit=0 con COMMIT cada
+RESTORE_FAST_LOAD_COMMIT_MB y, si se habilita, sql_log_bin=0) y al final
+restaura los valores originales de la sesión.
+
+    python3 fast_load.py bench --rows 200000 --database fast_load_bench
+"""
+
+import argparse
+import random
+import subprocess
+import sys
+
+from config import MYSQL_HOST, MYSQL_USER, env, mysql_client_env
+from restore_pipeline import RestoreError, feed_process
+
+# Perfil por defecto de las restauraciones (cada pedido puede cambiarlo)
+RESTORE_FAST_LOAD = env.get('RESTORE_FAST_LOAD', '0').strip().lower() in ('1', 'true', 'yes', 'si')
+# sql_log_bin=0 solo si ninguna réplica necesita recibir la restauración
+# (requiere SUPER o SYSTEM_VARIABLES_ADMIN)
+RESTORE_FAST_LOAD_SKIP_BINLOG = env.get('RESTORE_FAST_LOAD_SKIP_BINLOG', '0').strip().lower() in (
+    '1', 'true', 'yes', 'si')
+# Volumen de INSERTs por transacción con autocommit=0
+RESTORE_FAST_LOAD_COMMIT_MB = int(env.get('RESTORE_FAST_LOAD_COMMIT_MB', '64'))
+
+# mysqldump escapa los saltos de línea dentro de los valores: ';\nINSERT INTO '
+# solo aparece entre dos sentencias, donde es seguro intercalar un COMMIT
+INSERT_BOUNDARY = b';\nINSERT INTO '
+
+SESSION_FOOTER = (
+    "COMMIT;\n"
+    "SET autocommit = @fast_load_autocommit;\n"
+    "SET unique_checks = @fast_load_unique_checks;\n"
+    "SET foreign_key_checks = @fast_load_foreign_key_checks;\n"
+)
+
+
+def session_header(skip_binlog=RESTORE_FAST_LOAD_SKIP_BINLOG):
+    """Sentencias que guardan los valores de la sesión y activan el perfil."""
+    header = (
+        "SET @fast_load_autocommit = @@autocommit, @fast_load_unique_checks = @@unique_checks, "
+        "@fast_load_foreign_key_checks = @@foreign_key_checks;\n"
+        "SET foreign_key_checks = 0;\n"
+        "SET unique_checks = 0;\n"
+        "SET autocommit = 0;\n"
+    )
+    if skip_binlog:
+        header += "SET @fast_load_sql_log_bin = @@sql_log_bin;\nSET sql_log_bin = 0;\n"
+    return header
+
+
+def session_footer(skip_binlog=RESTORE_FAST_LOAD_SKIP_BINLOG):
+    return SESSION_FOOTER + ("SET sql_log_bin = @fast_load_sql_log_bin;\n" if skip_binlog else '')
+
+
+def fast_load_stream(chunks, skip_binlog=RESTORE_FAST_LOAD_SKIP_BINLOG,
+                     commit_bytes=RESTORE_FAST_LOAD_COMMIT_MB * 1024 * 1024):
+    """Flujo del dump entre la cabecera y el pie del perfil, con COMMIT cada commit_bytes."""
+    yield session_header(skip_binlog).encode()
+    pending = 0
+    for data in chunks:
+        pending += len(data)
+        if pending >= commit_bytes:
+            cut = data.rfind(INSERT_BOUNDARY)
+            if cut >= 0:
+                cut += 2  # después de ';\n'
+                yield data[:cut]
+                yield b'COMMIT;\n'
+                data = data[cut:]
+                pending = len(data)
+        yield data
+    yield session_footer(skip_binlog).encode()
+
+
+def generate_dump(database, rows, rows_per_insert=100, seed=1):
+    """Dump estilo mysqldump: tabla padre, hija con FK e índice único, INSERTs extendidos."""
+    rng = random.Random(seed)
+    parents = max(1, rows // 100)
+    yield (f"DROP DATABASE IF EXISTS `{database}`;\nCREATE DATABASE `{database}`;\nUSE `{database}`;\n"
+           "CREATE TABLE `customers` (`id` int NOT NULL, `name` varchar(64) NOT NULL, PRIMARY KEY (`id`)) "
+           "ENGINE=InnoDB;\n"
+           "CREATE TABLE `orders` (`id` int NOT NULL, `customer_id` int NOT NULL, `code` varchar(32) NOT NULL, "
+           "`amount` decimal(12,2) NOT NULL, `note` varchar(255) DEFAULT NULL, PRIMARY KEY (`id`), "
+           "UNIQUE KEY `uk_code` (`code`), KEY `idx_customer` (`customer_id`), "
+           "CONSTRAINT `fk_customer` FOREIGN KEY (`customer_id`) REFERENCES `customers` (`id`)) "
+           "ENGINE=InnoDB;\n").encode()
+    for start in range(0, parents, rows_per_insert):
+        values = ','.join(f"({i},'customer {i}')" for i in range(start, min(parents, start + rows_per_insert)))
+        yield f"INSERT INTO `customers` VALUES {values};\n".encode()
+    for start in range(0, rows, rows_per_insert):
+        values = ','.join(
+            f"({i},{rng.randrange(parents)},'C{i:012d}',{rng.randrange(100000) / 100:.2f},"
+            f"'nota {rng.random():.6f}')"
+            for i in range(start, min(rows, start + rows_per_insert))
+        )
+        yield f"INSERT INTO `orders` VALUES {values};\n".encode()
+
+
+def bench_profile(database, rows, rows_per_insert, fast, skip_binlog):
+    """Carga el dump generado con o sin perfil; devuelve segundos y filas/s."""
+    parents = max(1, rows // 100)
+    chunks = generate_dump(database, rows, rows_per_insert)
+    if fast:
+        chunks = fast_load_stream(chunks, skip_binlog)
+    stats = feed_process(['mysql', f'-u{MYSQL_USER}', f'-h{MYSQL_HOST}'], chunks, env=mysql_client_env())
+    return {
+        'seconds': stats['seconds'],
+        'rows_s': (rows + parents) / stats['seconds'],
+        'mb': stats['bytes_out'] / (1024 * 1024),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Perfil de carga rápida para restauraciones MySQL')
+    sub = parser.add_subparsers(dest='command', required=True)
+    bench = sub.add_parser('bench', help='filas/s con y sin el perfil sobre un dump generado')
+    bench.add_argument('--rows', type=int, default=200000, help='filas de la tabla principal')
+    bench.add_argument('--rows-per-insert', type=int, default=100, help='filas por INSERT extendido')
+    bench.add_argument('--database', default='fast_load_bench', help='base de prueba (se borra y se recrea)')
+    bench.add_argument('--skip-binlog', action='store_true', default=RESTORE_FAST_LOAD_SKIP_BINLOG,
+                       help='incluir sql_log_bin=0 en el perfil')
+    bench.add_argument('--keep', action='store_true', help='no borrar la base de prueba al terminar')
+    args = parser.parse_args(argv)
+
+    print(f'Dump generado: {args.rows} filas en `{args.database}`, {args.rows_per_insert} filas por INSERT')
+    print(f'{"perfil":<10} {"segundos":>9} {"MB":>8} {"filas/s":>10}')
+    results = {}
+    try:
+        for fast in (False, True):
+            result = results[fast] = bench_profile(args.database, args.rows, args.rows_per_insert, fast,
+                                                   args.skip_binlog)
+            print(f'{"rápido" if fast else "normal":<10} {result["seconds"]:>9.1f} {result["mb"]:>8.1f} '
+                  f'{result["rows_s"]:>10.0f}', flush=True)
+    except RestoreError as e:
+        print(f'Error cargando el dump de prueba: {e}')
+        return 1
+    finally:
+        if not args.keep:
+            subprocess.run(['mysql', f'-u{MYSQL_USER}', f'-h{MYSQL_HOST}', '-e',
+                            f'DROP DATABASE IF EXISTS `{args.database}`'],
+                           env=mysql_client_env(), capture_output=True)
+    print(f'Aceleración: x{results[True]["rows_s"] / results[False]["rows_s"]:.2f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,288 @@
+"""
+Motor de trabajos en segundo plano (restauraciones)
+Estado persistido en SQLite para que cualquier worker de gunicorn lo consulte
+"""
+
+import fcntl
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from metrics import record_job
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_SUCCESS = 'success'
+STATUS_ERROR = 'error'
+FINISHED_STATUSES = (STATUS_SUCCESS, STATUS_ERROR)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    host TEXT NOT NULL,
+    description TEXT,
+    status TEXT NOT NULL,
+    phase TEXT,
+    progress TEXT,
+    message TEXT,
+    error TEXT,
+    details TEXT,
+    pid INTEGER,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs (created_at);
+"""
+
+
+class JobError(Exception):
+    """Error de negocio de un trabajo: message para el usuario y detalles opcionales."""
+
+    def __init__(self, message, details=None):
+        super().__init__(message)
+        self.details = details
+
+
+class JobContext:
+    """Handle que recibe la función del trabajo para reportar fase y progreso."""
+
+    def __init__(self, manager, job_id, update_interval=1.0):
+        self.manager = manager
+        self.job_id = job_id
+        self.update_interval = update_interval
+        self.phase = None
+        self.progress = {}
+        # Bytes de las fases ya terminadas (para las métricas del trabajo completo)
+        self.finished_bytes = {'bytes_read': 0, 'bytes_out': 0}
+        self._phase_started = time.time()
+        self._last_flush = 0.0
+
+    def set_phase(self, phase, total_bytes=None):
+        """Inicia una fase nueva; reinicia contadores de bytes."""
+        for key in self.finished_bytes:
+            self.finished_bytes[key] += self.progress.get(key) or 0
+        self.phase = phase
+        self._phase_started = time.time()
+        self.progress = {'bytes_read': 0, 'bytes_total': total_bytes, 'bytes_out': 0}
+        self._flush(force=True)
+
+    def update(self, force=False, **values):
+        """Actualiza contadores (bytes_read, bytes_out, ...); se persiste como máximo 1 vez/seg."""
+        self.progress.update(values)
+        self._flush(force=force)
+
+    def total_bytes(self, key):
+        """Bytes de todas las fases (bytes_read o bytes_out)."""
+        return self.finished_bytes[key] + (self.progress.get(key) or 0)
+
+    def _flush(self, force=False):
+        now = time.time()
+        if not force and now - self._last_flush < self.update_interval:
+            return
+        self._last_flush = now
+        progress = dict(self.progress, phase_started=self._phase_started)
+        self.manager._write(self.job_id, phase=self.phase, progress=json.dumps(progress), updated_at=now)
+
+
+class JobManager:
+    """Cola de trabajos con límite de concurrencia por host.
+
+    Los trabajos corren en hilos del proceso que los recibe; el límite por host
+    se aplica entre procesos con locks de archivo (slots), por lo que vale para
+    todos los workers de gunicorn.
+    """
+
+    def __init__(self, db_path, lock_dir, max_per_host=1, max_workers=2):
+        self.db_path = str(db_path)
+        self.lock_dir = Path(lock_dir)
+        self.max_per_host = max(1, max_per_host)
+        self.max_workers = max_workers
+        self._local = threading.local()
+        self._executor = None
+        self._executor_pid = None
+        self.lock_dir.mkdir(parents=True, exist_ok=True)
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _get_executor(self):
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='job')
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    def _write(self, job_id, **fields):
+        columns = ', '.join(f'{name} = ?' for name in fields)
+        conn = self._connection()
+        with conn:
+            conn.execute(f'UPDATE jobs SET {columns} WHERE id = ?', (*fields.values(), job_id))
+
+    def submit(self, kind, host, fn, description=''):
+        """Encola fn(job) y devuelve el id del trabajo."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                'INSERT INTO jobs (id, kind, host, description, status, phase, pid, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (job_id, kind, host, description, STATUS_QUEUED, 'En cola', os.getpid(), now, now)
+            )
+        self._get_executor().submit(self._run, job_id, kind, host, fn)
+        return job_id
+
+    def _acquire_host_slot(self, job_id, host):
+        safe_host = ''.join(c if c.isalnum() or c in '.-_' else '_' for c in host)
+        while True:
+            for slot in range(self.max_per_host):
+                handle = open(self.lock_dir / f'{safe_host}.{slot}.lock', 'w')
+                try:
+                    fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return handle
+                except OSError:
+                    handle.close()
+            self._write(job_id, phase=f'Esperando turno en {host}', updated_at=time.time())
+            time.sleep(1)
+
+    def _run(self, job_id, kind, host, fn):
+        slot = self._acquire_host_slot(job_id, host)
+        job = JobContext(self, job_id)
+        started = time.monotonic()
+        status = STATUS_ERROR
+        try:
+            now = time.time()
+            self._write(job_id, status=STATUS_RUNNING, started_at=now, updated_at=now)
+            result = fn(job) or {}
+            now = time.time()
+            self._write(
+                job_id, status=STATUS_SUCCESS, phase='Finalizado',
+                message=result.get('message', 'Trabajo completado'),
+                details=json.dumps(result.get('details')) if result.get('details') is not None else None,
+                finished_at=now, updated_at=now
+            )
+            status = STATUS_SUCCESS
+        except Exception as e:
+            now = time.time()
+            details = getattr(e, 'details', None)
+            self._write(
+                job_id, status=STATUS_ERROR, error=str(e),
+                details=json.dumps(details) if details is not None else None,
+                finished_at=now, updated_at=now
+            )
+        finally:
+            fcntl.flock(slot, fcntl.LOCK_UN)
+            slot.close()
+            record_job(kind, status, time.monotonic() - started,
+                       job.total_bytes('bytes_read'), job.total_bytes('bytes_out'))
+
+    def get(self, job_id):
+        """Estado del trabajo con throughput y ETA derivados, o None si no existe."""
+        row = self._connection().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        if job['status'] not in FINISHED_STATUSES and not _pid_alive(job['pid']):
+            now = time.time()
+            self._write(job_id, status=STATUS_ERROR, error='El proceso que ejecutaba el trabajo terminó',
+                        finished_at=now, updated_at=now)
+            return self.get(job_id)
+        return describe_job(job)
+
+    def recent(self, limit=20):
+        rows = self._connection().execute(
+            'SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?', (limit,)
+        ).fetchall()
+        return [describe_job(dict(row)) for row in rows]
+
+    def events(self, job_id, max_seconds=25, interval=1.0):
+        """Genera eventos SSE con el estado del trabajo.
+
+        El stream se corta tras max_seconds (el navegador reconecta solo) para no
+        retener un worker sync de gunicorn más allá de su timeout.
+        """
+        deadline = time.monotonic() + max_seconds
+        last_payload = None
+        yield 'retry: 2000\n\n'
+        while True:
+            job = self.get(job_id)
+            if job is None:
+                yield 'event: error\ndata: {"error": "Trabajo inexistente"}\n\n'
+                return
+            payload = json.dumps(job)
+            if payload != last_payload:
+                yield f'data: {payload}\n\n'
+                last_payload = payload
+            if job['status'] in FINISHED_STATUSES:
+                yield 'event: done\ndata: {}\n\n'
+                return
+            if time.monotonic() >= deadline:
+                return
+            time.sleep(interval)
+
+
+def describe_job(job):
+    progress = json.loads(job['progress']) if job.get('progress') else {}
+    details = json.loads(job['details']) if job.get('details') else None
+    now = job['finished_at'] or time.time()
+    phase_started = progress.pop('phase_started', None) or job['started_at'] or now
+    elapsed = max(now - phase_started, 0.001)
+
+    bytes_read = progress.get('bytes_read') or 0
+    bytes_out = progress.get('bytes_out') or 0
+    bytes_total = progress.get('bytes_total')
+    read_rate = bytes_read / elapsed
+    eta = None
+    if bytes_total and read_rate > 0 and job['status'] == STATUS_RUNNING:
+        eta = max(bytes_total - bytes_read, 0) / read_rate
+
+    return {
+        'id': job['id'],
+        'kind': job['kind'],
+        'host': job['host'],
+        'description': job['description'],
+        'status': job['status'],
+        'phase': job['phase'],
+        'message': job['message'],
+        'error': job['error'],
+        'details': details,
+        'created_at': job['created_at'],
+        'started_at': job['started_at'],
+        'finished_at': job['finished_at'],
+        'progress': {
+            **progress,
+            'percent': round(bytes_read * 100 / bytes_total, 1) if bytes_total else None,
+            'read_mb_s': round(read_rate / (1024 * 1024), 2),
+            'out_mb_s': round(bytes_out / elapsed / (1024 * 1024), 2),
+            'eta_seconds': round(eta) if eta is not None else None,
+        },
+    }
+
+
+def _pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
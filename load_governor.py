@@ -0,0 +1,236 @@
+"""
+Regulación de los backups según la carga del servidor
+Durante una corrida de backup_runner.py un hilo muestrea cada
+BACKUP_THROTTLE_INTERVAL segundos Threads_running, el retraso de réplica y el
+iowait del host, y ajusta dentro de los límites configurados cuántas bases se
+vuelcan a la vez y cuántos MB/s puede leer cada corrida de la salida de
+mysqldump (al leer más lento, mysqldump también consulta más lento). Con
+presión se reduce a la mitad el límite y una conexión; con el servidor
+tranquilo se vuelve a subir de a poco. Cada ajuste se imprime con sus motivos.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from config import env
+
+# Regulación apagada por defecto: las corridas usan BACKUP_WORKERS sin límite de MB/s
+BACKUP_THROTTLE = env.get('BACKUP_THROTTLE', '0').strip().lower() in ('1', 'true', 'yes', 'si')
+BACKUP_THROTTLE_INTERVAL = float(env.get('BACKUP_THROTTLE_INTERVAL', '5'))
+# Umbrales de presión (0 = no se mira esa señal)
+BACKUP_THROTTLE_THREADS_RUNNING = int(env.get('BACKUP_THROTTLE_THREADS_RUNNING', '32'))
+BACKUP_THROTTLE_REPLICA_LAG = int(env.get('BACKUP_THROTTLE_REPLICA_LAG', '30'))
+BACKUP_THROTTLE_IOWAIT = float(env.get('BACKUP_THROTTLE_IOWAIT', '20'))
+# Límites del ajuste: conexiones mínimas (el máximo es BACKUP_WORKERS) y MB/s de salida
+BACKUP_THROTTLE_MIN_WORKERS = int(env.get('BACKUP_THROTTLE_MIN_WORKERS', '1'))
+BACKUP_THROTTLE_MIN_MB_S = float(env.get('BACKUP_THROTTLE_MIN_MB_S', '5'))
+BACKUP_THROTTLE_MAX_MB_S = float(env.get('BACKUP_THROTTLE_MAX_MB_S', '0'))  # 0 = sin límite
+
+MB = 1024 * 1024
+# Con todas las señales por debajo de esta fracción del umbral se afloja la regulación
+RELAX_RATIO = 0.7
+RELAX_STEP = 1.5
+
+
+class AdaptiveLimit:
+    """Semáforo cuyo límite cambia en caliente (bajarlo no corta lo que ya corre)."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self._cond = threading.Condition()
+
+    def set_limit(self, limit):
+        with self._cond:
+            self.limit = limit
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        with self._cond:
+            self._cond.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.active -= 1
+                self._cond.notify_all()
+
+
+class RateLimiter:
+    """Token bucket compartido entre los volcados; rate None = sin límite."""
+
+    def __init__(self, rate=None):
+        self.rate = rate
+        self.consumed = 0
+        self._available = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate):
+        with self._lock:
+            self.rate = rate
+            self._available = min(self._available, rate or 0.0)
+
+    def consume(self, size):
+        with self._lock:
+            self.consumed += size
+            if self.rate is None:
+                return
+            now = time.monotonic()
+            # Como mucho un segundo de ráfaga acumulada
+            self._available = min(self.rate, self._available + (now - self._updated) * self.rate) - size
+            self._updated = now
+            wait = -self._available / self.rate if self._available < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+def read_cpu_times(path='/proc/stat'):
+    """(iowait, total) en ticks desde el arranque; None fuera de Linux."""
+    try:
+        with open(path) as f:
+            fields = f.readline().split()
+    except OSError:
+        return None
+    if not fields or fields[0] != 'cpu' or len(fields) < 6:
+        return None
+    values = [int(value) for value in fields[1:]]
+    return values[4], sum(values)
+
+
+class LoadGovernor:
+    """Muestrea la carga y ajusta conexiones y MB/s de una corrida de backups."""
+
+    def __init__(self, meta, max_workers, min_workers=BACKUP_THROTTLE_MIN_WORKERS,
+                 min_mb_s=BACKUP_THROTTLE_MIN_MB_S, max_mb_s=BACKUP_THROTTLE_MAX_MB_S,
+                 max_threads_running=BACKUP_THROTTLE_THREADS_RUNNING,
+                 max_replica_lag=BACKUP_THROTTLE_REPLICA_LAG, max_iowait=BACKUP_THROTTLE_IOWAIT,
+                 interval=BACKUP_THROTTLE_INTERVAL):
+        self.meta = meta
+        self.max_workers = max(1, max_workers)
+        self.min_workers = max(1, min(min_workers, self.max_workers))
+        self.min_rate = min_mb_s * MB
+        self.max_rate = max_mb_s * MB or None
+        self.thresholds = {
+            'threads_running': max_threads_running,
+            'replica_lag': max_replica_lag,
+            'iowait': max_iowait,
+        }
+        self.interval = interval
+        self.workers = AdaptiveLimit(self.max_workers)
+        self.rate = RateLimiter(self.max_rate)
+        self.adjustments = []
+        self._cpu = read_cpu_times()
+        self._last_consumed = 0
+        self._last_sample_at = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def slot(self):
+        return self.workers.slot()
+
+    def consume(self, size):
+        self.rate.consume(size)
+
+    def sample(self):
+        """Señales actuales (None si no se pudo medir) y MB/s leídos desde la muestra anterior."""
+        values = {'threads_running': None, 'replica_lag': None, 'iowait': None}
+        try:
+            running = self.meta.global_status('Threads_running')
+            values['threads_running'] = int(running) if running is not None else None
+        except Exception as e:
+            print(f'[carga] no se pudo leer Threads_running: {e}', flush=True)
+        try:
+            values['replica_lag'] = self.meta.replica_lag()
+        except Exception:
+            pass
+        cpu = read_cpu_times()
+        if cpu is not None and self._cpu is not None and cpu[1] > self._cpu[1]:
+            values['iowait'] = 100.0 * (cpu[0] - self._cpu[0]) / (cpu[1] - self._cpu[1])
+        self._cpu = cpu
+
+        now = time.monotonic()
+        consumed = self.rate.consumed
+        values['mb_s'] = (consumed - self._last_consumed) / MB / max(now - self._last_sample_at, 0.001)
+        self._last_consumed, self._last_sample_at = consumed, now
+        return values
+
+    def _exceeded(self, values, ratio=1.0):
+        return [
+            f'{name} {values[name]:.0f} > {limit * ratio:.0f}'
+            for name, limit in self.thresholds.items()
+            if limit and values[name] is not None and values[name] > limit * ratio
+        ]
+
+    def adjust(self, values):
+        """Aplica una muestra: baja con presión, sube con calma; devuelve el ajuste o None."""
+        workers, rate = self.workers.limit, self.rate.rate
+        pressure = self._exceeded(values)
+        if pressure:
+            new_workers = max(self.min_workers, workers - 1)
+            # Sin límite todavía: se parte de lo que se está leyendo ahora
+            current = rate if rate is not None else max(values['mb_s'] * MB, self.min_rate * 2)
+            new_rate = max(self.min_rate, current / 2)
+            reasons = pressure
+        elif not self._exceeded(values, RELAX_RATIO):
+            new_workers = min(self.max_workers, workers + 1)
+            new_rate = rate
+            if rate is not None:
+                new_rate = rate * RELAX_STEP
+                if self.max_rate is not None:
+                    new_rate = min(self.max_rate, new_rate)
+                elif new_rate > max(values['mb_s'] * MB, self.min_rate) * 4:
+                    new_rate = None  # ya no limita: se quita
+            reasons = ['servidor sin presión']
+        else:
+            return None
+        if new_workers == workers and new_rate == rate:
+            return None
+
+        self.workers.set_limit(new_workers)
+        self.rate.set_rate(new_rate)
+        adjustment = {
+            'at': time.time(), 'signals': values, 'reasons': reasons,
+            'workers': (workers, new_workers), 'mb_s': (_mb(rate), _mb(new_rate)),
+        }
+        self.adjustments.append(adjustment)
+        print(f'[carga] {describe_signals(values)} -> conexiones {workers}→{new_workers}, '
+              f'límite {_describe_rate(rate)}→{_describe_rate(new_rate)} ({"; ".join(reasons)})', flush=True)
+        return adjustment
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.adjust(self.sample())
+
+    def start(self):
+        print(f'[carga] regulación activa: {self.min_workers}-{self.max_workers} conexiones, '
+              f'límite {_describe_rate(self.max_rate)} (mínimo {self.min_rate / MB:.0f} MB/s), '
+              f'muestras cada {self.interval:.0f} s', flush=True)
+        self._thread = threading.Thread(target=self._run, name='load-governor', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.adjustments:
+            print(f'[carga] {len(self.adjustments)} ajustes en la corrida; final: {self.workers.limit} '
+                  f'conexiones, límite {_describe_rate(self.rate.rate)}', flush=True)
+
+
+def _mb(rate):
+    return round(rate / MB, 1) if rate is not None else None
+
+
+def _describe_rate(rate):
+    return f'{rate / MB:.0f} MB/s' if rate is not None else 'sin límite'
+
+
+def describe_signals(values):
+    def show(value, unit=''):
+        return 'n/d' if value is None else f'{value:.0f}{unit}'
+    return (f"threads_running={show(values['threads_running'])} lag={show(values['replica_lag'], 's')} "
+            f"iowait={show(values['iowait'], '%')} lectura={values['mb_s']:.1f} MB/s")
@@ -0,0 +1,280 @@
+"""
+Métricas en formato Prometheus (GET /metrics)
+Cada proceso (workers de gunicorn, backup_runner.py) acumula contadores e
+histogramas en memoria y los vuelca, como máximo cada METRICS_FLUSH_SECONDS y
+al terminar, a METRICS_DIR/<pid>.json (tmp + rename). /metrics suma los
+archivos de todos los procesos, así cualquier worker responde por los cuatro.
+Los archivos de procesos que ya terminaron se acumulan en dead.json para que
+los contadores no bajen ni el directorio crezca con cada corrida de cron.
+"""
+
+import atexit
+import bisect
+import fcntl
+import json
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from config import env
+
+METRICS_DIR = Path(env.get('METRICS_DIR', '').strip() or Path(tempfile.gettempdir()) / 'mysql_backup_metrics')
+METRICS_FLUSH_SECONDS = float(env.get('METRICS_FLUSH_SECONDS', '5'))
+
+NAMESPACE = 'mysql_backup_'
+DEAD_FILE = 'dead.json'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+COMMAND_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 1800, 3600, 7200)
+
+# nombre -> (tipo, ayuda, buckets de histograma)
+METRICS = {
+    'http_request_duration_seconds': ('histogram', 'Duración de los requests por ruta', LATENCY_BUCKETS),
+    'http_requests_total': ('counter', 'Requests por ruta, método y código de estado', None),
+    'command_duration_seconds': ('histogram', 'Duración de los comandos externos (mysql, mysqldump, mongorestore...)',
+                                 COMMAND_BUCKETS),
+    'command_exits_total': ('counter', 'Comandos externos terminados por código de salida', None),
+    'catalog_refresh_seconds': ('histogram', 'Duración de la actualización del catálogo por origen',
+                                LATENCY_BUCKETS),
+    'catalog_files_listed_total': ('counter', 'Archivos listados al re-escanear directorios de backup', None),
+    'catalog_files_parsed_total': ('counter', 'Archivos leídos (stat + parser) al actualizar el catálogo', None),
+    'job_duration_seconds': ('histogram', 'Duración de los trabajos en segundo plano', COMMAND_BUCKETS),
+    'job_bytes_read_total': ('counter', 'Bytes leídos por los trabajos (restauraciones, borrados)', None),
+    'job_bytes_out_total': ('counter', 'Bytes enviados a los clientes de restauración', None),
+}
+
+
+def _key(labels):
+    return json.dumps(sorted(labels.items()))
+
+
+class Registry:
+    """Contadores e histogramas del proceso; {nombre: {labels JSON: valor}}."""
+
+    def __init__(self, directory=METRICS_DIR, flush_seconds=METRICS_FLUSH_SECONDS):
+        self.directory = Path(directory)
+        self.flush_seconds = flush_seconds
+        self.values = {}
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+        self._pid = os.getpid()
+
+    def _reset_if_forked(self):
+        # Tras un fork (gunicorn con preload) el hijo empieza de cero con su propio archivo
+        if self._pid != os.getpid():
+            self.values = {}
+            self._pid = os.getpid()
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            self._reset_if_forked()
+            series = self.values.setdefault(name, {})
+            key = _key(labels)
+            series[key] = series.get(key, 0) + value
+        self._maybe_flush()
+
+    def observe(self, name, value, **labels):
+        buckets = METRICS[name][2]
+        with self._lock:
+            self._reset_if_forked()
+            series = self.values.setdefault(name, {})
+            # [cuenta por bucket..., +Inf, suma]
+            data = series.setdefault(_key(labels), [0] * (len(buckets) + 1) + [0.0])
+            data[bisect.bisect_left(buckets, value)] += 1
+            data[-1] += value
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        """Vuelca los valores del proceso a <pid>.json; un error de disco no corta el request."""
+        with self._lock:
+            self._reset_if_forked()
+            self._last_flush = time.monotonic()
+            if not self.values:
+                return
+            payload = json.dumps(self.values)
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            target = self.directory / f'{self._pid}.json'
+            tmp = self.directory / f'.{self._pid}.json.tmp'
+            tmp.write_text(payload)
+            os.replace(tmp, target)
+        except OSError as e:
+            print(f'[métricas] no se pudo guardar {self.directory}: {e}', flush=True)
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+
+def inc(name, value=1, **labels):
+    registry.inc(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    registry.observe(name, value, **labels)
+
+
+def command_name(cmd):
+    """Programa de un comando (lista o string de shell) para usar como label."""
+    program = cmd[0] if isinstance(cmd, (list, tuple)) else str(cmd).split(None, 1)[0]
+    return os.path.basename(str(program))
+
+
+def record_command(cmd, seconds, returncode):
+    command = command_name(cmd)
+    observe('command_duration_seconds', seconds, command=command)
+    inc('command_exits_total', command=command, code=str(returncode))
+
+
+def run_command(cmd, **kwargs):
+    """subprocess.run que registra duración y código de salida del comando."""
+    started = time.monotonic()
+    result = subprocess.run(cmd, **kwargs)
+    record_command(cmd, time.monotonic() - started, result.returncode)
+    return result
+
+
+def record_request(route, method, status, seconds):
+    observe('http_request_duration_seconds', seconds, route=route, method=method)
+    inc('http_requests_total', route=route, method=method, status=str(status))
+
+
+def record_refresh(source, seconds, listed, parsed):
+    observe('catalog_refresh_seconds', seconds, source=source)
+    if listed:
+        inc('catalog_files_listed_total', listed, source=source)
+    if parsed:
+        inc('catalog_files_parsed_total', parsed, source=source)
+
+
+def record_job(kind, status, seconds, bytes_read, bytes_out):
+    observe('job_duration_seconds', seconds, kind=kind, status=status)
+    inc('job_bytes_read_total', bytes_read, kind=kind)
+    inc('job_bytes_out_total', bytes_out, kind=kind)
+
+
+def _merge(total, values):
+    for name, series in values.items():
+        if name not in METRICS:
+            continue
+        merged = total.setdefault(name, {})
+        for key, value in series.items():
+            if isinstance(value, list):
+                current = merged.get(key)
+                if current is None or len(current) != len(value):
+                    merged[key] = list(value)
+                else:
+                    merged[key] = [a + b for a, b in zip(current, value)]
+            else:
+                merged[key] = merged.get(key, 0) + value
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def collect(directory=None):
+    """Suma los valores de todos los procesos; los de procesos muertos pasan a dead.json."""
+    registry.flush()
+    directory = Path(directory or registry.directory)
+    total = {}
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+        lock = open(directory / '.lock', 'w')
+    except OSError as e:
+        print(f'[métricas] no se pudo leer {directory}: {e}', flush=True)
+        return total
+    with lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        dead = _read(directory / DEAD_FILE)
+        compacted = False
+        for path in directory.glob('*.json'):
+            if path.name == DEAD_FILE or not path.stem.isdigit():
+                continue
+            values = _read(path)
+            if _pid_alive(int(path.stem)):
+                _merge(total, values)
+                continue
+            _merge(dead, values)
+            path.unlink(missing_ok=True)
+            compacted = True
+        if compacted:
+            tmp = directory / f'.{DEAD_FILE}.tmp'
+            tmp.write_text(json.dumps(dead))
+            os.replace(tmp, directory / DEAD_FILE)
+        _merge(total, dead)
+    return total
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(pairs, extra=()):
+    pairs = list(pairs) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render(values, gauges=()):
+    """Texto de exposición de Prometheus (nombres con prefijo mysql_backup_).
+
+    gauges: [(nombre, ayuda, [(labels dict, valor)])] calculados al responder.
+    """
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        series = values.get(name)
+        if not series:
+            continue
+        name = NAMESPACE + name
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for key in sorted(series):
+            pairs = json.loads(key)
+            value = series[key]
+            if kind == 'counter':
+                lines.append(f'{name}{_labels(pairs)} {_number(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ['+Inf'], value[:-1]):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(pairs, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_sum{_labels(pairs)} {_number(value[-1])}')
+            lines.append(f'{name}_count{_labels(pairs)} {cumulative}')
+    for name, help_text, samples in gauges:
+        if not samples:
+            continue
+        name = NAMESPACE + name
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} gauge')
+        for labels, value in samples:
+            lines.append(f'{name}{_labels(sorted(labels.items()))} {_number(value)}')
+    return '\n'.join(lines) + '\n'
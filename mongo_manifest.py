@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Manifiesto de backups MongoDB (backup_*/.backup_manifest.json)
+Tamaño total y por base de una carpeta de mongodump, calculado una sola vez
+(al terminar back-mongo.sh o la primera vez que se descubre la carpeta ya
+asentada) para no recorrer cada BSON en cada request. Sin manifiesto la
+carpeta se recorre con os.scandir, una tarea por base en paralelo.
+
+Los backups de un solo archivo (mongodump --archive --gzip, backup_*.archive.gz)
+llevan al lado un índice backup_*.archive.json con los namespaces, documentos
+y bytes de cada colección, para listar bases sin descomprimir el archivo.
+
+    python3 mongo_manifest.py /mnt/backup/mongo/backup_2024-05-01_23-20
+    python3 mongo_manifest.py /mnt/backup/mongo/backup_2024-05-01_23-20.archive.gz
+"""
+
+import json
+import os
+import struct
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from backup_codecs import CODECS
+from config import env
+
+FORMAT_VERSION = 1
+MANIFEST_NAME = '.backup_manifest.json'
+ARCHIVE_SUFFIX = '.archive.gz'
+ARCHIVE_INDEX_SUFFIX = '.archive.json'
+
+# Formato --archive de mongo-tools: magic, preludio (cabecera + metadatos de
+# colecciones) y bloques "cabecera de namespace + documentos", separados por -1
+ARCHIVE_MAGIC = 0x8199e26d
+ARCHIVE_TERMINATOR = -1
+ARCHIVE_READ_SIZE = 1024 * 1024
+
+# Hilos para recorrer carpetas sin manifiesto (una base por hilo)
+MONGO_SCAN_WORKERS = int(env.get('MONGO_SCAN_WORKERS', '8'))
+# Segundos sin escrituras para dar por terminado un volcado y guardar su manifiesto
+MONGO_MANIFEST_SETTLE_SECONDS = int(env.get('MONGO_MANIFEST_SETTLE_SECONDS', '600'))
+
+
+def _walk(directory):
+    """(bytes, archivos, mtime más reciente) de un árbol, con scandir y sin seguir symlinks."""
+    total = files = 0
+    newest = 0.0
+    pending = [directory]
+    while pending:
+        try:
+            with os.scandir(pending.pop()) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            stat = entry.stat(follow_symlinks=False)
+                            total += stat.st_size
+                            files += 1
+                            newest = max(newest, stat.st_mtime)
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return total, files, newest
+
+
+def _top_level(path):
+    """Bases (subcarpetas) y archivos sueltos (oplog.bson) de la carpeta del backup."""
+    databases, loose = [], []
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.name == MANIFEST_NAME or entry.name.startswith(MANIFEST_NAME + '.'):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                databases.append(entry.name)
+            elif entry.is_file(follow_symlinks=False):
+                loose.append(entry)
+    return sorted(databases), loose
+
+
+def scan_backup(path, workers=MONGO_SCAN_WORKERS):
+    """Recorre una carpeta de mongodump y arma su manifiesto."""
+    path = Path(path)
+    databases, loose = _top_level(path)
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(databases) or 1))) as pool:
+        walked = dict(zip(databases, pool.map(_walk, [path / db for db in databases])))
+
+    manifest = {
+        'version': FORMAT_VERSION,
+        'size': 0,
+        'files': 0,
+        'newest_mtime': 0.0,
+        'scanned_at': time.time(),
+        'databases': {},
+    }
+    for db, (size, files, newest) in walked.items():
+        manifest['databases'][db] = {'size': size, 'files': files}
+        manifest['size'] += size
+        manifest['files'] += files
+        manifest['newest_mtime'] = max(manifest['newest_mtime'], newest)
+    for entry in loose:
+        try:
+            stat = entry.stat(follow_symlinks=False)
+        except OSError:
+            continue
+        manifest['size'] += stat.st_size
+        manifest['files'] += 1
+        manifest['newest_mtime'] = max(manifest['newest_mtime'], stat.st_mtime)
+    return manifest
+
+
+def read_manifest(path):
+    """Manifiesto guardado de la carpeta, o None si no existe o no es válido."""
+    try:
+        with open(Path(path) / MANIFEST_NAME) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(manifest, dict) or manifest.get('version') != FORMAT_VERSION:
+        return None
+    return manifest
+
+
+def write_manifest(path, manifest):
+    """Guarda el manifiesto de forma atómica (tmp + rename)."""
+    target = Path(path) / MANIFEST_NAME
+    tmp = target.with_name(f'{MANIFEST_NAME}.{os.getpid()}.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, target)
+
+
+def is_archive_backup(path):
+    return Path(path).name.endswith(ARCHIVE_SUFFIX)
+
+
+def archive_index_path(path):
+    path = Path(path)
+    return path.with_name(path.name[:-len(ARCHIVE_SUFFIX)] + ARCHIVE_INDEX_SUFFIX)
+
+
+def _bson_strings(doc):
+    """Campos string de primer nivel de un documento BSON (cabeceras del archivo)."""
+    fields = {}
+    pos, end = 4, len(doc) - 1
+    sizes = {0x01: 8, 0x07: 12, 0x08: 1, 0x09: 8, 0x0A: 0, 0x10: 4, 0x11: 8, 0x12: 8, 0x13: 16}
+    while pos < end:
+        kind = doc[pos]
+        name_end = doc.index(b'\0', pos + 1)
+        name = doc[pos + 1:name_end].decode('utf-8', errors='replace')
+        pos = name_end + 1
+        if kind in (0x02, 0x0D, 0x0E):
+            length = struct.unpack_from('<i', doc, pos)[0]
+            fields[name] = doc[pos + 4:pos + 3 + length].decode('utf-8', errors='replace')
+            pos += 4 + length
+        elif kind in (0x03, 0x04):
+            pos += struct.unpack_from('<i', doc, pos)[0]
+        elif kind == 0x05:
+            pos += 5 + struct.unpack_from('<i', doc, pos)[0]
+        elif kind in sizes:
+            pos += sizes[kind]
+        else:
+            break
+    return fields
+
+
+def _read_exact(reader, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = reader.read(min(size - len(data), ARCHIVE_READ_SIZE))
+        if not chunk:
+            raise ValueError('archivo truncado')
+        data += chunk
+    return bytes(data)
+
+
+def scan_archive(path):
+    """Lee un backup --archive --gzip y arma su índice de namespaces (una sola pasada)."""
+    path = Path(path)
+    stat = path.stat()
+    databases = {}
+
+    def collection(db, name):
+        return databases.setdefault(db, {'size': 0, 'documents': 0, 'collections': {}})['collections'].setdefault(
+            name, {'size': 0, 'documents': 0})
+
+    reader = CODECS['gzip'].open_reader(path)
+    try:
+        if struct.unpack('<I', _read_exact(reader, 4))[0] != ARCHIVE_MAGIC:
+            raise ValueError('no es un archivo de mongodump --archive')
+        in_prelude, prelude_docs = True, 0
+        expecting_header, current = True, None
+        while True:
+            head = reader.read(4)
+            if not head:
+                break
+            if len(head) < 4:
+                head += _read_exact(reader, 4 - len(head))
+            size = struct.unpack('<i', head)[0]
+            if size == ARCHIVE_TERMINATOR:
+                in_prelude, expecting_header, current = False, True, None
+                continue
+            if size < 5:
+                raise ValueError(f'documento BSON inválido ({size} bytes)')
+            doc = head + _read_exact(reader, size - 4)
+            if in_prelude:
+                # Cabecera del archivo y luego un documento por colección (incluye las vacías)
+                prelude_docs += 1
+                fields = _bson_strings(doc)
+                if prelude_docs > 1 and fields.get('db'):
+                    collection(fields['db'], fields.get('collection', ''))
+            elif expecting_header:
+                fields = _bson_strings(doc)
+                current = collection(fields['db'], fields.get('collection', '')) if fields.get('db') else None
+                expecting_header = False
+            elif current is not None:
+                current['size'] += size
+                current['documents'] += 1
+    finally:
+        reader.close()
+
+    raw_size = 0
+    for db in databases.values():
+        db['size'] = sum(c['size'] for c in db['collections'].values())
+        db['documents'] = sum(c['documents'] for c in db['collections'].values())
+        raw_size += db['size']
+    return {
+        'version': FORMAT_VERSION,
+        'format': 'archive',
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'newest_mtime': stat.st_mtime,
+        'raw_size': raw_size,
+        'files': 1,
+        'scanned_at': time.time(),
+        'databases': databases,
+    }
+
+
+def read_archive_index(path):
+    """Índice guardado de un backup --archive, o None si falta o no corresponde al archivo."""
+    try:
+        with open(archive_index_path(path)) as f:
+            index = json.load(f)
+        stat = Path(path).stat()
+    except (OSError, ValueError):
+        return None
+    if (not isinstance(index, dict) or index.get('version') != FORMAT_VERSION
+            or index.get('size') != stat.st_size or index.get('mtime_ns') != stat.st_mtime_ns):
+        return None
+    return index
+
+
+def write_archive_index(path, index):
+    target = archive_index_path(path)
+    tmp = target.with_name(f'{target.name}.{os.getpid()}.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp, target)
+
+
+def archive_summary(path, settle_seconds=MONGO_MANIFEST_SETTLE_SECONDS):
+    """Índice de un backup --archive; sin índice válido se lee el archivo una vez."""
+    index = read_archive_index(path)
+    if index is not None:
+        return index
+    index = scan_archive(path)
+    if time.time() - index['newest_mtime'] >= settle_seconds:
+        try:
+            write_archive_index(path, index)
+        except OSError as e:
+            print(f'No se pudo guardar el índice de {Path(path).name}: {e}')
+    return index
+
+
+def backup_summary(path, settle_seconds=MONGO_MANIFEST_SETTLE_SECONDS):
+    """Manifiesto de la carpeta; si falta (o ya no coincide con sus bases) se recorre.
+
+    El recorrido se guarda solo si no hubo escrituras en los últimos
+    settle_seconds: un volcado en curso se vuelve a medir la próxima vez.
+    Los backups --archive se delegan en archive_summary.
+    """
+    if is_archive_backup(path):
+        return archive_summary(path, settle_seconds)
+    manifest = read_manifest(path)
+    if manifest is not None:
+        # Validación barata: basta listar el primer nivel
+        if _top_level(path)[0] == sorted(manifest['databases']):
+            return manifest
+
+    manifest = scan_backup(path)
+    if time.time() - manifest['newest_mtime'] >= settle_seconds:
+        try:
+            write_manifest(path, manifest)
+        except OSError as e:
+            print(f'No se pudo guardar el manifiesto de {Path(path).name}: {e}')
+    return manifest
+
+
+def main(argv=None):
+    paths = sys.argv[1:] if argv is None else argv
+    if not paths:
+        print(f'Uso: {Path(sys.argv[0]).name} BACKUP...  (carpeta backup_* o backup_*{ARCHIVE_SUFFIX})')
+        return 2
+    failed = 0
+    for path in paths:
+        try:
+            if is_archive_backup(path):
+                manifest = scan_archive(path)
+                write_archive_index(path, manifest)
+            else:
+                manifest = scan_backup(path)
+                write_manifest(path, manifest)
+        except (OSError, ValueError, EOFError) as e:
+            print(f'Error generando el manifiesto de {path}: {e}')
+            failed += 1
+            continue
+        print(f"{Path(path).name}: {len(manifest['databases'])} bases, {manifest['files']} archivos, "
+              f"{manifest['size'] / (1024 * 1024):.2f} MB")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,222 @@
+"""
+Metadatos del servidor MySQL con pool de conexiones y caché TTL
+Evita lanzar el cliente `mysql` en cada request para consultar variables
+"""
+
+import os
+import queue
+import threading
+import time
+
+from metrics import run_command
+
+try:
+    import pymysql
+except ImportError:  # Fallback al cliente mysql si PyMySQL no está instalado
+    pymysql = None
+
+
+class MySQLConnectionPool:
+    """Pool pequeño de conexiones PyMySQL reutilizables entre requests."""
+
+    def __init__(self, host, user, password, size=4, connect_timeout=5):
+        self.host = host
+        self.user = user
+        self.password = password
+        self.size = size
+        self.connect_timeout = connect_timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _connect(self):
+        return pymysql.connect(
+            host=self.host, user=self.user, password=self.password,
+            connect_timeout=self.connect_timeout, autocommit=True, charset='utf8mb4'
+        )
+
+    def _reset_after_fork(self):
+        # Las conexiones heredadas de otro proceso (fork de gunicorn) no se comparten
+        if self._pid != os.getpid():
+            self._idle = queue.LifoQueue()
+            self._created = 0
+            self._pid = os.getpid()
+
+    def acquire(self, timeout=10):
+        self._reset_after_fork()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            conn = self._idle.get(timeout=timeout)
+
+        try:
+            conn.ping(reconnect=True)
+        except Exception:
+            self.discard(conn)
+            raise
+        return conn
+
+    def release(self, conn):
+        self._idle.put(conn)
+
+    def discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    def query(self, sql, args=None, with_columns=False):
+        """Filas como tuplas; con with_columns devuelve (nombres de columnas, filas)."""
+        conn = self.acquire()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(sql, args)
+                rows = cursor.fetchall()
+                columns = [column[0] for column in cursor.description or ()]
+        except Exception:
+            self.discard(conn)
+            raise
+        self.release(conn)
+        rows = [tuple(row) for row in rows]
+        return (columns, rows) if with_columns else rows
+
+
+class ServerMetadata:
+    """Variables del servidor (datadir, binlog_format, log_bin_basename) y
+    listado de bases, cacheados con TTL e invalidación explícita."""
+
+    def __init__(self, host, user, password, ttl=60, pool_size=4):
+        self.host = host
+        self.user = user
+        self.password = password
+        self.ttl = ttl
+        self.pool = MySQLConnectionPool(host, user, password, size=pool_size) if pymysql else None
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def query(self, sql, args=None):
+        """Ejecuta una consulta y devuelve filas como tuplas de strings.
+
+        args (marcadores %s) van como parámetros de PyMySQL; solo con el
+        cliente mysql se escriben como literales, duplicando las comillas.
+        """
+        if self.pool is not None:
+            return [
+                tuple('' if value is None else str(value) for value in row)
+                for row in self.pool.query(sql, args)
+            ]
+        if args:
+            sql = sql % tuple("'" + str(arg).replace("'", "''") + "'" for arg in args)
+        return self._cli_query(sql, ['-N'])
+
+    def query_dicts(self, sql):
+        """Ejecuta una consulta y devuelve filas como dicts columna -> string."""
+        if self.pool is not None:
+            columns, rows = self.pool.query(sql, with_columns=True)
+            return [
+                dict(zip(columns, ('' if value is None else str(value) for value in row)))
+                for row in rows
+            ]
+        lines = self._cli_query(sql)
+        return [dict(zip(lines[0], row)) for row in lines[1:]] if lines else []
+
+    def _cli_query(self, sql, options=()):
+        # Sin PyMySQL: cliente mysql, con la contraseña por entorno (no en argv)
+        result = run_command(
+            ['mysql', f'-u{self.user}', f'-h{self.host}', *options, '-B', '-e', sql],
+            capture_output=True, text=True,
+            env={**os.environ, 'MYSQL_PWD': self.password}
+        )
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip())
+        return [tuple(line.split('\t')) for line in result.stdout.splitlines() if line]
+
+    def cached(self, key, loader):
+        """Devuelve el valor cacheado o lo recalcula si venció el TTL.
+
+        Los errores no se cachean: se propagan al llamador.
+        """
+        now = time.monotonic()
+        with self._lock:
+            item = self._cache.get(key)
+            if item is not None and item[1] > now:
+                return item[0]
+
+        value = loader()
+        with self._lock:
+            self._cache[key] = (value, time.monotonic() + self.ttl)
+        return value
+
+    def invalidate(self, *keys):
+        """Invalida claves puntuales o toda la caché si no se indican."""
+        with self._lock:
+            if not keys:
+                self._cache.clear()
+            for key in keys:
+                self._cache.pop(key, None)
+
+    def variable(self, name):
+        def load():
+            rows = self.query(f"SHOW VARIABLES LIKE '{name}'")
+            return rows[0][1] if rows and len(rows[0]) >= 2 else None
+        return self.cached(f'var:{name}', load)
+
+    def datadir(self):
+        value = self.variable('datadir')
+        return value.rstrip('/') if value else None
+
+    def log_bin_basename(self):
+        return self.variable('log_bin_basename') or None
+
+    def binlog_format(self):
+        return self.cached('binlog_format', lambda: self.query('SELECT @@binlog_format')[0][0])
+
+    def databases(self):
+        return self.cached('databases', lambda: [row[0] for row in self.query('SHOW DATABASES')])
+
+    def foreign_key_links(self, database):
+        """Pares ((base, tabla), (base, tabla_referenciada)) de las claves foráneas de una base.
+
+        Sin caché: se consulta después de restaurar el backup base.
+        """
+        rows = self.query(
+            'SELECT DISTINCT TABLE_SCHEMA, TABLE_NAME, REFERENCED_TABLE_SCHEMA, REFERENCED_TABLE_NAME '
+            'FROM information_schema.KEY_COLUMN_USAGE '
+            'WHERE TABLE_SCHEMA = %s AND REFERENCED_TABLE_NAME IS NOT NULL',
+            (database,)
+        )
+        return [((row[0], row[1]), (row[2], row[3])) for row in rows if len(row) >= 4]
+
+    def global_status(self, name):
+        """Valor actual de una variable de SHOW GLOBAL STATUS (sin caché)."""
+        rows = self.query(f"SHOW GLOBAL STATUS LIKE '{name}'")
+        return rows[0][1] if rows and len(rows[0]) >= 2 else None
+
+    def replica_lag(self):
+        """Segundos de retraso si el servidor es réplica; None si no lo es o el hilo SQL está detenido.
+
+        Sin caché. Prueba SHOW REPLICA STATUS (8.0.22+) y luego SHOW SLAVE STATUS.
+        """
+        for statement, column in (('SHOW REPLICA STATUS', 'Seconds_Behind_Source'),
+                                  ('SHOW SLAVE STATUS', 'Seconds_Behind_Master')):
+            try:
+                rows = self.query_dicts(statement)
+            except Exception:
+                continue
+            lags = [int(row[column]) for row in rows if row.get(column, '').isdigit()]
+            return max(lags) if lags else None
+        return None
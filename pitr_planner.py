@@ -0,0 +1,167 @@
+"""
+Planificador PITR por costo
+Para una base y una hora de corte evalúa cada backup completo disponible
+(históricos .sql[.gz|.zst], .chunked y .dedup, y el incremental) junto con la
+cadena de binlogs archivados que lo lleva hasta esa hora, estima bytes y
+segundos de cada cadena y elige la de menor tiempo total de restauración.
+Solo sirven de base los backups que registran las coordenadas del binlog de su
+snapshot: la fecha del archivo es el fin del volcado y partir de ahí perdería
+las transacciones confirmadas mientras corría
+"""
+
+import time
+from pathlib import Path
+
+from binlog_reader import (
+    BinlogChainError, BinlogFormatError, binlog_chain_gap, binlog_sequence, parse_dump_coordinates,
+    plan_database_extract, plan_replay, plan_window_extract, read_dump_coordinates
+)
+from chunked_backup import read_manifest as read_chunked_manifest
+from config import env
+from dedup_store import DedupStoreError, read_manifest as read_dedup_manifest
+
+# Velocidades de referencia para estimar: carga del dump (MB sin comprimir por
+# segundo y por cliente mysql) y aplicación de binlogs (MB de eventos por segundo)
+PITR_LOAD_MB_S = float(env.get('PITR_LOAD_MB_S', '20'))
+PITR_BINLOG_MB_S = float(env.get('PITR_BINLOG_MB_S', '5'))
+# Relación de compresión supuesta si no hay registro del tamaño sin comprimir
+PITR_COMPRESSION_RATIO = float(env.get('PITR_COMPRESSION_RATIO', '5'))
+
+COORDINATES_HEAD_BYTES = 256 * 1024
+MB = 1024 * 1024
+
+
+def base_candidate(path, kind, backup_time, size, raw_bytes=None, load_threads=1):
+    """Backup completo candidato; sin raw_bytes se estima a partir del tamaño en disco."""
+    if raw_bytes is None:
+        raw_bytes = size if kind == 'sql' else int(size * PITR_COMPRESSION_RATIO)
+    return {
+        'path': Path(path), 'kind': kind, 'time': backup_time, 'size': size,
+        'raw_bytes': raw_bytes, 'load_threads': max(1, load_threads),
+    }
+
+
+def base_coordinates(candidate, store=None):
+    """Archivo/posición de binlog del snapshot del backup, o None si no se registró."""
+    path, kind = candidate['path'], candidate['kind']
+    try:
+        if kind == 'chunked':
+            binlog = read_chunked_manifest(path).get('binlog')
+            return {'file': binlog['file'], 'position': binlog['position']} if binlog else None
+        if kind == 'dedup':
+            chunks = read_dedup_manifest(path)['chunks']
+            if store is None or not chunks:
+                return None
+            head = store.get(chunks[0][0])[:COORDINATES_HEAD_BYTES]
+            return parse_dump_coordinates(head.decode('utf-8', errors='replace'))
+        return read_dump_coordinates(path, COORDINATES_HEAD_BYTES)
+    except (OSError, ValueError, KeyError, EOFError, DedupStoreError) as e:
+        print(f'No se pudieron leer las coordenadas de {path.name}: {e}')
+        return None
+
+
+def contiguous_runs(index, binlogs):
+    """Tramos de binlogs con secuencia consecutiva: [(archivos, desde, hasta)].
+
+    desde es el primer evento del tramo; hasta es None si el tramo llega al
+    binlog más reciente (cubre hasta ahora) o el último evento si no.
+    """
+    paths = sorted((Path(p) for p in binlogs), key=lambda p: (binlog_sequence(p.name), p.name))
+    runs = []
+    for path in paths:
+        if runs and binlog_sequence(path.name) == binlog_sequence(runs[-1][-1].name) + 1:
+            runs[-1].append(path)
+        else:
+            runs.append([path])
+    summaries = {p: index.refresh(p) for p in paths}
+    result = []
+    for i, files in enumerate(runs):
+        first_ts = next((summaries[p]['first_ts'] for p in files if summaries[p]['first_ts']), None)
+        last_ts = None if i == len(runs) - 1 else summaries[files[-1]]['last_ts']
+        result.append((files, first_ts, last_ts))
+    return result
+
+
+def chain_for_base(runs, coordinates, target_ts):
+    """Archivos del tramo que cubre [backup, corte] sin huecos, o (None, motivo)."""
+    if not coordinates:
+        return None, ('el backup no registra coordenadas de binlog (--master-data): se perderían '
+                      'las transacciones confirmadas durante el volcado')
+    start_seq = binlog_sequence(coordinates['file'])
+    for files, _, last_ts in runs:
+        # Cada tramo ya es consecutivo: sirve el que arranca (desde start_seq) en el binlog del backup
+        if binlog_chain_gap([p for p in files if binlog_sequence(p.name) >= start_seq], coordinates['file']):
+            continue
+        if last_ts is not None and last_ts < target_ts:
+            return None, 'los binlogs archivados tienen un hueco antes de la hora de corte'
+        return files, None
+    return None, binlog_chain_gap([], coordinates['file'])
+
+
+def evaluate_candidate(index, runs, candidate, db_name, target_ts, extract_only, store=None):
+    """Cadena backup + binlogs de un candidato con su costo estimado (o el motivo por el que no sirve)."""
+    result = {**candidate, 'valid': False, 'reason': None, 'plan': None, 'replay_bytes': 0}
+    coordinates = base_coordinates(candidate, store)
+    result['coordinates'] = coordinates
+    files, reason = chain_for_base(runs, coordinates, target_ts)
+    if files is None:
+        result['reason'] = reason
+        return result
+    try:
+        plan = plan_replay(index, files, start_coordinates=coordinates, stop_time=target_ts)
+        if plan['files']:
+            extract = (plan_database_extract(index, plan, db_name) if extract_only
+                       else plan_window_extract(index, plan))
+            result['replay_bytes'] = extract['bytes']
+    except BinlogChainError as e:
+        result['reason'] = str(e)
+        return result
+    except (OSError, BinlogFormatError) as e:
+        result['reason'] = f'binlogs ilegibles: {e}'
+        return result
+
+    base_seconds = candidate['raw_bytes'] / MB / (PITR_LOAD_MB_S * candidate['load_threads'])
+    binlog_seconds = result['replay_bytes'] / MB / PITR_BINLOG_MB_S
+    result.update(valid=True, plan=plan, base_seconds=base_seconds, binlog_seconds=binlog_seconds,
+                  estimated_seconds=base_seconds + binlog_seconds)
+    return result
+
+
+def plan_restore(index, candidates, binlogs, db_name, target_ts=None, extract_only=True, store=None):
+    """Evalúa todos los candidatos anteriores al corte; devuelve (elegido, evaluados).
+
+    Entre cadenas válidas gana la de menor tiempo estimado y, a igual costo,
+    el backup más reciente; elegido es None si ninguna llega a target_ts.
+    """
+    target_ts = target_ts or time.time()
+    runs = contiguous_runs(index, binlogs)
+    evaluated = []
+    for candidate in sorted(candidates, key=lambda c: c['time'], reverse=True):
+        if candidate['time'] > target_ts:
+            evaluated.append({**candidate, 'valid': False, 'reason': 'posterior a la hora de corte', 'plan': None})
+            continue
+        evaluated.append(evaluate_candidate(index, runs, candidate, db_name, target_ts, extract_only, store))
+    valid = [c for c in evaluated if c['valid']]
+    chosen = min(valid, key=lambda c: (c['estimated_seconds'], -c['time'])) if valid else None
+    return chosen, evaluated
+
+
+def describe_candidate(candidate):
+    """Versión serializable (JSON) de un candidato evaluado."""
+    plan = candidate.get('plan') or {}
+    return {
+        'backup': candidate['path'].name,
+        'kind': candidate['kind'],
+        'time': candidate['time'],
+        'size': candidate['size'],
+        'raw_bytes': candidate['raw_bytes'],
+        'valid': candidate['valid'],
+        'reason': candidate.get('reason'),
+        'binlogs': [p.name for p in plan.get('files', [])],
+        'start_position': plan.get('start_position'),
+        'stop_position': plan.get('stop_position'),
+        'replay_bytes': candidate.get('replay_bytes', 0),
+        'base_seconds': round(candidate.get('base_seconds', 0), 1),
+        'binlog_seconds': round(candidate.get('binlog_seconds', 0), 1),
+        'estimated_seconds': round(candidate['estimated_seconds'], 1) if candidate['valid'] else None,
+    }
@@ -120,10 +120,14 @@ if [ ${#BINLOGS[@]} -eq 0 ]; then
     exit 0
 fi
 
+# Lector nativo de cabeceras: no decodifica cada binlog completo con mysqlbinlog
+PYTHON_BIN="${SCRIPT_DIR}/venv/bin/python3"
+[ -x "$PYTHON_BIN" ] || PYTHON_BIN="python3"
+
 echo "Archivos disponibles:"
 for i in "${!BINLOGS[@]}"; do
     FILE="${BINLOGS[$i]}"
-    FIRST_EVENT=$(mysqlbinlog --no-defaults "$FILE" 2>/dev/null | grep -m1 "^# [0-9]* [0-9][0-9]:[0-9][0-9]:[0-9][0-9]" | head -1)
+    FIRST_EVENT=$("$PYTHON_BIN" "${SCRIPT_DIR}/binlog_reader.py" "$FILE" 2>/dev/null | cut -d: -f2- | sed 's/^ //')
     echo "$((i+1))) $(basename $FILE)"
     echo "   -> $FIRST_EVENT"
 done
@@ -157,10 +161,22 @@ if [ -n "$STOP_TIME" ]; then
     CMD="$CMD --stop-datetime=\"$STOP_TIME\""
 fi
 
+FILES=""
+COMPRESSED=0
 for i in $(seq 0 $((CHOICE_INDEX-1))); do
-    CMD="$CMD \"${BINLOGS[$i]}\""
+    FILES="$FILES \"${BINLOGS[$i]}\""
+    case "${BINLOGS[$i]}" in
+        *.gz|*.zst) COMPRESSED=1 ;;
+    esac
 done
 
+if [ "$COMPRESSED" -eq 1 ]; then
+    # Binlogs archivados comprimidos: se descomprimen en streaming hacia mysqlbinlog
+    CMD="\"$PYTHON_BIN\" \"${SCRIPT_DIR}/binlog_reader.py\" --cat $FILES | $CMD -"
+else
+    CMD="$CMD $FILES"
+fi
+
 CMD="$CMD | mysql -u\"$MYSQL_USER\" -p\"$MYSQL_PASS\" -h\"$MYSQL_HOST\""
 
 eval $CMD 2> /dev/null
@@ -43,11 +43,11 @@ echo ""
 echo "Buscando backups en: $DIR_DESTINO ..."
 echo "------------------------------------------------------"
 
-# Buscar archivos .sql.gz, ordenar por tiempo (nuevos primero)
-BACKUP_LIST=($(ls -1t "$DIR_DESTINO"/*-back_*.sql.gz 2>/dev/null))
+# Buscar archivos .sql.gz / .sql.zst / .sql, ordenar por tiempo (nuevos primero)
+BACKUP_LIST=($(ls -1t "$DIR_DESTINO"/*-back_*.sql.gz "$DIR_DESTINO"/*-back_*.sql.zst "$DIR_DESTINO"/*-back_*.sql 2>/dev/null))
 
 if [ ${#BACKUP_LIST[@]} -eq 0 ]; then
-    echo "No se encontraron backups válidos (*-back_*.sql.gz)."
+    echo "No se encontraron backups válidos (*-back_*.sql.gz, *.sql.zst, *.sql)."
     exit 0
 fi
 
@@ -68,7 +68,7 @@ select BACKUP_FILE in "${BACKUP_LIST[@]}" "SALIR"; do
 done
 
 # --- PASO 2: IDENTIFICAR LA BASE DE DATOS ---
-# El formato del nombre es: DBNAME-back_FECHA.sql.gz
+# El formato del nombre es: DBNAME-back_FECHA.sql[.gz|.zst]
 # Extraemos todo lo que esté antes de "-back"
 DB_NAME=$(basename "$BACKUP_FILE" | sed 's/-back_.*//')
 
@@ -93,8 +93,13 @@ fi
 echo ""
 echo "Descomprimiendo y restaurando... (Esto puede tardar dependiendo del tamaño)"
 
-# Usamos 'gunzip -c' para descomprimir a stdout (pantalla) y redirigimos a mysql
-gunzip -c "$BACKUP_FILE" | mysql -u"$MYSQL_USER" -p"$MYSQL_PASS" -h"$MYSQL_HOST" 2> /dev/null
+# Descomprimimos a stdout según la extensión y redirigimos a mysql
+case "$BACKUP_FILE" in
+    *.zst) DECOMPRESS=(zstd -dcq) ;;
+    *.gz) DECOMPRESS=(gunzip -c) ;;
+    *) DECOMPRESS=(cat) ;;
+esac
+"${DECOMPRESS[@]}" "$BACKUP_FILE" | mysql -u"$MYSQL_USER" -p"$MYSQL_PASS" -h"$MYSQL_HOST" 2> /dev/null
 
 # Verificación
 if [ $? -eq 0 ]; then
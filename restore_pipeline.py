@@ -0,0 +1,346 @@
+"""
+Pipeline de restauración en streaming
+Lee el dump en buffers grandes, descomprime en hilos aparte y alimenta el
+stdin del cliente (mysql) a través de colas acotadas
+"""
+
+import os
+import queue
+import struct
+import subprocess
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from backup_codecs import CodecError, codec_for_path
+from metrics import record_command
+
+READ_SIZE = 4 * 1024 * 1024
+QUEUE_DEPTH = 8
+STDERR_TAIL_LINES = 200
+STDERR_TAIL_LINE_BYTES = 4096
+
+_END = object()
+
+
+class RestoreError(Exception):
+    """Fallo del cliente de restauración (código de salida distinto de 0)."""
+
+    def __init__(self, message, returncode=None, stderr=''):
+        super().__init__(message)
+        self.returncode = returncode
+        self.stderr = stderr
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+def _threaded(iterable, stop, depth=QUEUE_DEPTH):
+    """Consume iterable en un hilo propio y entrega sus items por una cola acotada."""
+    items = queue.Queue(maxsize=depth)
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(_END)
+        except BaseException as e:
+            put(_Failure(e))
+
+    threading.Thread(target=run, daemon=True).start()
+    while True:
+        item = items.get()
+        if item is _END:
+            return
+        if isinstance(item, _Failure):
+            raise item.error
+        yield item
+
+
+def _collect_tail(stream, tail):
+    """Guarda solo las últimas líneas de stderr (memoria acotada)."""
+    for line in iter(stream.readline, b''):
+        tail.append(line[:STDERR_TAIL_LINE_BYTES])
+    stream.close()
+
+
+def _read_chunks(path, job=None, counter=None):
+    bytes_read = 0
+    with open(path, 'rb') as f:
+        while True:
+            raw = f.read(READ_SIZE)
+            if not raw:
+                break
+            bytes_read += len(raw)
+            if counter is not None:
+                counter['bytes_read'] = bytes_read
+            if job is not None:
+                job.update(bytes_read=bytes_read)
+            yield raw
+
+
+def gzip_block_size(header):
+    """Tamaño total del miembro gzip si trae el subcampo BGZF 'BC' (BSIZE), si no None.
+
+    Los archivos escritos como miembros independientes con este subcampo se
+    pueden partir sin descomprimir y descomprimir en paralelo.
+    """
+    if len(header) < 18 or header[:2] != b'\x1f\x8b' or not header[3] & 0x04:
+        return None
+    xlen = struct.unpack('<H', header[10:12])[0]
+    extra = header[12:12 + xlen]
+    pos = 0
+    while pos + 4 <= len(extra):
+        si = extra[pos:pos + 2]
+        slen = struct.unpack('<H', extra[pos + 2:pos + 4])[0]
+        if si == b'BC' and slen == 2:
+            return struct.unpack('<H', extra[pos + 4:pos + 6])[0] + 1
+        pos += 4 + slen
+    return None
+
+
+def _iter_gzip_blocks(path, job=None, counter=None):
+    """Recorre un archivo de miembros BGZF devolviendo cada miembro completo.
+
+    Un archivo truncado (miembro incompleto o sin el bloque EOF final) lanza CodecError.
+    """
+    bytes_read = 0
+    block = None
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(18)
+            if not header:
+                break
+            size = gzip_block_size(header)
+            if size is None:
+                raise ValueError(f'{path}: miembro gzip sin índice de bloque en offset {bytes_read}')
+            block = header + f.read(size - len(header))
+            if len(block) < size:
+                raise CodecError(f'{path}: gzip truncado en offset {bytes_read}')
+            bytes_read += len(block)
+            if counter is not None:
+                counter['bytes_read'] = bytes_read
+            if job is not None:
+                job.update(bytes_read=bytes_read)
+            yield block
+    if block is not None and zlib.decompress(block, 31):
+        raise CodecError(f'{path}: gzip truncado (falta el bloque EOF final)')
+
+
+def _parallel_gunzip_blocks(blocks, threads):
+    """Descomprime miembros en paralelo (zlib libera el GIL) conservando el orden."""
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='gunzip') as pool:
+        pending = deque()
+        for block in blocks:
+            pending.append(pool.submit(zlib.decompress, block, 31))
+            if len(pending) >= threads * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def is_block_gzip(path):
+    with open(path, 'rb') as f:
+        return gzip_block_size(f.read(18 + 64)) is not None
+
+
+def describe_throughput(stats):
+    """Texto corto con volumen, duración y MB/s de una restauración."""
+    mb = stats['bytes_out'] / (1024 * 1024)
+    return f"{mb:.1f} MB en {stats['seconds']:.1f} s, {stats['mb_s']:.1f} MB/s"
+
+
+def feed_process(cmd, chunks, job=None, env=None, stop=None, counter=None):
+    """Escribe chunks en el stdin de cmd; lanza RestoreError si termina con error.
+
+    Si la fuente falla (dump corrupto o truncado, chunk faltante, productor
+    caído) el cliente se mata antes de cerrar su stdin: nunca recibe un EOF
+    limpio que confirme la parte ya enviada.
+    Devuelve estadísticas (bytes enviados, segundos, MB/s).
+    """
+    started = time.monotonic()
+    stop = stop or threading.Event()
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, env=env)
+    stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+    collector = threading.Thread(target=_collect_tail, args=(proc.stderr, stderr_tail), daemon=True)
+    collector.start()
+
+    bytes_out = 0
+    source_error = None
+    try:
+        for data in chunks:
+            proc.stdin.write(data)
+            bytes_out += len(data)
+            if job is not None:
+                job.update(bytes_out=bytes_out)
+    except BrokenPipeError:
+        pass  # el cliente terminó antes: su código de salida/stderr explican el motivo
+    except BaseException as e:
+        source_error = e
+        proc.kill()
+    finally:
+        stop.set()
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+
+    returncode = proc.wait()
+    record_command(cmd, time.monotonic() - started, returncode)
+    collector.join()
+    stderr = b''.join(stderr_tail).decode('utf-8', errors='replace')
+    if job is not None:
+        job.update(force=True, bytes_out=bytes_out)
+    if source_error is not None:
+        if isinstance(source_error, RestoreError) or not isinstance(source_error, Exception):
+            raise source_error
+        raise RestoreError(f'Error leyendo el backup: {source_error} ({cmd[0]} interrumpido)',
+                           returncode, stderr) from source_error
+    if returncode != 0:
+        raise RestoreError(stderr.strip() or f'{cmd[0]} terminó con código {returncode}', returncode, stderr)
+
+    seconds = max(time.monotonic() - started, 0.001)
+    return {
+        'bytes_read': (counter or {}).get('bytes_read', bytes_out),
+        'bytes_out': bytes_out,
+        'seconds': seconds,
+        'mb_s': bytes_out / seconds / (1024 * 1024),
+    }
+
+
+def restore_file(path, cmd, job=None, env=None, threads=None, wrap=None):
+    """Restaura un dump (.sql, .sql.gz o .sql.zst) sobre el stdin de cmd.
+
+    La lectura y la descompresión corren en hilos separados del que escribe en
+    el cliente; si el .gz está escrito en bloques independientes (BGZF) los
+    bloques se descomprimen en paralelo con `threads` hilos (también con uno
+    solo se recorre por bloques, para detectar un archivo cortado entre
+    bloques). wrap(chunks) puede envolver el SQL descomprimido (p. ej.
+    fast_load_stream).
+    """
+    threads = threads or os.cpu_count() or 1
+    stop = threading.Event()
+    counter = {}
+    path = str(path)
+    codec = codec_for_path(path)
+
+    if codec.name == 'gzip' and is_block_gzip(path):
+        blocks = _threaded(_iter_gzip_blocks(path, job, counter), stop)
+        chunks = _parallel_gunzip_blocks(blocks, threads)
+    elif codec.extension:
+        raw = _threaded(_read_chunks(path, job, counter), stop)
+        chunks = codec.decompress(raw)
+    else:
+        chunks = _read_chunks(path, job, counter)
+    if wrap is not None:
+        chunks = wrap(chunks)
+
+    return feed_process(cmd, _threaded(chunks, stop), job=job, env=env, stop=stop, counter=counter)
+
+
+def restore_files(paths, cmd, job=None, env=None):
+    """Envía varios dumps (.sql, .gz o .zst) en orden por un único cliente."""
+    stop = threading.Event()
+
+    def chunks():
+        for path in paths:
+            yield from codec_for_path(path).decompress(_read_chunks(path))
+
+    return feed_process(cmd, _threaded(chunks(), stop), job=job, env=env, stop=stop)
+
+
+def _feed_stdin(proc, chunks, failures):
+    """Escribe chunks en el stdin de proc; si la fuente falla, mata a proc."""
+    try:
+        for data in chunks:
+            proc.stdin.write(data)
+    except BrokenPipeError:
+        pass
+    except BaseException as e:
+        failures.append(e)
+        proc.kill()
+    finally:
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+
+
+def pipe_processes(producer_cmd, consumer_cmd, job=None, env=None, producer_input=None):
+    """Equivalente a `producer | consumer` contando bytes transferidos.
+
+    producer_input (iterable de bytes) se escribe en el stdin del productor
+    desde un hilo aparte.
+    """
+    producer_started = time.monotonic()
+    producer = subprocess.Popen(producer_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env,
+                                stdin=subprocess.PIPE if producer_input is not None else None)
+    producer_errors = deque(maxlen=STDERR_TAIL_LINES)
+    collector = threading.Thread(target=_collect_tail, args=(producer.stderr, producer_errors), daemon=True)
+    collector.start()
+    input_failures = []
+    feeder = None
+    if producer_input is not None:
+        feeder = threading.Thread(target=_feed_stdin, args=(producer, producer_input, input_failures), daemon=True)
+        feeder.start()
+    stop = threading.Event()
+    counter = {}
+
+    def producer_error():
+        if feeder is not None:
+            feeder.join()
+        if input_failures:
+            return RestoreError(f'Error leyendo la entrada de {producer_cmd[0]}: {input_failures[0]}')
+        if producer.returncode != 0:
+            collector.join()
+            stderr = b''.join(producer_errors).decode('utf-8', errors='replace')
+            return RestoreError(stderr.strip() or f'{producer_cmd[0]} terminó con código {producer.returncode}',
+                                producer.returncode, stderr)
+        return None
+
+    def chunks():
+        bytes_read = 0
+        for data in iter(lambda: producer.stdout.read1(READ_SIZE), b''):
+            bytes_read += len(data)
+            counter['bytes_read'] = bytes_read
+            if job is not None:
+                job.update(bytes_read=bytes_read)
+            yield data
+        # El fallo del productor se informa antes del EOF: feed_process mata al consumidor
+        producer.wait()
+        error = producer_error()
+        if error is not None:
+            raise error
+
+    try:
+        stats = feed_process(consumer_cmd, _threaded(chunks(), stop), job=job, env=env, stop=stop, counter=counter)
+    except BaseException:
+        producer.kill()
+        raise
+    finally:
+        producer.wait()
+        record_command(producer_cmd, time.monotonic() - producer_started, producer.returncode)
+        collector.join()
+        producer.stdout.close()
+        if feeder is not None:
+            feeder.join()
+
+    error = producer_error()
+    if error is not None:
+        raise error
+    return stats
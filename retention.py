@@ -0,0 +1,177 @@
+"""
+Retención de backups por política GFS (abuelo-padre-hijo) y borrado regulado
+De cada base se conserva el backup más nuevo de cada uno de los últimos
+RETENTION_DAILY días con backups, de las últimas RETENTION_WEEKLY semanas y
+de los últimos RETENTION_MONTHLY meses. El plan se arma en una sola pasada
+sobre las entradas del catálogo (nombre, fecha, tamaño), sin tocar el disco.
+
+El borrado corre como trabajo en segundo plano, archivo por archivo (también
+dentro de carpetas .chunked y de mongodump): tandas de RETENTION_BATCH_FILES
+archivos con una pausa entre tandas y como mucho RETENTION_MAX_MB_S liberados
+por segundo, para no competir por el disco con un backup que está escribiendo.
+"""
+
+import os
+import time
+from datetime import datetime
+
+from config import env
+from load_governor import RateLimiter
+
+RETENTION_DAILY = int(env.get('RETENTION_DAILY', '7'))
+RETENTION_WEEKLY = int(env.get('RETENTION_WEEKLY', '4'))
+RETENTION_MONTHLY = int(env.get('RETENTION_MONTHLY', '6'))
+RETENTION_BATCH_FILES = int(env.get('RETENTION_BATCH_FILES', '100'))
+RETENTION_BATCH_PAUSE = float(env.get('RETENTION_BATCH_PAUSE', '0.5'))
+RETENTION_MAX_MB_S = float(env.get('RETENTION_MAX_MB_S', '200'))  # 0 = sin límite
+
+MB = 1024 * 1024
+MAX_KEEP = 1000
+
+# (nivel, etiqueta, período de una fecha)
+LEVELS = (
+    ('daily', 'diario', lambda dt: dt.date()),
+    ('weekly', 'semanal', lambda dt: dt.isocalendar()[:2]),
+    ('monthly', 'mensual', lambda dt: (dt.year, dt.month)),
+)
+
+
+class RetentionError(Exception):
+    """Política de retención inválida."""
+
+
+def build_policy(daily=None, weekly=None, monthly=None):
+    """Política {'daily', 'weekly', 'monthly'}; lo no indicado toma el valor de .env."""
+    policy = {}
+    for level, value, default in (('daily', daily, RETENTION_DAILY), ('weekly', weekly, RETENTION_WEEKLY),
+                                  ('monthly', monthly, RETENTION_MONTHLY)):
+        if value is None or value == '':
+            value = default
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            raise RetentionError(f'valor inválido para {level}: {value!r}')
+        if not 0 <= value <= MAX_KEEP:
+            raise RetentionError(f'{level} debe estar entre 0 y {MAX_KEEP}')
+        policy[level] = value
+    if not any(policy.values()):
+        raise RetentionError('la política no conserva ningún backup')
+    return policy
+
+
+def entry_time(entry):
+    return entry.get('timestamp') or entry['mtime']
+
+
+def _plan_item(entry, group, keep, reasons):
+    return {
+        'name': entry['name'],
+        'path': entry['path'],
+        'kind': entry.get('kind'),
+        'group': group,
+        'timestamp': entry_time(entry),
+        'size': entry['size'],
+        'keep': keep,
+        'reasons': reasons,
+    }
+
+
+def plan_retention(entries, policy, group_of=lambda entry: entry.get('db_name')):
+    """[{name, path, kind, group, timestamp, size, keep, reasons}] de más nuevo a más viejo.
+
+    Por grupo (la base) se recorre de lo más nuevo a lo más viejo: el primer
+    backup de un día, semana o mes todavía no cubierto se conserva mientras ese
+    nivel no haya llegado a su cantidad. El más nuevo de cada grupo siempre se
+    conserva (la política conserva al menos un nivel).
+    """
+    covered = {}
+    plan = []
+    for entry in sorted(entries, key=entry_time, reverse=True):
+        group = group_of(entry)
+        moment = datetime.fromtimestamp(entry_time(entry))
+        reasons = []
+        for level, label, period_of in LEVELS:
+            periods = covered.setdefault((group, level), set())
+            period = period_of(moment)
+            if period not in periods and len(periods) < policy[level]:
+                periods.add(period)
+                reasons.append(label)
+        plan.append(_plan_item(entry, group, bool(reasons), reasons))
+    return plan
+
+
+def plan_age(entries, days, now=None):
+    """Plan equivalente a "borrar lo modificado hace más de N días"."""
+    cutoff = (now or time.time()) - days * 86400
+    return [
+        _plan_item(entry, entry.get('db_name'), entry['mtime'] >= cutoff,
+                   [f'menos de {days} días'] if entry['mtime'] >= cutoff else [])
+        for entry in sorted(entries, key=entry_time, reverse=True)
+    ]
+
+
+def summarize_plan(plan):
+    """Totales del plan y por grupo (cantidades y bytes a liberar)."""
+    groups = {}
+    for item in plan:
+        group = groups.setdefault(item['group'], {'keep': 0, 'delete': 0, 'delete_bytes': 0})
+        if item['keep']:
+            group['keep'] += 1
+        else:
+            group['delete'] += 1
+            group['delete_bytes'] += item['size']
+    return {
+        'keep': sum(g['keep'] for g in groups.values()),
+        'delete': sum(g['delete'] for g in groups.values()),
+        'delete_bytes': sum(g['delete_bytes'] for g in groups.values()),
+        'groups': groups,
+    }
+
+
+class ThrottledRemover:
+    """Borra archivos y árboles en tandas, con pausa entre tandas y tope de MB/s liberados."""
+
+    def __init__(self, batch_files=RETENTION_BATCH_FILES, batch_pause=RETENTION_BATCH_PAUSE,
+                 max_mb_s=RETENTION_MAX_MB_S, on_batch=None):
+        self.batch_files = max(1, batch_files)
+        self.batch_pause = batch_pause
+        self.rate = RateLimiter(max_mb_s * MB or None)
+        self.on_batch = on_batch
+        self.files = 0
+        self.bytes = 0
+
+    def _unlink(self, path):
+        try:
+            size = os.lstat(path).st_size
+            os.unlink(path)
+        except FileNotFoundError:
+            return
+        self.files += 1
+        self.bytes += size
+        self.rate.consume(size)
+        if self.files % self.batch_files == 0:
+            if self.on_batch is not None:
+                self.on_batch(self)
+            if self.batch_pause > 0:
+                time.sleep(self.batch_pause)
+
+    def remove(self, path):
+        """Borra un archivo o un árbol completo de abajo hacia arriba; lo que ya no existe se ignora."""
+        path = os.fspath(path)
+        if not os.path.isdir(path) or os.path.islink(path):
+            self._unlink(path)
+            return
+        for root, dirs, files in os.walk(path, topdown=False):
+            for name in files:
+                self._unlink(os.path.join(root, name))
+            for name in dirs:
+                child = os.path.join(root, name)
+                if os.path.islink(child):
+                    self._unlink(child)
+                else:
+                    os.rmdir(child)
+        os.rmdir(path)
+
+
+def describe_removal(remover, seconds):
+    return f'{remover.files} archivos, {remover.bytes / MB:.1f} MB liberados en {seconds:.1f} s'
@@ -39,29 +39,28 @@ fi
 
 # --- 3. EJECUCIÓN DE LA SINCRONIZACIÓN ---
 
-# Crear el directorio remoto si no existe (para evitar errores de rsync)
-mkdir -p "$DIR_DESTINO_REMOTO"
+# sync_engine.py compara el origen con el manifiesto del destino (.sync_manifest.json),
+# copia en paralelo (SYNC_WORKERS) solo lo nuevo o cambiado, sin recomprimir los .gz/.zst,
+# verifica el SHA-256 de cada copia y borra lo que ya no está en el origen solo si la copia
+# terminó sin errores. Si la corrida anterior sigue copiando, esta se omite.
+# Opciones: --workers N, --checksum (recalcula el SHA-256 de todo el origen), --dry-run
+PYTHON="${SCRIPT_DIR}/venv/bin/python3"
+if [ ! -x "$PYTHON" ]; then
+    PYTHON="python3"
+fi
 
 echo "Iniciando sincronizacion..."
 echo "  Origen: $DIR_DESTINO_ORIGEN"
 echo "  Destino: $DIR_DESTINO_REMOTO"
 
-# Opciones de RSYNC explicadas:
-# -a: modo archivo (preserva permisos, fechas, propietarios, recursivo)
-# -v: verbose (muestra progreso)
-# -z: comprime los datos durante la transferencia (mas rapido)
-# --delete: ELIMINA archivos en el destino que ya no estan en el origen (MIRROR)
-# --progress: muestra barra de progreso
-# Nota el / al final de ORIGEN: copia el *contenido* de la carpeta, no la carpeta en si.
-
-sudo rsync -avz --no-o --no-g --delete --progress "$DIR_DESTINO_ORIGEN/" "$DIR_DESTINO_REMOTO/"
+sudo "$PYTHON" "${SCRIPT_DIR}/sync_engine.py" "$DIR_DESTINO_ORIGEN" "$DIR_DESTINO_REMOTO" "$@"
+STATUS=$?
 
-# Verificar codigo de salida
-if [ $? -eq 0 ]; then
+if [ $STATUS -eq 0 ]; then
     echo ""
     echo "Sincronizacion finalizada con exito."
 else
     echo ""
-    echo "ERROR: La sincronizacion fallo con codigo de error $?."
+    echo "ERROR: La sincronizacion fallo con codigo de error $STATUS."
     exit 1
 fi
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Réplica de la carpeta de backups por manifiestos (reemplaza rsync --delete)
+Compara el árbol de origen (nombre, tamaño, mtime) con el manifiesto del
+destino (.sync_manifest.json: tamaño, mtime y SHA-256 de lo ya copiado) y
+copia solo lo nuevo o cambiado, con SYNC_WORKERS copias en paralelo y sin
+recomprimir. Cada archivo se escribe como temporal, se relee en el destino
+para comprobar su SHA-256 y recién entonces se renombra. Los archivos que ya
+no están en el origen se borran solo si la fase de copia terminó sin errores.
+
+    python3 sync_engine.py /mnt/backup/ /mnt/nas/backup/ [--workers 4] [--checksum] [--dry-run]
+"""
+
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from fnmatch import fnmatch
+
+from config import env
+
+MANIFEST_NAME = '.sync_manifest.json'
+LOCK_NAME = '.sync.lock'
+PARTIAL_SUFFIX = '.sync-partial'
+MANIFEST_VERSION = 1
+READ_SIZE = 4 * 1024 * 1024
+
+SYNC_WORKERS = int(env.get('SYNC_WORKERS', '4'))
+# Archivos a medio escribir por los backups (.<nombre>.partial, temporales de manifiestos)
+SYNC_EXCLUDE = [
+    pattern.strip() for pattern in env.get('SYNC_EXCLUDE', '*.partial,*.tmp').split(',') if pattern.strip()
+]
+
+
+class SyncError(Exception):
+    """Origen o destino inválidos, o copia que no se pudo verificar."""
+
+
+class SyncBusy(SyncError):
+    """Otra corrida (p. ej. la del minuto anterior) sigue escribiendo en el destino."""
+
+
+def _excluded(name, excludes):
+    return (name in (MANIFEST_NAME, LOCK_NAME) or name.endswith(PARTIAL_SUFFIX)
+            or any(fnmatch(name, pattern) for pattern in excludes))
+
+
+def walk_tree(root, excludes=()):
+    """{ruta relativa: (tamaño, mtime_ns, modo)} de los archivos del árbol (sin seguir symlinks)."""
+    files = {}
+    pending = ['']
+    while pending:
+        relative = pending.pop()
+        try:
+            with os.scandir(os.path.join(root, relative)) as it:
+                for entry in it:
+                    if _excluded(entry.name, excludes):
+                        continue
+                    path = os.path.join(relative, entry.name)
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(path)
+                        elif entry.is_file(follow_symlinks=False):
+                            stat = entry.stat(follow_symlinks=False)
+                            files[path] = (stat.st_size, stat.st_mtime_ns, stat.st_mode & 0o7777)
+                    except OSError:
+                        continue
+        except FileNotFoundError:
+            continue
+    return files
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(READ_SIZE), b''):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def read_manifest(root):
+    """Manifiesto del destino ({ruta: {size, mtime_ns, sha256}}), vacío si falta o no es válido."""
+    try:
+        with open(os.path.join(root, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(manifest, dict) or manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest.get('files', {})
+
+
+def write_manifest(root, files):
+    target = os.path.join(root, MANIFEST_NAME)
+    tmp = f'{target}.{os.getpid()}{PARTIAL_SUFFIX}'
+    with open(tmp, 'w') as f:
+        json.dump({'version': MANIFEST_VERSION, 'synced_at': time.time(), 'files': files}, f)
+    os.replace(tmp, target)
+
+
+def plan_sync(source_files, dest_files, manifest, source_root=None, checksum=False):
+    """Listas (a copiar, a adoptar, a borrar) según el origen, el manifiesto y el árbol del destino.
+
+    Un archivo se copia si cambió su tamaño o mtime en el origen respecto del
+    manifiesto o si la copia del destino falta o no tiene el tamaño registrado.
+    Los que ya están en el destino con el mismo tamaño y mtime pero sin entrada
+    en el manifiesto (p. ej. copiados antes con rsync) se adoptan: se comparan
+    los SHA-256 y solo se copian si difieren. Con checksum además se recalcula
+    el SHA-256 del origen de los archivos sin cambios.
+    """
+    copy, adopt = [], []
+    for path, (size, mtime_ns, _mode) in sorted(source_files.items()):
+        entry = manifest.get(path)
+        dest = dest_files.get(path)
+        if entry is None:
+            (adopt if dest is not None and dest[:2] == (size, mtime_ns) else copy).append(path)
+        elif entry.get('size') != size or entry.get('mtime_ns') != mtime_ns or dest is None or dest[0] != size:
+            copy.append(path)
+        elif checksum and file_sha256(os.path.join(source_root, path)) != entry.get('sha256'):
+            copy.append(path)
+    delete = sorted(path for path in dest_files if path not in source_files)
+    return copy, adopt, delete
+
+
+def copy_file(source_root, dest_root, path):
+    """Copia un archivo verificando el SHA-256 en el destino; devuelve la entrada de manifiesto.
+
+    Devuelve None si el origen cambió durante la copia (se reintenta en la
+    próxima corrida); lanza OSError/SyncError si la copia falla.
+    """
+    source = os.path.join(source_root, path)
+    target = os.path.join(dest_root, path)
+    partial = os.path.join(os.path.dirname(target), f'.{os.path.basename(target)}{PARTIAL_SUFFIX}')
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+
+    before = os.stat(source)
+    digest = hashlib.sha256()
+    try:
+        with open(source, 'rb') as src, open(partial, 'wb') as dst:
+            for data in iter(lambda: src.read(READ_SIZE), b''):
+                digest.update(data)
+                dst.write(data)
+            dst.flush()
+            os.fsync(dst.fileno())
+        after = os.stat(source)
+        if (after.st_size, after.st_mtime_ns) != (before.st_size, before.st_mtime_ns):
+            os.unlink(partial)
+            return None
+        sha256 = digest.hexdigest()
+        if file_sha256(partial) != sha256:
+            raise SyncError(f'{path}: el SHA-256 de la copia no coincide con el del origen')
+        os.chmod(partial, before.st_mode & 0o7777)
+        os.utime(partial, ns=(before.st_atime_ns, before.st_mtime_ns))
+        os.replace(partial, target)
+    except BaseException:
+        try:
+            os.unlink(partial)
+        except FileNotFoundError:
+            pass
+        raise
+    return {'size': before.st_size, 'mtime_ns': before.st_mtime_ns, 'sha256': sha256}
+
+
+def adopt_file(source_root, dest_root, path):
+    """Entrada de manifiesto para una copia previa idéntica; si difiere, se vuelve a copiar."""
+    sha256 = file_sha256(os.path.join(source_root, path))
+    if file_sha256(os.path.join(dest_root, path)) != sha256:
+        return copy_file(source_root, dest_root, path)
+    stat = os.stat(os.path.join(dest_root, path))
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256, 'adopted': True}
+
+
+def remove_empty_dirs(root, paths):
+    """Borra los directorios que quedaron vacíos tras borrar paths (sin tocar root)."""
+    dirs = {os.path.dirname(path) for path in paths if os.path.dirname(path)}
+    for directory in sorted(dirs, key=lambda d: d.count(os.sep), reverse=True):
+        current = directory
+        while current:
+            try:
+                os.rmdir(os.path.join(root, current))
+            except OSError:
+                break
+            current = os.path.dirname(current)
+
+
+def sync(source_root, dest_root, workers=SYNC_WORKERS, checksum=False, dry_run=False, excludes=SYNC_EXCLUDE):
+    """Sincroniza dest_root con source_root; devuelve estadísticas de la corrida."""
+    source_root, dest_root = os.path.abspath(source_root), os.path.abspath(dest_root)
+    if not os.path.isdir(source_root):
+        raise SyncError(f'el directorio de origen no existe: {source_root}')
+    if source_root == dest_root:
+        raise SyncError('origen y destino son la misma ruta')
+    if os.path.commonpath([source_root, dest_root]) in (source_root, dest_root):
+        raise SyncError('el destino no puede estar dentro del origen ni el origen dentro del destino')
+    os.makedirs(dest_root, exist_ok=True)
+
+    lock = open(os.path.join(dest_root, LOCK_NAME), 'w')
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock.close()
+        raise SyncBusy('otra sincronización sigue escribiendo en el destino')
+
+    try:
+        started = time.monotonic()
+        source_files = walk_tree(source_root, excludes)
+        dest_files = walk_tree(dest_root, excludes)
+        manifest = read_manifest(dest_root)
+        copy, adopt, delete = plan_sync(source_files, dest_files, manifest, source_root, checksum)
+        stats = {
+            'files': len(source_files), 'copied': 0, 'adopted': 0, 'changed_during_copy': 0, 'deleted': 0,
+            'bytes': 0, 'errors': [], 'to_copy': copy, 'to_adopt': adopt, 'to_delete': delete,
+            'deletions_skipped': False,
+        }
+        if dry_run:
+            stats['seconds'] = time.monotonic() - started
+            return stats
+
+        # El manifiesto solo conserva lo que sigue existiendo en el destino
+        files = {path: entry for path, entry in manifest.items() if path in dest_files}
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='sync') as pool:
+            futures = {pool.submit(copy_file, source_root, dest_root, path): path for path in copy}
+            futures.update({pool.submit(adopt_file, source_root, dest_root, path): path for path in adopt})
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    entry = future.result()
+                except (OSError, SyncError) as e:
+                    stats['errors'].append(f'{path}: {e}')
+                    print(f'ERROR copiando {path}: {e}', flush=True)
+                    continue
+                if entry is None:
+                    stats['changed_during_copy'] += 1
+                    print(f'{path} cambió durante la copia; se reintenta en la próxima corrida', flush=True)
+                    continue
+                if entry.pop('adopted', False):
+                    files[path] = entry
+                    stats['adopted'] += 1
+                    continue
+                files[path] = entry
+                stats['copied'] += 1
+                stats['bytes'] += entry['size']
+                print(f'Copiado: {path} ({entry["size"] / (1024 * 1024):.1f} MB)', flush=True)
+
+        if stats['errors'] or stats['changed_during_copy']:
+            stats['deletions_skipped'] = bool(delete)
+        else:
+            for path in delete:
+                try:
+                    os.unlink(os.path.join(dest_root, path))
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    stats['errors'].append(f'{path}: {e}')
+                    continue
+                files.pop(path, None)
+                stats['deleted'] += 1
+                print(f'Borrado: {path}', flush=True)
+            remove_empty_dirs(dest_root, delete)
+
+        write_manifest(dest_root, files)
+        stats['seconds'] = max(time.monotonic() - started, 0.001)
+        return stats
+    finally:
+        lock.close()
+
+
+def describe_sync(stats):
+    mb = stats['bytes'] / (1024 * 1024)
+    text = (f"{stats['files']} archivos en origen: {stats['copied']} copiados ({mb:.1f} MB, "
+            f"{mb / stats['seconds']:.1f} MB/s), {stats['adopted']} ya presentes verificados, "
+            f"{stats['deleted']} borrados, {len(stats['errors'])} errores "
+            f"en {stats['seconds']:.1f} s")
+    if stats['deletions_skipped']:
+        text += f"; {len(stats['to_delete'])} borrados pendientes hasta una copia sin errores"
+    return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Réplica de la carpeta de backups (copia por manifiestos)')
+    parser.add_argument('source', nargs='?', default=env.get('DIR_DESTINO_ORIGEN', ''),
+                        help='carpeta de origen (por defecto DIR_DESTINO_ORIGEN)')
+    parser.add_argument('dest', nargs='?', default=env.get('DIR_DESTINO_REMOTO', ''),
+                        help='carpeta de destino (por defecto DIR_DESTINO_REMOTO)')
+    parser.add_argument('--workers', type=int, default=SYNC_WORKERS, help='copias en paralelo')
+    parser.add_argument('--checksum', action='store_true',
+                        help='recalcular el SHA-256 del origen también para los archivos sin cambios')
+    parser.add_argument('--dry-run', action='store_true', help='mostrar qué se copiaría y borraría')
+    args = parser.parse_args(argv)
+    if not args.source or not args.dest:
+        parser.error('faltan origen y destino (argumentos o DIR_DESTINO_ORIGEN/DIR_DESTINO_REMOTO)')
+
+    try:
+        stats = sync(args.source, args.dest, workers=args.workers, checksum=args.checksum, dry_run=args.dry_run)
+    except SyncBusy as e:
+        print(f'Sincronización omitida: {e}')
+        return 0
+    except SyncError as e:
+        print(f'ERROR: {e}')
+        return 1
+    if args.dry_run:
+        for path in stats['to_copy']:
+            print(f'copiar: {path}')
+        for path in stats['to_adopt']:
+            print(f'verificar: {path}')
+        for path in stats['to_delete']:
+            print(f'borrar: {path}')
+        print(f"{len(stats['to_copy'])} a copiar, {len(stats['to_adopt'])} a verificar, "
+              f"{len(stats['to_delete'])} a borrar")
+        return 0
+    print(describe_sync(stats))
+    return 1 if stats['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Índice de tablas de los dumps .sql[.gz] (<backup>.tables.json)
+Mientras backup_runner.py escribe el dump se detectan los comentarios de
+sección de mysqldump ("Table structure for table", "Dumping data for table",
+vistas, eventos, rutinas) y en cada uno se corta el bloque gzip: cada sección
+empieza un miembro nuevo y el índice guarda su offset en el archivo. Para
+restaurar unas pocas tablas se descomprimen solo la cabecera y sus secciones.
+
+    python3 table_index.py list /mnt/backup/mysql/shop-back_2024-05-01_23-00.sql.gz
+    python3 table_index.py extract /mnt/backup/mysql/shop-back_2024-05-01_23-00.sql.gz --tables orders > orders.sql
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+from pathlib import Path
+
+from backup_codecs import codec_for_path
+
+INDEX_SUFFIX = '.tables.json'
+INDEX_VERSION = 1
+READ_SIZE = 4 * 1024 * 1024
+
+SECTION_KINDS = {
+    b'Current Database:': 'database',
+    b'Table structure for table': 'table',
+    b'Dumping data for table': 'data',
+    b'Temporary view structure for view': 'view_stub',
+    b'Final view structure for view': 'view',
+    b'Dumping events for database': 'events',
+    b'Dumping routines for database': 'routines',
+}
+# Se evalúa solo donde empieza una línea de comentario ('\n-- '), no en cada byte del dump
+SECTION_RE = re.compile(
+    rb'-- (' + b'|'.join(re.escape(marker) for marker in SECTION_KINDS) + rb') (`(?:[^`\n]|``)*`|\'[^\'\n]*\')'
+)
+# Secciones que se restauran al pedir una tabla o vista
+RESTORE_KINDS = ('table', 'data', 'view')
+# Un comentario de sección nunca es más largo: una línea parcial mayor se escribe sin esperar su final
+MAX_MARKER_LINE = 512
+
+
+class TableIndexError(Exception):
+    """El backup no tiene índice de tablas válido o no contiene lo pedido."""
+
+
+def _unquote(name):
+    name = name.decode('utf-8', errors='replace')
+    if name.startswith('`'):
+        return name[1:-1].replace('``', '`')
+    return name[1:-1]
+
+
+class SectionIndexer:
+    """Escritor intermedio: corta el bloque comprimido en cada sección y registra su offset.
+
+    writer debe tener mark() y, tras close(), mark_offsets (BlockGzipWriter, PlainWriter).
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.raw_offset = 0
+        self.sections = [{'kind': 'header', 'name': None, 'raw_offset': 0, 'mark': writer.mark()}]
+        self._pending = b''
+        self._line_start = True
+
+    def _emit(self, data):
+        self.writer.write(data)
+        self.raw_offset += len(data)
+
+    def _comment_starts(self, data):
+        if self._line_start and data.startswith(b'-- '):
+            yield 0
+        pos = data.find(b'\n-- ')
+        while pos >= 0:
+            yield pos + 1
+            pos = data.find(b'\n-- ', pos + 1)
+
+    def _scan(self, data):
+        """Escribe data (líneas completas salvo quizá la última) cortando en cada sección."""
+        start = 0
+        for pos in self._comment_starts(data):
+            match = SECTION_RE.match(data, pos)
+            if match is None:
+                continue
+            self._emit(data[start:pos])
+            start = pos
+            self.sections.append({
+                'kind': SECTION_KINDS[match.group(1)],
+                'name': _unquote(match.group(2)),
+                'raw_offset': self.raw_offset,
+                'mark': self.writer.mark(),
+            })
+        self._emit(data[start:])
+
+    def write(self, data):
+        # La última línea incompleta espera al bloque siguiente (salvo que ya sea larga)
+        if self._pending:
+            data = self._pending + data
+        cut = data.rfind(b'\n') + 1
+        if len(data) - cut > MAX_MARKER_LINE:
+            cut = len(data)
+        if cut:
+            self._scan(data[:cut])
+            self._line_start = data[cut - 1] == 0x0a
+        self._pending = data[cut:]
+
+    def close(self):
+        if self._pending:
+            self._scan(self._pending)
+            self._pending = b''
+        self.writer.close()
+
+    def index(self, codec, file_size):
+        """Índice final (llamar después de close())."""
+        sections = []
+        for i, section in enumerate(self.sections):
+            last = i == len(self.sections) - 1
+            sections.append({
+                'kind': section['kind'],
+                'name': section['name'],
+                'offset': self.writer.mark_offsets[section['mark']],
+                'end': file_size if last else self.writer.mark_offsets[self.sections[i + 1]['mark']],
+                'raw_offset': section['raw_offset'],
+                'raw_end': self.raw_offset if last else self.sections[i + 1]['raw_offset'],
+            })
+        database = next((s['name'] for s in sections if s['kind'] == 'database'), None)
+        return {
+            'version': INDEX_VERSION,
+            'codec': codec.name,
+            'database': database,
+            'file_size': file_size,
+            'sections': sections,
+        }
+
+
+def supports_index(writer):
+    return hasattr(writer, 'mark')
+
+
+def index_path(path):
+    path = Path(path)
+    return path.with_name(path.name + INDEX_SUFFIX)
+
+
+def write_index(path, index):
+    """Guarda <path>.tables.json de forma atómica (tmp + rename)."""
+    target = index_path(path)
+    tmp = target.with_name(f'.{target.name}.{os.getpid()}.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp, target)
+
+
+def has_index(path):
+    return index_path(path).exists()
+
+
+def read_index(path):
+    """Índice de tablas del backup; TableIndexError si falta o no corresponde al archivo."""
+    try:
+        with open(index_path(path)) as f:
+            index = json.load(f)
+        size = Path(path).stat().st_size
+    except (OSError, ValueError) as e:
+        raise TableIndexError(f'{Path(path).name} no tiene índice de tablas ({e})')
+    if not isinstance(index, dict) or index.get('version') != INDEX_VERSION:
+        raise TableIndexError(f'índice de tablas de {Path(path).name} con formato desconocido')
+    if index.get('file_size') != size:
+        raise TableIndexError(f'el índice de tablas no corresponde al tamaño actual de {Path(path).name}')
+    return index
+
+
+def index_tables(index):
+    """Tablas y vistas del índice, en el orden del dump, con bytes sin comprimir de cada una."""
+    tables = {}
+    for section in index['sections']:
+        if section['kind'] in RESTORE_KINDS:
+            entry = tables.setdefault(section['name'], {'name': section['name'], 'view': False, 'raw_bytes': 0})
+            entry['raw_bytes'] += section['raw_end'] - section['raw_offset']
+            entry['view'] = entry['view'] or section['kind'] == 'view'
+    return list(tables.values())
+
+
+def select_sections(index, tables):
+    """Cabecera + secciones de las tablas pedidas; TableIndexError si alguna no está en el backup."""
+    wanted = set(tables)
+    missing = wanted - {t['name'] for t in index_tables(index)}
+    if missing:
+        raise TableIndexError(f'tablas que no están en el backup: {", ".join(sorted(missing))}')
+    return [s for s in index['sections']
+            if s['kind'] == 'header' or (s['kind'] in RESTORE_KINDS and s['name'] in wanted)]
+
+
+def read_section(path, section, codec=None):
+    """SQL descomprimido de una sección (lee solo sus bytes del archivo)."""
+    codec = codec or codec_for_path(path)
+
+    def raw_chunks():
+        with open(path, 'rb') as f:
+            f.seek(section['offset'])
+            remaining = section['end'] - section['offset']
+            while remaining > 0:
+                raw = f.read(min(READ_SIZE, remaining))
+                if not raw:
+                    raise TableIndexError(f'{Path(path).name} es más corto que su índice de tablas')
+                remaining -= len(raw)
+                yield raw
+
+    return codec.decompress(raw_chunks())
+
+
+def quote_identifier(name):
+    return '`' + name.replace('`', '``') + '`'
+
+
+def table_chunks(path, index, tables, target_db=None):
+    """SQL para restaurar solo esas tablas en target_db (por defecto, la base del backup).
+
+    No incluye la sección de la base (DROP/CREATE DATABASE del dump): se usa
+    CREATE DATABASE IF NOT EXISTS + USE, y el resto de la base queda intacto.
+    """
+    sections = select_sections(index, tables)
+    target_db = target_db or index.get('database')
+    if not target_db:
+        raise TableIndexError('el backup no indica su base: especifique la base destino')
+    codec = codec_for_path(path)
+    for section in sections:
+        yield from read_section(path, section, codec)
+        if section['kind'] == 'header':
+            yield (f'CREATE DATABASE IF NOT EXISTS {quote_identifier(target_db)};\n'
+                   f'USE {quote_identifier(target_db)};\n').encode()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Índice de tablas de backups MySQL')
+    sub = parser.add_subparsers(dest='command', required=True)
+    list_cmd = sub.add_parser('list', help='tablas del backup con su tamaño sin comprimir')
+    list_cmd.add_argument('backup')
+    extract = sub.add_parser('extract', help='SQL de algunas tablas por stdout')
+    extract.add_argument('backup')
+    extract.add_argument('--tables', required=True, help='lista separada por comas')
+    extract.add_argument('--database', default=None, help='base destino (por defecto la del backup)')
+    args = parser.parse_args(argv)
+
+    try:
+        index = read_index(args.backup)
+        if args.command == 'list':
+            print(f"Base: {index.get('database')}")
+            for table in index_tables(index):
+                print(f"{table['name']:<40} {table['raw_bytes'] / (1024 * 1024):>10.2f} MB"
+                      f"{'  (vista)' if table['view'] else ''}")
+            return 0
+        tables = [t.strip() for t in args.tables.split(',') if t.strip()]
+        for data in table_chunks(args.backup, index, tables, args.database):
+            sys.stdout.buffer.write(data)
+    except TableIndexError as e:
+        print(f'Error: {e}', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())